@@ -1,12 +1,17 @@
 import paho.mqtt.client as mqtt
 import json
+import math
 import threading
 import time
-import ssl
 import requests
 import os
 import datetime
+import queue
+import concurrent.futures
+import signal
+import sys
 from flask import Flask, render_template, jsonify, Response, stream_with_context, request, redirect, url_for, flash
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, BooleanField, SubmitField
@@ -15,6 +20,27 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from pywebpush import webpush, WebPushException
 import certifi
 
+from status_store import StatusStore, compile_fields, is_full_report
+from bambu_connection import BambuConnection
+from command_tracker import CommandTracker, CommandTimeout, is_success, next_sequence_id
+from command_queue import CommandQueue, CommandExpired, CommandQueueFull, PRIORITY_HIGH, DEFAULT_TTL as DEFAULT_COMMAND_TTL
+import printer_events
+from printer_events import event_bus, detect_events
+from background_tasks import push_executor, db_executor
+import async_engine
+import json_codec
+from sensor_cache import sensor_cache
+from sensor_writer import sensor_writer
+import static_assets
+
+# WebSocket é opcional: sem flask-sock, a interface usa SSE e POST /command
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+    SOCK_AVAILABLE = True
+except ImportError:
+    SOCK_AVAILABLE = False
+
 # --- Carregar Configuração ---
 CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 config = {}
@@ -63,31 +89,58 @@ VAPID_ENABLED = config.get('VAPID_ENABLED', False)
 # -----------------------------------
 
 MQTT_PORT = 8883
-# Comentando autenticação MQTT - Desabilitado para uso sem autenticação
-MQTT_USER = None  # Antes: "bblp"
-MQTT_PASS = None  # Antes: ACCESS_CODE
+# Autenticação MQTT: usuário "bblp" e ACCESS_CODE (ver bambu_connection.py)
 MQTT_CLIENT_ID = f"web_monitor_{int(time.time())}" # ID único do cliente
 
 # Tópicos MQTT
 TOPIC_REQUEST = f"device/{DEVICE_ID}/request"
 TOPIC_REPORT = f"device/{DEVICE_ID}/report"
 
-# Variável global para armazenar o último estado da impressora
-printer_status = {}
-status_lock = threading.Lock() # Para acesso seguro à variável entre threads
+# Último estado da impressora, versionado e serializado uma vez por mudança
+status_store = StatusStore()
+
+# Intervalo máximo sem eventos no stream SSE antes de enviar um keepalive
+SSE_KEEPALIVE_SECONDS = 15
 
-# Variável global para o sequence_id dos comandos (gerenciado pelo backend)
-command_sequence_id = int(time.time()) # Inicializa com timestamp
-sequence_lock = threading.Lock()
+# Tempo máximo (segundos) que /status/wait segura a requisição sem mudanças
+STATUS_WAIT_TIMEOUT = config.get('STATUS_WAIT_TIMEOUT', 30)
+# Janela (ms) para mesclar rajadas de push_status da impressora (0 desativa)
+REPORT_COALESCE_MS = config.get('REPORT_COALESCE_MS', 500)
+# Motor de ingestão: "threads" (uma thread por conexão) ou "asyncio" (um único event loop)
+INGEST_ENGINE = config.get('INGEST_ENGINE', 'threads')
+
+# Comandos aguardando o eco do sequence_id em TOPIC_REPORT (latência e timeouts no /metrics)
+COMMAND_ACK_TIMEOUT = 30 # segundos
+command_tracker = CommandTracker(timeout=COMMAND_ACK_TIMEOUT)
 
 # Adicionar estas duas linhas
 MAINTENANCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'maintenance_data.json')
 maintenance_lock = threading.Lock()
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Provider JSON do Flask (jsonify, request.get_json) usando json_codec"""
+
+    def dumps(self, obj, **kwargs):
+        # Saída formatada (indent, usada em modo debug) fica com o json padrão
+        if 'indent' in kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = SECRET_KEY
 app.mqtt_client = None # Atributo para armazenar o cliente MQTT
 
+# Gera os arquivos estáticos com hash/pré-comprimidos e passa a servi-los com cache imutável
+static_assets.init_app(app)
+
+sock = Sock(app) if SOCK_AVAILABLE else None
+if not SOCK_AVAILABLE:
+    print("Aviso: flask-sock não instalado. Canal WebSocket (/ws) desativado.", flush=True)
+
 # --- Configuração Flask-Login ---
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -164,97 +217,499 @@ def index():
                            vapid_public_key=VAPID_PUBLIC_KEY if VAPID_ENABLED else None, 
                            live_share_token=LIVE_SHARE_TOKEN)
 
-@app.route('/status')
-# @login_required # REMOVIDO - Acesso permitido para a página /live
-def get_status():
-    """Retorna o último status conhecido da impressora em formato JSON."""
-    from db_manager import SensorManager
-    
-    with status_lock:
-        current_status = printer_status.copy()
-    
+def _tray_slot(tray):
+    """Slot (base 0) de uma bandeja do AMS, ou None se ela não tiver um id numérico"""
+    try:
+        # Converte id para inteiro para garantir compatibilidade
+        return int(tray['id'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def _enrich_tray(tray, esp32_data):
+    """
+    Retorna uma cópia da bandeja com os dados do sensor ESP32 correspondente,
+    ou a própria bandeja se não houver dados para ela
+    """
+    tray_id = _tray_slot(tray)
+    if tray_id not in esp32_data:
+        return tray
+
+    tray = dict(tray)
+    tray['dht_temp'] = esp32_data[tray_id]['temperature']
+    tray['dht_humidity'] = esp32_data[tray_id]['humidity']
+
+    # Garante que remaining_g seja prioritário e substitua remain
+    if esp32_data[tray_id]['remaining_g'] is not None:
+        tray['remaining_g'] = esp32_data[tray_id]['remaining_g']
+        # Sobrescreve 'remain' para garantir que o frontend use remaining_g
+        if 'remain' in tray:
+            # Se o remain existe, converte o remaining_g para porcentagem para manter consistência
+            filament_max = 1000.0  # Valor padrão em gramas para um carretel completo
+            remain_percent = min(100, max(0, (esp32_data[tray_id]['remaining_g'] / filament_max) * 100))
+            tray['remain'] = remain_percent
+    return tray
+
+def enrich_status_with_sensors(current_status):
+    """
+    Adiciona os dados dos sensores ESP32 às bandejas do AMS.
+    Chamado pelo status_store uma vez por versão. O status recebido é compartilhado
+    e imutável: apenas as bandejas enriquecidas (e os containers até elas) são copiados.
+    """
     # Adiciona os dados dos sensores ESP32 às bandejas do AMS
     try:
-        # Busca os dados mais recentes dos sensores para cada caixa do ESP32
+        # Leituras mais recentes de cada caixa, mantidas em memória pelo MQTTClient
         esp32_data = {}
-        for box_num in range(1, 5):  # Caixas de 1 a 4
-            source = f"ESP32_Box{box_num}"
-            
-            # Obter entradas separadas para temperatura, umidade e peso restante
-            # e usar a mais recente de cada uma
-            temp_data = SensorManager.get_recent_sensor_data(source=source, limit=5)
-            latest_temp = None
-            latest_humidity = None
-            latest_remaining = None
-            
-            # Processar os dados encontrando os valores mais recentes
-            for data in temp_data:
-                if data.temperature is not None and latest_temp is None:
-                    latest_temp = data.temperature
-                if data.humidity is not None and latest_humidity is None:
-                    latest_humidity = data.humidity
-                if data.ams_filament_remaining is not None and latest_remaining is None:
-                    latest_remaining = data.ams_filament_remaining
-                
-                # Se encontrou todos os valores, podemos parar
-                if latest_temp is not None and latest_humidity is not None and latest_remaining is not None:
-                    break
-            
-            # Dados válidos apenas se todos os valores necessários existirem
-            if latest_temp is not None or latest_humidity is not None or latest_remaining is not None:
-                esp32_data[box_num-1] = {
-                    'temperature': latest_temp,
-                    'humidity': latest_humidity,
-                    'remaining_g': latest_remaining
-                }
-        
-        # Adiciona esses dados aos objetos de bandeja do AMS
-        if 'print' in current_status:
-            # Para AMS Lite (A1 Mini)
-            if 'stg' in current_status['print'] and current_status['print']['stg']:
-                for tray in current_status['print']['stg']:
-                    if 'id' in tray:
-                        # Converte id para inteiro para garantir compatibilidade
-                        tray_id = int(tray['id']) if not isinstance(tray['id'], int) else tray['id']
-                        if tray_id in esp32_data:
-                            tray['dht_temp'] = esp32_data[tray_id]['temperature']
-                            tray['dht_humidity'] = esp32_data[tray_id]['humidity']
-                            
-                            # Garante que remaining_g seja prioritário e substitua remain
-                            if esp32_data[tray_id]['remaining_g'] is not None:
-                                tray['remaining_g'] = esp32_data[tray_id]['remaining_g']
-                                # Sobrescreve 'remain' para garantir que o frontend use remaining_g
-                                if 'remain' in tray:
-                                    # Se o remain existe, converte o remaining_g para porcentagem para manter consistência
-                                    filament_max = 1000.0  # Valor padrão em gramas para um carretel completo
-                                    remain_percent = min(100, max(0, (esp32_data[tray_id]['remaining_g'] / filament_max) * 100))
-                                    tray['remain'] = remain_percent
-            
-            # Para AMS padrão (X1/P1)
-            if 'ams' in current_status['print'] and current_status['print']['ams'] and 'ams' in current_status['print']['ams']:
-                for unit in current_status['print']['ams']['ams']:
-                    if 'tray' in unit:
-                        for tray in unit['tray']:
-                            if 'id' in tray:
-                                # Converte id para inteiro para garantir compatibilidade
-                                tray_id = int(tray['id']) if not isinstance(tray['id'], int) else tray['id']
-                                if tray_id in esp32_data:
-                                    tray['dht_temp'] = esp32_data[tray_id]['temperature']
-                                    tray['dht_humidity'] = esp32_data[tray_id]['humidity']
-                                    
-                                    # Garante que remaining_g seja prioritário e substitua remain
-                                    if esp32_data[tray_id]['remaining_g'] is not None:
-                                        tray['remaining_g'] = esp32_data[tray_id]['remaining_g']
-                                        # Sobrescreve 'remain' para garantir que o frontend use remaining_g
-                                        if 'remain' in tray:
-                                            # Se o remain existe, converte o remaining_g para porcentagem para manter consistência
-                                            filament_max = 1000.0  # Valor padrão em gramas para um carretel completo
-                                            remain_percent = min(100, max(0, (esp32_data[tray_id]['remaining_g'] / filament_max) * 100))
-                                            tray['remain'] = remain_percent
+        for box_num, readings in sensor_cache.get_all().items():
+            esp32_data[box_num-1] = {
+                'temperature': readings.get('temperature'),
+                'humidity': readings.get('humidity'),
+                'remaining_g': readings.get('remaining_g')
+            }
+
+        if not esp32_data or 'print' not in current_status:
+            return current_status
+
+        print_status = dict(current_status['print'])
+
+        # Para AMS Lite (A1 Mini)
+        if 'stg' in print_status and print_status['stg']:
+            print_status['stg'] = [_enrich_tray(tray, esp32_data) for tray in print_status['stg']]
+
+        # Para AMS padrão (X1/P1)
+        if 'ams' in print_status and print_status['ams'] and 'ams' in print_status['ams']:
+            units = []
+            for unit in print_status['ams']['ams']:
+                if 'tray' in unit:
+                    unit = dict(unit)
+                    unit['tray'] = [_enrich_tray(tray, esp32_data) for tray in unit['tray']]
+                units.append(unit)
+            print_status['ams'] = dict(print_status['ams'])
+            print_status['ams']['ams'] = units
+
+        enriched = dict(current_status)
+        enriched['print'] = print_status
+        return enriched
     except Exception as e:
         print(f"Erro ao adicionar dados do ESP32 ao status: {e}", flush=True)
+
+    return current_status
+
+status_store.set_enricher(enrich_status_with_sensors)
+
+# Espera (s) para agrupar as leituras de um ciclo do ESP32 em uma única versão do status
+SENSOR_REFRESH_DELAY = 1.0
+_sensor_refresh_lock = threading.Lock()
+_sensor_refresh_boxes = set()
+_sensor_refresh_timer = None
+
+def sensor_enriched_paths(status, boxes):
+    """
+    Caminhos das bandejas do status que recebem os dados das caixas informadas
+
+    Args:
+        status (dict): Status recebido da impressora
+        boxes (set): Números das caixas ESP32 (base 1) que mudaram
+
+    Returns:
+        list: Caminhos (tuplas de chaves/índices) existentes no status
+    """
+    slots = {box - 1 for box in boxes}
+    print_status = status.get('print')
+    if not isinstance(print_status, dict):
+        return []
+
+    paths = []
+    # AMS Lite (A1 Mini)
+    stg = print_status.get('stg')
+    if isinstance(stg, list):
+        paths += [('print', 'stg', index) for index, tray in enumerate(stg)
+                  if isinstance(tray, dict) and _tray_slot(tray) in slots]
+    # AMS padrão (X1/P1)
+    ams = print_status.get('ams')
+    units = ams.get('ams') if isinstance(ams, dict) else None
+    if isinstance(units, list):
+        for unit_index, unit in enumerate(units):
+            trays = unit.get('tray') if isinstance(unit, dict) else None
+            if isinstance(trays, list):
+                paths += [('print', 'ams', 'ams', unit_index, 'tray', index) for index, tray in enumerate(trays)
+                          if isinstance(tray, dict) and _tray_slot(tray) in slots]
+    return paths
+
+def schedule_sensor_refresh(source):
+    """
+    Chamado pelo MQTTClient a cada leitura do ESP32 que mudou. Um ciclo do
+    ESP32 publica várias medidas por caixa: as mudanças são agrupadas por
+    SENSOR_REFRESH_DELAY e geram uma única versão do status, só com as
+    bandejas afetadas.
+
+    Args:
+        source (str): Fonte das leituras ("ESP32_Box<N>")
+    """
+    global _sensor_refresh_timer
+    try:
+        box = int(source.rsplit('Box', 1)[1])
+    except (IndexError, ValueError):
+        print(f"Fonte de leituras desconhecida: {source}", flush=True)
+        return
+
+    with _sensor_refresh_lock:
+        _sensor_refresh_boxes.add(box)
+        if _sensor_refresh_timer is not None:
+            return
+        _sensor_refresh_timer = threading.Timer(SENSOR_REFRESH_DELAY, _refresh_sensor_status)
+        _sensor_refresh_timer.daemon = True
+        _sensor_refresh_timer.start()
+
+def _refresh_sensor_status():
+    """Gera a nova versão do status com as caixas acumuladas desde o agendamento"""
+    global _sensor_refresh_timer
+    with _sensor_refresh_lock:
+        boxes = set(_sensor_refresh_boxes)
+        _sensor_refresh_boxes.clear()
+        _sensor_refresh_timer = None
+
+    paths = sensor_enriched_paths(status_store.snapshot().status, boxes)
+    # Caixa sem bandeja correspondente no status: nada visível mudou
+    if paths:
+        status_store.invalidate(paths)
+
+@app.route('/status')
+# @login_required # REMOVIDO - Acesso permitido para a página /live
+def get_status():
+    """
+    Retorna o último status conhecido da impressora em formato JSON.
     
-    return jsonify(current_status)
+    Com ?since=<versão>, retorna apenas as diferenças desde aquela versão
+    ({"version", "since", "patch"}) ou, se o histórico não cobrir a versão,
+    o status completo no formato {"version", "status"}.
+
+    Com ?fields=<caminhos>, retorna apenas os campos escolhidos, em caminhos
+    separados por vírgula (ex: print.mc_percent,print.ams.ams.*.tray.*.remain).
+    Neste caso ?since é ignorado.
+    """
+    fields = request.args.get('fields')
+    if fields:
+        try:
+            selector = compile_fields(fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        snapshot, body = status_store.project(selector)
+        response = Response(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Status-Version'] = str(snapshot.version)
+        response.set_etag(snapshot.etag)
+        return response.make_conditional(request)
+
+    since = request.args.get('since', type=int)
+    if since is not None:
+        delta = status_store.delta(since)
+        if delta is not None:
+            body = delta[1]
+        else:
+            snapshot = status_store.snapshot()
+            body = b'{"version": %d, "status": %s}' % (snapshot.version, snapshot.body)
+        response = Response(body, mimetype='application/json')
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    snapshot = status_store.snapshot()
+    response = Response(snapshot.body, mimetype='application/json')
+    # Força o navegador a revalidar; entre relatórios da impressora a resposta é um 304 vazio
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Status-Version'] = str(snapshot.version)
+    response.set_etag(snapshot.etag)
+    return response.make_conditional(request)
+
+@app.route('/status/wait')
+# Sem @login_required, assim como /status
+def status_wait():
+    """
+    Long-poll para clientes que não conseguem manter um EventSource aberto.
+
+    Bloqueia até que a versão do status seja diferente de ?version=N ou até
+    ?timeout=<segundos> (limitado a STATUS_WAIT_TIMEOUT). Responde com o status
+    atual (ou a projeção de ?fields=) e o cabeçalho X-Status-Version, que deve
+    ser enviado como ?version na próxima chamada. Sem mudanças, responde 304.
+    """
+    # Parâmetros inválidos respondem 400, como um ?fields= inválido, em vez de serem ignorados
+    version = request.args.get('version')
+    if version is not None:
+        try:
+            version = int(version)
+        except ValueError:
+            return jsonify({"error": f"version inválido: '{version}' (esperado um inteiro)"}), 400
+        if version < 0:
+            return jsonify({"error": "version não pode ser negativo"}), 400
+
+    timeout = request.args.get('timeout')
+    if timeout is None:
+        timeout = STATUS_WAIT_TIMEOUT
+    else:
+        try:
+            timeout = float(timeout)
+        except ValueError:
+            return jsonify({"error": f"timeout inválido: '{timeout}' (esperado um número de segundos)"}), 400
+        if not math.isfinite(timeout) or timeout < 0:
+            return jsonify({"error": "timeout deve ser um número de segundos maior ou igual a zero"}), 400
+    timeout = min(timeout, STATUS_WAIT_TIMEOUT)
+
+    selector = None
+    fields = request.args.get('fields')
+    if fields:
+        try:
+            selector = compile_fields(fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    if version is not None:
+        # Espera em uma variável de condição sinalizada a cada nova versão (sem consumir CPU)
+        current = status_store.wait_for_change(version, timeout=timeout)
+        if current == version:
+            response = Response(status=304)
+            response.headers['Cache-Control'] = 'no-store'
+            response.headers['X-Status-Version'] = str(current)
+            return response
+
+    if selector is not None:
+        snapshot, body = status_store.project(selector)
+    else:
+        snapshot = status_store.snapshot()
+        body = snapshot.body
+    response = Response(body, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Status-Version'] = str(snapshot.version)
+    return response
+
+@app.route('/status/stream')
+# Sem @login_required, assim como /status, para permitir a página /live
+def status_stream():
+    """
+    Envia o status via Server-Sent Events sempre que o estado da impressora muda.
+    
+    Com ?patch=1, apenas o primeiro evento ('status') traz o status completo;
+    os seguintes ('patch') trazem só as diferenças, como em /status?since=N.
+
+    Com ?fields=<caminhos>, cada evento 'status' traz apenas os campos
+    escolhidos (como em /status?fields=) e só é enviado quando eles mudam.
+    """
+    use_patches = request.args.get('patch') == '1'
+    selector = None
+    fields = request.args.get('fields')
+    if fields:
+        try:
+            selector = compile_fields(fields)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    def generate():
+        last_version = None
+        last_body = None
+        while True:
+            version = status_store.wait_for_change(last_version, timeout=SSE_KEEPALIVE_SECONDS)
+            if version == last_version:
+                # Nada mudou: apenas mantém a conexão viva atrás de proxies (Tailscale Funnel)
+                yield ": keepalive\n\n"
+                continue
+
+            if selector is not None:
+                snapshot, body = status_store.project(selector)
+                last_version = snapshot.version
+                # Mudanças fora dos campos escolhidos não geram evento
+                if body != last_body:
+                    last_body = body
+                    yield f"id: {snapshot.version}\nevent: status\ndata: {body.decode('utf-8')}\n\n"
+                continue
+
+            delta = status_store.delta(last_version) if use_patches and last_version is not None else None
+            if delta is not None:
+                last_version, body = delta
+                yield f"id: {last_version}\nevent: patch\ndata: {body.decode('utf-8')}\n\n"
+                continue
+
+            snapshot = status_store.snapshot()
+            last_version = snapshot.version
+            yield f"id: {snapshot.version}\nevent: status\ndata: {snapshot.body.decode('utf-8')}\n\n"
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Montagem e Envio de Comandos MQTT ---
+def build_command_payload(data, sequence_id):
+    """
+    Monta o payload MQTT de um comando recebido da interface.
+
+    Args:
+        data (dict): Comando recebido ({"command": ..., e parâmetros})
+        sequence_id (str): sequence_id que a impressora ecoará na resposta
+
+    Returns:
+        dict: Payload a ser publicado em TOPIC_REQUEST
+
+    Raises:
+        ValueError: Se o comando for desconhecido ou tiver parâmetros inválidos
+    """
+    command = data.get('command')
+
+    # Construir payload com base no comando
+    if command == 'gcode':
+        gcode_line = data.get('line')
+        if not gcode_line:
+             raise ValueError("Linha G-code ausente.")
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "gcode_line",
+                "param": gcode_line
+            }
+        }
+    elif command == 'pause':
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "pause"
+            }
+        }
+    elif command == 'resume':
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "resume"
+            }
+        }
+    elif command == 'stop':
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "stop"
+            }
+        }
+    elif command == 'print_speed':
+        value = data.get('value')
+        if value not in ['1', '2', '3', '4']:
+            raise ValueError("Valor de velocidade inválido. Use '1', '2', '3' ou '4'.")
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "print_speed",
+                "param": value
+            }
+        }
+    elif command == 'set_chamber_light':
+        mode = data.get('mode') # Espera 'on' ou 'off'
+        if mode not in ['on', 'off']:
+             raise ValueError("Modo inválido para luz da câmara ('on' ou 'off').")
+        return {
+            "system": {
+                "sequence_id": sequence_id,
+                "command": "ledctrl",
+                "led_node": "chamber_light",
+                "led_mode": mode,
+                "led_on_time": 500, # Valores padrão, não usados para on/off
+                "led_off_time": 500,
+                "loop_times": 1,
+                "interval_time": 1000
+            }
+        }
+    elif command == 'set_work_light':
+        mode = data.get('mode') # Espera 'on', 'off', ou 'flashing'
+        if mode not in ['on', 'off', 'flashing']:
+             raise ValueError("Modo inválido para luz de trabalho ('on', 'off', 'flashing').")
+        return {
+            "system": {
+                "sequence_id": sequence_id,
+                "command": "ledctrl",
+                "led_node": "work_light",
+                "led_mode": mode,
+                # Valores padrão, podem ser ajustados se 'flashing' for usado com parâmetros específicos
+                "led_on_time": 500,
+                "led_off_time": 500,
+                "loop_times": 3 if mode == 'flashing' else 1, # Pisca 3 vezes como exemplo
+                "interval_time": 1000
+            }
+        }
+    elif command == 'set_part_fan':
+        value = data.get('value') # Espera 0-100 da UI
+
+        # Valida se o input é um número entre 0 e 100
+        if value is None or not isinstance(value, (int, float)) or not (0 <= value <= 100):
+            raise ValueError("Velocidade da ventoinha inválida (0-100%).")
+
+        # Converte o valor percentual (0-100) para G-code (0-255)
+        gcode_value = int(round(value * 2.55))
+
+        return {
+            "print": {
+                "sequence_id": sequence_id,
+                "command": "gcode_line",
+                "param": f"M106 P1 S{gcode_value}" # Fan de peça é P1
+            }
+        }
+    else:
+        raise ValueError(f"Comando desconhecido: {command}")
+
+# Política de fila por comando: pausar/parar passam na frente e não são enviados muito
+# depois; ajustes contínuos (sliders) mantêm só o último valor, no máximo um publish por janela.
+# G-code livre (movimentos, aquecimento) nunca sai muito depois do pedido: TTL curto
+COMMAND_POLICIES = {
+    'stop': {'priority': PRIORITY_HIGH, 'ttl': 10},
+    'pause': {'priority': PRIORITY_HIGH, 'ttl': 10},
+    'resume': {'priority': PRIORITY_HIGH, 'ttl': 10},
+    'gcode': {'ttl': 5},
+    'print_speed': {'dedup_key': 'print_speed', 'debounce': 0.3},
+    'set_part_fan': {'dedup_key': 'set_part_fan', 'debounce': 0.3},
+    'set_chamber_light': {'dedup_key': 'set_chamber_light', 'ttl': 10},
+    'set_work_light': {'dedup_key': 'set_work_light', 'ttl': 10},
+}
+
+def command_queue_wait_limit(command):
+    """Tempo máximo até a resposta de um comando: TTL na fila mais o prazo da confirmação"""
+    return COMMAND_POLICIES.get(command, {}).get('ttl', DEFAULT_COMMAND_TTL) + COMMAND_ACK_TIMEOUT + 1
+
+def enqueue_command(command, sequence_id, payload):
+    """
+    Coloca um comando na fila de saída (publicado assim que a impressora estiver conectada)
+
+    Returns:
+        tuple: (sequence_id que será publicado, Future resolvido com a resposta da impressora
+            ou CommandExpired/CommandTimeout). O sequence_id difere do informado quando o
+            comando substitui outro pendente com a mesma dedup_key.
+
+    Raises:
+        CommandQueueFull: Se a fila estiver cheia
+    """
+    queued_id, ack = command_queue.submit(command, sequence_id, payload, **COMMAND_POLICIES.get(command, {}))
+    print(f"Enfileirando comando '{command}' (seq: {queued_id}) para {TOPIC_REQUEST}: {json.dumps(payload)}", flush=True)
+    return queued_id, ack
+
+# --- Métricas de Ingestão e Tarefas em Segundo Plano ---
+def connection_stats():
+    """Uptime, reconexões e tempo até reconectar das conexões MQTT"""
+    stats = {"bambu": bambu_connection.supervisor.stats()}
+    esp32_client = app.mqtt_integration.client if app.mqtt_integration else None
+    if esp32_client:
+        stats["esp32"] = esp32_client.supervisor.stats()
+    return stats
+
+@app.route('/metrics')
+# Sem @login_required: apenas contadores, para scripts de monitoramento
+def metrics():
+    """Profundidade/descartes da fila de relatórios MQTT e estado dos executores."""
+    return jsonify({
+        "ingest": bambu_connection.stats(),
+        "executors": {
+            "push": push_executor.stats(),
+            "db": db_executor.stats()
+        },
+        "sensor_writer": sensor_writer.stats(),
+        "commands": command_tracker.stats(),
+        "command_queue": command_queue.stats(),
+        "connections": connection_stats(),
+        "engine": async_engine.get_engine().stats() if async_engine.get_engine() else {"mode": "threads"},
+        "status_version": status_store.version,
+        "events": event_bus.stats(),
+        "stats_polling": app.mqtt_integration.polling_stats() if app.mqtt_integration else None
+    })
 
 # --- Rota para Enviar Comandos MQTT ---
 @app.route('/command', methods=['POST'])
@@ -270,10 +725,6 @@ def handle_command():
     print(f"Dados JSON Parseados (ou None): {data}", flush=True)
     # -------------------------------------
 
-    if not app.mqtt_client:
-        print("Erro: Cliente MQTT não conectado.", flush=True) # Log adicionado
-        return jsonify({"success": False, "error": "Cliente MQTT não conectado."}), 503
-
     try:
         if not data or 'command' not in data:
             print(f"Erro: Payload JSON inválido ou comando ausente. Dados recebidos: {data}", flush=True) # Log adicionado
@@ -281,131 +732,193 @@ def handle_command():
 
         command = data.get('command')
         sequence_id = get_next_sequence_id()  # Usar a função que gera sequence_id incremental
-        payload_to_send = None
-
-        # Construir payload com base no comando
-        if command == 'gcode':
-            gcode_line = data.get('line')
-            if not gcode_line:
-                 print(f"Erro: Linha G-code ausente.", flush=True)
-                 return jsonify({"success": False, "error": "Linha G-code ausente."}), 400
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "gcode_line",
-                    "param": gcode_line
-                }
-            }
-        elif command == 'pause':
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "pause"
-                }
-            }
-        elif command == 'resume':
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "resume"
-                }
-            }
-        elif command == 'stop':
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "stop"
-                }
-            }
-        elif command == 'print_speed':
-            value = data.get('value')
-            if value not in ['1', '2', '3', '4']:
-                return jsonify({"success": False, "error": "Valor de velocidade inválido. Use '1', '2', '3' ou '4'."}), 400
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "print_speed",
-                    "param": value
-                }
-            }
-        elif command == 'set_chamber_light':
-            mode = data.get('mode') # Espera 'on' ou 'off'
-            if mode not in ['on', 'off']:
-                 return jsonify({"success": False, "error": "Modo inválido para luz da câmara ('on' ou 'off')."}), 400
-            payload_to_send = {
-                "system": {
-                    "sequence_id": sequence_id,
-                    "command": "ledctrl",
-                    "led_node": "chamber_light",
-                    "led_mode": mode,
-                    "led_on_time": 500, # Valores padrão, não usados para on/off
-                    "led_off_time": 500,
-                    "loop_times": 1,
-                    "interval_time": 1000
-                }
-            }
-        elif command == 'set_work_light':
-            mode = data.get('mode') # Espera 'on', 'off', ou 'flashing'
-            if mode not in ['on', 'off', 'flashing']:
-                 return jsonify({"success": False, "error": "Modo inválido para luz de trabalho ('on', 'off', 'flashing')."}), 400
-            payload_to_send = {
-                "system": {
-                    "sequence_id": sequence_id,
-                    "command": "ledctrl",
-                    "led_node": "work_light",
-                    "led_mode": mode,
-                    # Valores padrão, podem ser ajustados se 'flashing' for usado com parâmetros específicos
-                    "led_on_time": 500,
-                    "led_off_time": 500,
-                    "loop_times": 3 if mode == 'flashing' else 1, # Pisca 3 vezes como exemplo
-                    "interval_time": 1000
-                }
-            }
-        elif command == 'set_part_fan':
-            value = data.get('value') # Espera 0-100 da UI
-            
-            # --- LÓGICA CORRIGIDA --- 
-            # Valida se o input é um número entre 0 e 100
-            if value is None or not isinstance(value, (int, float)) or not (0 <= value <= 100):
-                print(f"Erro: Velocidade do fan inválida (value={value}). Esperado 0-100%.", flush=True)
-                return jsonify({"success": False, "error": "Velocidade da ventoinha inválida (0-100%)."}), 400
-            
-            # Converte o valor percentual (0-100) para G-code (0-255)
-            gcode_value = int(round(value * 2.55))
-            # --- FIM CORREÇÃO ---
-            
-            payload_to_send = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "gcode_line",
-                    "param": f"M106 P1 S{gcode_value}" # Fan de peça é P1
-                }
-            }
-        else:
-            print(f"Erro: Comando desconhecido recebido: {command}", flush=True)
-            return jsonify({"success": False, "error": f"Comando desconhecido: {command}"}), 400
-
-        # Publicar o comando MQTT
-        if payload_to_send:
-            payload_json = json.dumps(payload_to_send)
-            print(f"Enviando comando '{command}' para {TOPIC_REQUEST}: {payload_json}", flush=True)
-            result, mid = app.mqtt_client.publish(TOPIC_REQUEST, payload_json, qos=1)
-
-            if result == mqtt.MQTT_ERR_SUCCESS:
-                print(f"Comando {command} (seq: {sequence_id}) publicado com sucesso (MID: {mid}).", flush=True)
-                return jsonify({"success": True, "message": f"Comando '{command}' enviado.", "sequence_id": sequence_id})
-            else:
-                print(f"Falha ao publicar comando {command} (seq: {sequence_id}), erro MQTT: {result}", flush=True)
-                return jsonify({"success": False, "error": f"Falha ao enviar comando MQTT (erro {result})."}), 500
-        else:
-             # Este caso não deveria ocorrer se a lógica acima estiver correta
-             print(f"Erro interno: Nenhum payload foi definido para o comando '{command}'", flush=True)
-             return jsonify({"success": False, "error": "Erro interno ao processar comando."}), 500
+
+        try:
+            payload_to_send = build_command_payload(data, sequence_id)
+        except ValueError as e:
+            print(f"Erro: {e}", flush=True)
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        # Sem conexão, o comando espera na fila até reconectar (ou vencer o TTL)
+        sent_at = time.monotonic()
+        queued = not bambu_connection.connected
+        try:
+            sequence_id, ack = enqueue_command(command, sequence_id, payload_to_send)
+        except CommandQueueFull as e:
+            return jsonify({"success": False, "error": str(e)}), 503
+
+        if not data.get('wait'):
+            message = (f"Impressora desconectada: comando '{command}' na fila." if queued
+                       else f"Comando '{command}' enviado.")
+            return jsonify({"success": True, "message": message, "sequence_id": sequence_id, "queued": queued})
+
+        # {"wait": true}: responde só depois que a impressora confirmar o comando
+        try:
+            echo = ack.result(timeout=command_queue_wait_limit(command))
+        except (CommandTimeout, CommandExpired, concurrent.futures.TimeoutError) as e:
+            return jsonify({"success": False, "sequence_id": sequence_id,
+                            "error": str(e) or "A impressora não confirmou o comando."}), 504
+        latency_ms = round((time.monotonic() - sent_at) * 1000)
+        acked = is_success(echo.get('result'))
+        return jsonify({"success": acked, "message": f"Comando '{command}' confirmado pela impressora.",
+                        "sequence_id": str(echo.get('sequence_id', sequence_id)), "result": echo.get('result'),
+                        "reason": echo.get('reason'), "latency_ms": latency_ms})
 
     except Exception as e:
         print(f"Erro na rota /command: {e}", flush=True)
         return jsonify({"success": False, "error": f"Erro interno do servidor: {e}"}), 500
 
+# --- Canal WebSocket: status e comandos em uma única conexão ---
+def _socket_status_frame(state, selector):
+    """
+    Monta a próxima mensagem de status de um WebSocket ('status' completo ou 'patch')
+
+    Args:
+        state (dict): Estado da conexão ({"version", "body"} do último envio)
+        selector (FieldSelector): Seletor de campos, ou None para o status completo
+
+    Returns:
+        bytes: Mensagem a enviar, ou None se nada mudou para este cliente
+    """
+    if selector is not None:
+        snapshot, body = status_store.project(selector)
+        state['version'] = snapshot.version
+        if body == state.get('body'):
+            return None
+        state['body'] = body
+        return b'{"type": "status", "version": %d, "status": %s}' % (snapshot.version, body)
+
+    if state.get('version') is not None:
+        delta = status_store.delta(state['version'])
+        if delta is not None:
+            state['version'] = delta[0]
+            # Reaproveita o diff serializado, trocando apenas o início do objeto
+            return b'{"type": "patch", ' + delta[1][1:]
+
+    snapshot = status_store.snapshot()
+    state['version'] = snapshot.version
+    return b'{"type": "status", "version": %d, "status": %s}' % (snapshot.version, snapshot.body)
+
+def _socket_command(message, outbox):
+    """Publica um comando recebido pelo WebSocket e agenda a confirmação na outbox da conexão"""
+    ref = message.get('id')
+    command = message.get('command')
+    sequence_id = get_next_sequence_id()
+    try:
+        payload = build_command_payload(message, sequence_id)
+    except ValueError as e:
+        outbox.put(('send', {"type": "error", "id": ref, "error": str(e)}))
+        return
+
+    sent_at = time.monotonic()
+
+    def on_ack(future):
+        error = future.exception()
+        if isinstance(error, CommandExpired):
+            outbox.put(('send', {"type": "error", "id": ref, "error": str(error)}))
+            return
+        if error is not None:
+            outbox.put(('send', {"type": "timeout", "id": ref, "sequence_id": sequence_id}))
+            return
+        echo = future.result()
+        # O id ecoado é o publicado (pode ser o de um comando que substituiu este)
+        outbox.put(('send', {"type": "ack", "id": ref, "sequence_id": str(echo.get('sequence_id', sequence_id)),
+                             "success": is_success(echo.get('result')),
+                             "command": echo.get('command'), "result": echo.get('result'),
+                             "reason": echo.get('reason'),
+                             "latency_ms": round((time.monotonic() - sent_at) * 1000)}))
+
+    queued = not bambu_connection.connected
+    try:
+        sequence_id, ack = enqueue_command(command, sequence_id, payload)
+    except CommandQueueFull as e:
+        outbox.put(('send', {"type": "error", "id": ref, "error": str(e)}))
+        return
+    outbox.put(('send', {"type": "sent", "id": ref, "sequence_id": sequence_id, "queued": queued}))
+    ack.add_done_callback(on_ack)
+
+def status_socket(ws):
+    """
+    WebSocket que envia o status (completo e depois diferenças) e recebe comandos.
+
+    Mensagens do cliente:
+        {"type": "subscribe", "fields": "print.mc_percent,..."} - troca os campos assinados
+        {"type": "command", "id": <ref>, "command": "pause", ...} - mesmo formato do POST /command
+    Mensagens do servidor:
+        status, patch (como em /status/stream), sent, ack, timeout e error.
+        As respostas de comandos trazem o "id" enviado pelo cliente.
+    """
+    outbox = queue.Queue()
+    closed = threading.Event()
+    # Comandos exigem login; o status segue a mesma regra de /status
+    can_command = current_user.is_authenticated
+
+    def watch_status():
+        version = None
+        while not closed.is_set():
+            new_version = status_store.wait_for_change(version, timeout=SSE_KEEPALIVE_SECONDS)
+            if new_version != version:
+                version = new_version
+                outbox.put(('status', None))
+
+    def send_loop():
+        # Apenas esta thread escreve no socket
+        state = {}
+        selector = None
+        while True:
+            item = outbox.get()
+            if item is None:
+                break
+            kind, message = item
+            try:
+                if kind == 'subscribe':
+                    selector = compile_fields(message['fields']) if message.get('fields') else None
+                    state = {}
+                    kind = 'status'
+                if kind == 'status':
+                    frame = _socket_status_frame(state, selector)
+                    if frame is not None:
+                        ws.send(frame.decode('utf-8'))
+                else:
+                    ws.send(json.dumps(message))
+            except ValueError as e:
+                outbox.put(('send', {"type": "error", "error": str(e)}))
+            except Exception:
+                # Conexão encerrada: a thread principal também vai perceber
+                closed.set()
+                break
+
+    threading.Thread(target=watch_status, daemon=True).start()
+    threading.Thread(target=send_loop, daemon=True).start()
+
+    try:
+        while not closed.is_set():
+            raw = ws.receive()
+            try:
+                message = json.loads(raw)
+            except (TypeError, ValueError):
+                outbox.put(('send', {"type": "error", "error": "Mensagem JSON inválida."}))
+                continue
+
+            message_type = message.get('type') if isinstance(message, dict) else None
+            if message_type == 'subscribe':
+                outbox.put(('subscribe', message))
+            elif message_type == 'command':
+                if can_command:
+                    _socket_command(message, outbox)
+                else:
+                    outbox.put(('send', {"type": "error", "id": message.get('id'), "error": "Login necessário para enviar comandos."}))
+            else:
+                outbox.put(('send', {"type": "error", "error": f"Tipo de mensagem desconhecido: {message_type}"}))
+    except ConnectionClosed:
+        pass
+    finally:
+        closed.set()
+        outbox.put(None)
+
+if sock:
+    sock.route('/ws')(status_socket)
+
 # --- Rota para Proxy da Câmera ---
 @app.route('/camera_proxy')
 # @login_required # REMOVIDO - Acesso permitido para a página /live
@@ -621,10 +1134,6 @@ def save_subscriptions(subscriptions):
 # Carrega assinaturas na inicialização
 push_subscriptions = load_subscriptions()
 
-# --- Variáveis de Estado para Detecção de Eventos ---
-last_print_status = None # Armazena o estado anterior da impressão
-status_lock = threading.Lock() # Reutiliza o lock existente
-
 # --- Função para Enviar Notificações Push ---
 def send_push_notification(title, body, icon=None, badge=None, data=None):
     if not VAPID_ENABLED:
@@ -685,66 +1194,6 @@ def send_push_notification(title, body, icon=None, badge=None, data=None):
                 push_subscriptions.pop(endpoint, None)
             save_subscriptions(push_subscriptions) # Salva o dicionário atualizado
 
-# --- Callback MQTT Modificado para Detecção de Eventos ---
-def on_message(client, userdata, msg):
-    """Callback executado quando uma mensagem é recebida."""
-    global printer_status, last_print_status
-    try:
-        payload = json.loads(msg.payload.decode('utf-8'))
-        new_status_data = {} # Acumula dados recebidos nesta mensagem
-        if isinstance(payload.get('print'), dict):
-             new_status_data.update(payload['print'])
-        # Adicione outros top-level keys se necessário (ex: 'system')
-        # if isinstance(payload.get('system'), dict):
-        #     new_status_data.update(payload['system'])
-
-        with status_lock:
-            # Atualiza o estado global
-            for key, value in payload.items():
-                if isinstance(value, dict):
-                    if key in printer_status and isinstance(printer_status.get(key), dict):
-                        printer_status[key].update(value)
-                    else:
-                        printer_status[key] = value
-                # else: # Considerar atualizar chaves não-dicionário também? 
-                #     printer_status[key] = value
-
-            # Lógica de Detecção de Eventos de Impressão
-            current_print_info = printer_status.get('print', {})
-            current_mc_status = current_print_info.get('mc_print_stage')
-            current_gcode_file = current_print_info.get('gcode_file', '')
-            current_result = current_print_info.get('mc_print_result')
-
-            previous_mc_status = last_print_status.get('mc_print_stage') if last_print_status else None
-            previous_gcode_file = last_print_status.get('gcode_file', '') if last_print_status else ''
-
-            # Evento: Impressão Iniciada
-            if current_mc_status == 'PRINTING' and previous_mc_status != 'PRINTING':
-                 if current_gcode_file:
-                    filename = os.path.basename(current_gcode_file)
-                    send_push_notification("Impressão Iniciada!", f"Arquivo: {filename}")
-                 else:
-                     send_push_notification("Impressão Iniciada!", "Um novo trabalho começou.")
-
-            # Evento: Impressão Concluída/Falhou/Parou
-            if previous_mc_status == 'PRINTING' and current_mc_status != 'PRINTING':
-                 filename = os.path.basename(previous_gcode_file) if previous_gcode_file else "Trabalho anterior"
-                 if current_result == 0: # Sucesso (código 0 geralmente indica sucesso)
-                     send_push_notification("Impressão Concluída! ✅", f"Arquivo: {filename}")
-                 elif current_result == 4: # Parada pelo usuário (comum para cancelamento)
-                      send_push_notification("Impressão Parada ⏹️", f"Arquivo: {filename}")
-                 else: # Outros resultados podem ser erros
-                     error_code = current_result or "Desconhecido"
-                     send_push_notification("Erro na Impressão! ❌", f"Arquivo: {filename}\nResultado/Erro: {error_code}")
-
-            # Atualiza o último estado conhecido para a próxima comparação
-            last_print_status = current_print_info.copy()
-
-    except json.JSONDecodeError:
-        print(f"Erro ao decodificar JSON: {msg.payload.decode()}", flush=True)
-    except Exception as e:
-        print(f"Erro ao processar mensagem MQTT ou enviar push: {e}", flush=True)
-
 # --- Rotas Flask ---
 
 # --- NOVA Rota para Salvar Assinaturas Push ---
@@ -785,88 +1234,99 @@ def save_subscription():
 # --- Funções MQTT ---
 
 def get_next_sequence_id():
-    """Obtém o próximo sequence_id de forma thread-safe."""
-    global command_sequence_id
-    with sequence_lock:
-        command_sequence_id += 1
-        return str(command_sequence_id) # MQTT espera string
-
-def on_connect(client, userdata, flags, rc, properties=None):
-    """Callback executado quando o cliente se conecta ao broker MQTT."""
-    if rc == 0:
-        print("Conectado ao Broker MQTT da Impressora com sucesso!", flush=True)
-        # Armazena o cliente na aplicação Flask para uso posterior
-        app.mqtt_client = client
-        client.subscribe(TOPIC_REPORT)
-        print(f"Inscrito no tópico: {TOPIC_REPORT}", flush=True)
-        request_full_status(client)
-    else:
-        print(f"Falha na conexão MQTT, código de retorno: {rc}", flush=True)
-        app.mqtt_client = None # Garante que não usemos um cliente inválido
-
-def on_disconnect(client, userdata, rc, properties=None):
-    """Callback executado quando o cliente se desconecta."""
+    """Obtém o próximo sequence_id (mesma sequência das consultas de estatísticas)."""
+    return next_sequence_id()
+
+def on_connect(connection):
+    """Chamado pela conexão compartilhada a cada conexão com o broker MQTT da impressora."""
+    print("Conectado ao Broker MQTT da Impressora com sucesso!", flush=True)
+    # Armazena o cliente na aplicação Flask para uso posterior
+    app.mqtt_client = connection.client
+    print(f"Inscrito no tópico: {connection.topic_report}", flush=True)
+    request_full_status(connection.client)
+
+def on_disconnect(rc):
+    """Chamado pela conexão compartilhada quando o cliente se desconecta."""
     print(f"Desconectado do Broker MQTT (código: {rc}). Tentando reconectar...", flush=True)
     app.mqtt_client = None # Cliente não está mais conectado
 
-def on_message(client, userdata, msg):
-    """Callback executado quando uma mensagem é recebida."""
-    global printer_status, last_print_status
+# --- Consumidores dos Relatórios da Impressora ---
+# Registrados em bambu_connection, que decodifica cada relatório uma única vez
+
+def update_status(payload):
+    """
+    Atualiza o estado global (e acorda os streams SSE se algo mudou) e publica
+    os eventos derivados das transições no event_bus.
+    """
+    # Só a thread de ingestão altera o status: o snapshot lido aqui é o anterior ao apply
+    previous = status_store.snapshot().status
+    changed = status_store.apply(payload, include_scalars=True, full=is_full_report(payload))
+    if changed:
+        for event in detect_events(previous, status_store.snapshot().status, changed):
+            event_bus.publish(event)
+
+# --- Assinantes dos Eventos da Impressora ---
+# Rodam na thread de ingestão: o trabalho lento vai para os executores
+
+def notify_job_event(event):
+    """Envia a notificação push de início/fim de impressão."""
+    filename = event.data.get('filename')
+    if event.type == printer_events.JOB_STARTED:
+        body = f"Arquivo: {filename}" if filename else "Um novo trabalho começou."
+        push_executor.submit(send_push_notification, "Impressão Iniciada!", body)
+        return
+
+    filename = filename or "Trabalho anterior"
+    if event.type == printer_events.JOB_FINISHED:
+        push_executor.submit(send_push_notification, "Impressão Concluída! ✅", f"Arquivo: {filename}")
+    elif event.type == printer_events.JOB_STOPPED:
+        push_executor.submit(send_push_notification, "Impressão Parada ⏹️", f"Arquivo: {filename}")
+    else:
+        error_code = event.data.get('print_error') or event.data.get('result') or "Desconhecido"
+        push_executor.submit(send_push_notification, "Erro na Impressão! ❌", f"Arquivo: {filename}\nResultado/Erro: {error_code}")
+
+# Status gravado no histórico de trabalhos para cada evento de fim
+JOB_END_STATUS = {
+    printer_events.JOB_FINISHED: "FINISHED",
+    printer_events.JOB_STOPPED: "STOPPED",
+    printer_events.JOB_FAILED: "FAILED",
+}
+
+def track_print_job(event):
+    """Registra início/fim do trabalho no histórico do banco de dados."""
+    from db_manager import PrintJobManager
+
+    filename = event.data.get('filename')
+    if not filename:
+        return
+    if event.type == printer_events.JOB_STARTED:
+        db_executor.submit(PrintJobManager.record_print_start, filename)
+    else:
+        db_executor.submit(PrintJobManager.record_print_end, filename, JOB_END_STATUS[event.type])
+
+def setup_gpio_automation(rules):
+    """
+    Liga/desliga pinos GPIO em resposta a eventos, conforme GPIO_AUTOMATION no config.json:
+    [{"event": "job_started", "pin": 17, "state": true}, ...]
+    """
+    if not rules:
+        return
     try:
-        payload = json.loads(msg.payload.decode('utf-8'))
-        new_status_data = {} # Acumula dados recebidos nesta mensagem
-        if isinstance(payload.get('print'), dict):
-             new_status_data.update(payload['print'])
-        # Adicione outros top-level keys se necessário (ex: 'system')
-        # if isinstance(payload.get('system'), dict):
-        #     new_status_data.update(payload['system'])
-
-        with status_lock:
-            # Atualiza o estado global
-            for key, value in payload.items():
-                if isinstance(value, dict):
-                    if key in printer_status and isinstance(printer_status.get(key), dict):
-                        printer_status[key].update(value)
-                    else:
-                        printer_status[key] = value
-                # else: # Considerar atualizar chaves não-dicionário também? 
-                #     printer_status[key] = value
-
-            # Lógica de Detecção de Eventos de Impressão
-            current_print_info = printer_status.get('print', {})
-            current_mc_status = current_print_info.get('mc_print_stage')
-            current_gcode_file = current_print_info.get('gcode_file', '')
-            current_result = current_print_info.get('mc_print_result')
-
-            previous_mc_status = last_print_status.get('mc_print_stage') if last_print_status else None
-            previous_gcode_file = last_print_status.get('gcode_file', '') if last_print_status else ''
-
-            # Evento: Impressão Iniciada
-            if current_mc_status == 'PRINTING' and previous_mc_status != 'PRINTING':
-                 if current_gcode_file:
-                    filename = os.path.basename(current_gcode_file)
-                    send_push_notification("Impressão Iniciada!", f"Arquivo: {filename}")
-                 else:
-                     send_push_notification("Impressão Iniciada!", "Um novo trabalho começou.")
-
-            # Evento: Impressão Concluída/Falhou/Parou
-            if previous_mc_status == 'PRINTING' and current_mc_status != 'PRINTING':
-                 filename = os.path.basename(previous_gcode_file) if previous_gcode_file else "Trabalho anterior"
-                 if current_result == 0: # Sucesso (código 0 geralmente indica sucesso)
-                     send_push_notification("Impressão Concluída! ✅", f"Arquivo: {filename}")
-                 elif current_result == 4: # Parada pelo usuário (comum para cancelamento)
-                      send_push_notification("Impressão Parada ⏹️", f"Arquivo: {filename}")
-                 else: # Outros resultados podem ser erros
-                     error_code = current_result or "Desconhecido"
-                     send_push_notification("Erro na Impressão! ❌", f"Arquivo: {filename}\nResultado/Erro: {error_code}")
-
-            # Atualiza o último estado conhecido para a próxima comparação
-            last_print_status = current_print_info.copy()
-
-    except json.JSONDecodeError:
-        print(f"Erro ao decodificar JSON: {msg.payload.decode()}", flush=True)
+        from gpio_manager import GpioManager
     except Exception as e:
-        print(f"Erro ao processar mensagem MQTT ou enviar push: {e}", flush=True)
+        print(f"Automação GPIO desativada: {e}", flush=True)
+        return
+
+    for rule in rules:
+        try:
+            pin, state = int(rule['pin']), bool(rule.get('state', True))
+            # O GpioManager grava o estado no banco: usa a mesma thread das outras escritas
+            event_bus.subscribe(rule['event'],
+                                lambda event, pin=pin, state=state: db_executor.submit(GpioManager.set_pin_state, pin, state),
+                                name=f"gpio_{pin}")
+            print(f"Automação GPIO: {rule['event']} -> pino {pin} = {state}", flush=True)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Regra de automação GPIO inválida {rule}: {e}", flush=True)
 
 def request_full_status(client):
     """Envia uma solicitação para obter o status completo da impressora."""
@@ -911,47 +1371,6 @@ def request_printer_info(client):
     print(f"Enviando solicitação 'get_printer_info' (seq: {sequence_id}) para {TOPIC_REQUEST}", flush=True)
     client.publish(TOPIC_REQUEST, payload_json)
 
-def mqtt_thread_func():
-    """Função que executa em uma thread separada para gerenciar conexão MQTT."""
-    print("Thread MQTT iniciada", flush=True)
-    
-    # Pequeno atraso para garantir que o aplicativo esteja totalmente inicializado
-    time.sleep(2)
-    
-    # TLS é necessário para a Bambu Lab
-    try:
-        # Criar cliente MQTT local
-        local_client = mqtt.Client(client_id=MQTT_CLIENT_ID, protocol=mqtt.MQTTv311)
-        
-        # Configurar callbacks
-        local_client.on_connect = on_connect
-        local_client.on_disconnect = on_disconnect
-        local_client.on_message = on_message
-        
-        # TLS é necessário para a Bambu Lab
-        try:
-            local_client.tls_set(tls_version=ssl.PROTOCOL_TLS_CLIENT, cert_reqs=ssl.CERT_NONE)
-            local_client.tls_insecure_set(True)
-            print(f"Conectando ao broker MQTT: {PRINTER_IP}:{MQTT_PORT}", flush=True)
-            local_client.connect(PRINTER_IP, MQTT_PORT, 60)
-        except Exception as e:
-            print(f"Erro ao conectar ao broker MQTT: {e}", flush=True)
-            print("Thread MQTT terminando.", flush=True)
-            return
-    except Exception as e:
-        print(f"Erro ao iniciar thread MQTT: {e}", flush=True)
-        print("Thread MQTT terminando.", flush=True)
-        return
-
-    # Loop MQTT
-    try:
-        local_client.loop_forever()
-    except Exception as e:
-        print(f"Erro no loop MQTT: {e}", flush=True)
-    finally:
-        print("Thread MQTT terminando.", flush=True)
-        app.mqtt_client = None # Garante limpeza ao sair do loop
-
 # --- Funções de Manutenção ---
 
 def read_maintenance_data():
@@ -985,48 +1404,57 @@ def write_maintenance_data(data):
 
 # --- Inicialização ---
 
+# Carrega uma única vez as últimas leituras do ESP32; depois o cache é mantido pelo MQTTClient
+sensor_cache.load_from_db()
+
+# Com o motor asyncio, as conexões MQTT e os timers criados a partir daqui rodam no event loop
+if INGEST_ENGINE == 'asyncio':
+    async_engine.start_engine()
+    print("Motor de ingestão asyncio ativo", flush=True)
+elif INGEST_ENGINE != 'threads':
+    print(f"Aviso: INGEST_ENGINE '{INGEST_ENGINE}' desconhecido, usando threads.", flush=True)
+
+# Conexão única com a impressora, compartilhada por todos os consumidores dos relatórios
+bambu_connection = BambuConnection(PRINTER_IP, ACCESS_CODE, DEVICE_ID, port=MQTT_PORT, client_id=MQTT_CLIENT_ID,
+                                   coalesce_window=REPORT_COALESCE_MS / 1000.0)
+bambu_connection.add_connect_listener(on_connect)
+bambu_connection.add_disconnect_listener(on_disconnect)
+# Comandos enviados com a impressora desconectada esperam aqui pela reconexão
+command_queue = CommandQueue(bambu_connection, command_tracker)
+bambu_connection.add_consumer(command_tracker.resolve, name='confirmacao_comandos')
+bambu_connection.add_consumer(update_status, name='status')
+
+# Assinantes dos eventos derivados das transições de estado
+event_bus.subscribe((printer_events.JOB_STARTED,) + printer_events.JOB_END_EVENTS, notify_job_event, name='push')
+event_bus.subscribe((printer_events.JOB_STARTED,) + printer_events.JOB_END_EVENTS, track_print_job, name='historico_trabalhos')
+setup_gpio_automation(config.get('GPIO_AUTOMATION'))
+
 # Inicializar a integração MQTT para atualização de estatísticas
 try:
     from mqtt_integration import MQTTIntegration
     
-    # Função de callback para atualizar o printer_status
-    def update_printer_status(data):
-        """
-        Atualiza o printer_status com os dados recebidos
-        
-        Args:
-            data (dict): Dados a serem atualizados no printer_status
-        """
-        global printer_status
-        with status_lock:
-            for key, value in data.items():
-                if isinstance(value, dict):
-                    if key in printer_status and isinstance(printer_status.get(key), dict):
-                        printer_status[key].update(value)
-                    else:
-                        printer_status[key] = value
-                else:
-                    printer_status[key] = value
-    
     app.mqtt_integration = MQTTIntegration({
         'PRINTER_IP': PRINTER_IP,
         'ACCESS_CODE': ACCESS_CODE,
         'DEVICE_ID': DEVICE_ID
-    })
+    }, connection=bambu_connection)
     
-    # Configura o callback
-    app.mqtt_integration.set_update_callback(update_printer_status)
+    # Novas leituras do ESP32 mudam o enriquecimento do status: agrupadas em uma nova versão
+    if app.mqtt_integration.client:
+        app.mqtt_integration.client.set_update_callback(schedule_sensor_refresh)
     
     print("Integração MQTT para estatísticas inicializada", flush=True)
 except Exception as e:
     print(f"Erro ao inicializar integração MQTT para estatísticas: {e}", flush=True)
     app.mqtt_integration = None
 
-if __name__ == '__main__':
-    # Inicia a thread MQTT em background
-    mqtt_thread = threading.Thread(target=mqtt_thread_func, daemon=True)
-    mqtt_thread.start()
+# Conecta à impressora depois que todos os consumidores estão registrados
+bambu_connection.start()
 
+if __name__ == '__main__':
+    # SIGTERM (enviado pelo SquidStart) encerra via SystemExit para que os handlers
+    # do atexit rodem (ex: gravar as leituras de sensores ainda no buffer)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     # Inicia o servidor Flask
     # Use host='0.0.0.0' para torná-lo acessível na sua rede local
     print("Iniciando servidor Flask em http://0.0.0.0:5000", flush=True)
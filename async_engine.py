@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Motor de ingestão com um único event loop asyncio (opcional).
+
+No modo padrão cada cliente paho tem uma thread de rede (ReconnectSupervisor),
+a BambuConnection tem uma thread de ingestão e o MQTTIntegration uma thread
+de agendamento. Com INGEST_ENGINE = "asyncio" na configuração, todas essas
+tarefas passam a rodar em uma única thread:
+
+- os sockets dos clientes MQTT são registrados no loop (API de loop externo
+  do paho: loop_read/loop_write/loop_misc) e a reconexão com backoff é uma
+  corrotina que usa o mesmo ReconnectSupervisor (métricas iguais);
+- a fila de relatórios da impressora é drenada por callbacks do loop, e a
+  janela de mesclagem é um timer;
+- as tarefas periódicas do MQTTIntegration são timers do loop.
+
+Os componentes consultam get_engine() ao iniciar; a interface pública de
+MQTTClient, MQTTIntegration e BambuConnection não muda. Trabalho bloqueante
+(SQLite, pywebpush) continua nos executores de background_tasks.
+"""
+
+import asyncio
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('async_engine')
+
+# Intervalo (segundos) do loop_misc de cada cliente (keepalive e timeout do PINGRESP)
+MISC_INTERVAL = 1.0
+
+# Motor global (None: modo com threads)
+_engine = None
+_engine_lock = threading.Lock()
+
+class Timer:
+    """Timer agendado com IngestionEngine.call_at; cancel() pode ser chamado de qualquer thread"""
+
+    __slots__ = ('_engine', '_handle', '_cancelled')
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._handle = None
+        self._cancelled = False
+
+    def _arm(self, when, callback, args):
+        if not self._cancelled:
+            self._handle = self._engine.loop.call_at(when, callback, *args)
+
+    def cancel(self):
+        self._cancelled = True
+        self._engine.call_soon(self._cancel_handle)
+
+    def _cancel_handle(self):
+        if self._handle is not None:
+            self._handle.cancel()
+
+class IngestionEngine:
+    """
+    Event loop asyncio em uma thread dedicada, compartilhado pelas conexões
+    MQTT e pelos timers da aplicação
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+        self._clients = {}  # {nome: Task da corrotina de supervisão}
+
+    def start(self):
+        """Inicia a thread do event loop"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="ingest-engine")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def stop(self, timeout=2.0):
+        """Cancela as conexões e encerra o event loop"""
+        for task in list(self._clients.values()):
+            self.loop.call_soon_threadsafe(task.cancel)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread:
+            self.thread.join(timeout=timeout)
+
+    def in_loop(self):
+        """True se chamado na thread do event loop"""
+        return threading.current_thread() is self.thread
+
+    def call_soon(self, callback, *args):
+        """Agenda uma função no event loop (de qualquer thread)"""
+        if self.in_loop():
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def call_at(self, when, callback, *args):
+        """
+        Agenda uma função para um instante de time.monotonic() (de qualquer thread)
+
+        Returns:
+            Timer: Permite cancelar o agendamento
+        """
+        timer = Timer(self)
+        self.call_soon(timer._arm, when, callback, args)
+        return timer
+
+    def supervise(self, supervisor, host, port, keepalive=60):
+        """
+        Passa a manter a conexão de um cliente paho no event loop
+
+        Args:
+            supervisor (ReconnectSupervisor): Supervisor do cliente (backoff e métricas)
+            host (str): Endereço do broker
+            port (int): Porta do broker
+            keepalive (int, optional): Keepalive MQTT em segundos
+        """
+        self._attach_socket_callbacks(supervisor.client)
+
+        def create_task():
+            task = self._clients.get(supervisor.name)
+            if task is not None and not task.done():
+                return
+            self._clients[supervisor.name] = self.loop.create_task(
+                self._connection_loop(supervisor, host, port, keepalive))
+        self.call_soon(create_task)
+
+    def unsupervise(self, supervisor):
+        """Encerra a corrotina de conexão de um cliente"""
+        def cancel():
+            task = self._clients.pop(supervisor.name, None)
+            if task is not None:
+                task.cancel()
+        self.call_soon(cancel)
+
+    def _attach_socket_callbacks(self, client):
+        """Registra no loop os sockets que o paho abre, fecha e precisa escrever"""
+        def on_readable(sock):
+            rc = client.loop_read()
+            # Dados já decifrados no buffer TLS não tornam o socket legível de novo
+            pending = getattr(sock, 'pending', None)
+            while rc == mqtt.MQTT_ERR_SUCCESS and pending is not None and client.socket() is sock and pending() > 0:
+                rc = client.loop_read()
+
+        def watch(fd, sock):
+            self.loop.add_reader(fd, on_readable, sock)
+
+        def unwatch(fd):
+            self.loop.remove_reader(fd)
+            self.loop.remove_writer(fd)
+
+        def add_writer(fd, sock):
+            # O socket pode ter sido fechado antes de este callback rodar
+            if client.socket() is sock:
+                self.loop.add_writer(fd, client.loop_write)
+
+        # Os callbacks do paho podem vir de qualquer thread (ex: publish de uma requisição HTTP).
+        # O fd é lido na hora: o paho fecha o socket logo depois de on_socket_close.
+        client.on_socket_open = lambda c, userdata, sock: self._in_loop(watch, sock.fileno(), sock)
+        client.on_socket_close = lambda c, userdata, sock: self._in_loop(unwatch, sock.fileno())
+        client.on_socket_register_write = lambda c, userdata, sock: self._in_loop(add_writer, sock.fileno(), sock)
+        client.on_socket_unregister_write = lambda c, userdata, sock: self._in_loop(self.loop.remove_writer, sock.fileno())
+
+    def _in_loop(self, callback, *args):
+        """Executa já se estiver na thread do event loop; senão, agenda"""
+        if self.in_loop():
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    async def _connection_loop(self, supervisor, host, port, keepalive):
+        """Corrotina: conecta, mantém o keepalive até a conexão cair e espera o backoff"""
+        client = supervisor.client
+        # Só guarda os parâmetros; as tentativas usam reconnect()
+        client.connect_async(host, port, keepalive)
+        supervisor.connection_pending()
+        try:
+            while not supervisor.stopped:
+                supervisor.attempt_started()
+                try:
+                    # Conexão TCP e handshake TLS são bloqueantes no paho: ficam fora do loop
+                    await self.loop.run_in_executor(None, client.reconnect)
+                except Exception as e:
+                    # Impressora desligada, Wi-Fi fora, DNS/TLS...
+                    logger.warning(f"[{supervisor.name}] Falha ao conectar: {str(e)}")
+                else:
+                    while not supervisor.stopped and client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                        await asyncio.sleep(MISC_INTERVAL)
+                    if supervisor.stopped:
+                        break
+                    # Socket fechado sem passar pelo on_disconnect (ex: CONNACK recusado)
+                    supervisor.connection_lost(supervisor.last_rc)
+
+                await asyncio.sleep(supervisor.backoff())
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self):
+        """
+        Returns:
+            dict: Conexões mantidas pelo event loop
+        """
+        return {
+            'mode': 'asyncio',
+            'running': bool(self.thread and self.thread.is_alive()),
+            'clients': sorted(self._clients),
+        }
+
+def start_engine():
+    """
+    Cria e inicia o motor global (idempotente)
+
+    Returns:
+        IngestionEngine: Motor em execução
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = IngestionEngine()
+            _engine.start()
+            logger.info("Motor de ingestão asyncio iniciado")
+        return _engine
+
+def get_engine():
+    """
+    Returns:
+        IngestionEngine: Motor global, ou None no modo com threads
+    """
+    return _engine
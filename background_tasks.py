@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('background_tasks')
+
+class BackgroundExecutor:
+    """
+    Executa tarefas lentas (push, escrita no banco) fora das threads de rede,
+    registrando erros e mantendo contadores para o /metrics
+    """
+
+    def __init__(self, name, max_workers=1):
+        """
+        Args:
+            name (str): Nome usado nos logs e nas métricas
+            max_workers (int, optional): Número de threads do executor
+        """
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Agenda a execução de uma função
+
+        Returns:
+            Future: Resultado da tarefa (None se o executor já foi encerrado)
+        """
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except RuntimeError as e:
+            # Executor encerrado (desligamento da aplicação)
+            with self._lock:
+                self._pending -= 1
+            logger.warning(f"Tarefa descartada pelo executor '{self.name}': {str(e)}")
+            return None
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _task_done(self, future):
+        """Atualiza os contadores e registra exceções, que de outra forma seriam perdidas"""
+        error = future.exception()
+        with self._lock:
+            self._pending -= 1
+            if error is None:
+                self._completed += 1
+            else:
+                self._failed += 1
+        if error is not None:
+            logger.error(f"Erro em tarefa do executor '{self.name}': {str(error)}")
+
+    def stats(self):
+        """
+        Returns:
+            dict: Tarefas pendentes, concluídas e com erro
+        """
+        with self._lock:
+            return {'pending': self._pending, 'completed': self._completed, 'failed': self._failed}
+
+    def shutdown(self, wait=True):
+        """Encerra o executor, aguardando as tarefas pendentes se wait=True"""
+        self._executor.shutdown(wait=wait)
+
+# Envio de notificações push (chamadas HTTPS bloqueantes a cada inscrito)
+push_executor = BackgroundExecutor('push', max_workers=2)
+
+# Escritas no banco de dados; uma única thread evita disputa pelo arquivo SQLite
+db_executor = BackgroundExecutor('db', max_workers=1)
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import ssl
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import json_codec
+from async_engine import get_engine
+from reconnect_supervisor import ReconnectSupervisor
+from status_store import deep_merge, is_full_report
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('bambu_connection')
+
+# Porta MQTT (TLS) do broker embutido da impressora
+BAMBU_MQTT_PORT = 8883
+
+# Usuário fixo do modo LAN da Bambu Lab; a senha é o código de acesso
+BAMBU_MQTT_USER = "bblp"
+
+# Relatórios aguardando processamento; quando cheia, o mais antigo é descartado
+INGEST_QUEUE_SIZE = 100
+
+# Janela (s) em que relatórios push_status consecutivos são mesclados em um só
+COALESCE_WINDOW = 0.5
+
+class BambuConnection:
+    """
+    Conexão MQTT única com a impressora Bambu Lab.
+
+    O broker embutido da impressora é lento e aceita poucos clientes, então
+    toda a aplicação compartilha esta sessão. Cada relatório de
+    device/<id>/report é decodificado uma única vez e entregue, na ordem de
+    registro, a todos os consumidores (status, detecção de eventos,
+    estatísticas...).
+
+    A thread de rede do paho apenas enfileira o payload bruto em uma fila
+    limitada (descartando o mais antigo quando cheia); uma thread dedicada
+    decodifica e entrega aos consumidores. Assim, consumidores lentos não
+    atrasam keepalives nem o recebimento de novos relatórios.
+
+    Durante uma impressão chega um push_status por segundo. Os relatórios
+    de uma janela (coalesce_window) são mesclados e entregues como um só;
+    mudanças de gcode_state e de erros HMS fecham a janela imediatamente, e
+    as demais mensagens (respostas a comandos) nunca esperam.
+
+    Com o motor asyncio ativo (async_engine), a fila é drenada por callbacks
+    no event loop e a janela de mesclagem é um timer, sem thread de ingestão.
+    """
+
+    def __init__(self, printer_ip, access_code, device_id, port=BAMBU_MQTT_PORT, client_id=None,
+                 queue_size=INGEST_QUEUE_SIZE, coalesce_window=COALESCE_WINDOW):
+        """
+        Inicializa a conexão (sem conectar)
+
+        Args:
+            printer_ip (str): Endereço IP da impressora
+            access_code (str): Código de acesso do modo LAN
+            device_id (str): Número de série da impressora
+            port (int, optional): Porta MQTT da impressora
+            client_id (str, optional): ID do cliente MQTT
+            queue_size (int, optional): Máximo de relatórios aguardando processamento
+            coalesce_window (float, optional): Janela de mesclagem em segundos (0 desativa)
+        """
+        self.printer_ip = printer_ip
+        self.port = port
+        self.topic_report = f"device/{device_id}/report"
+        self.topic_request = f"device/{device_id}/request"
+        self.connected = False
+
+        self._consumers = []  # [(nome, callback)]
+        self._connect_listeners = []
+        self._disconnect_listeners = []
+
+        # Fila de relatórios brutos: deque com maxlen descarta o mais antigo ao encher
+        self._queue = collections.deque(maxlen=queue_size)
+        self._queue_ready = threading.Condition()
+        self._worker = None
+        self._engine = None
+        self._drain_scheduled = False
+        self._flush_timer = None
+        self._received = 0
+        self._dropped = 0
+        self._processed = 0
+        self._decode_errors = 0
+
+        # Relatório push_status mesclado aguardando o fim da janela
+        self.coalesce_window = coalesce_window
+        self._pending = None
+        self._pending_deadline = None
+        self._coalesced = 0
+        self._last_gcode_state = None
+        self._last_hms = None
+
+        self.client = mqtt.Client(client_id=client_id or "", protocol=mqtt.MQTTv311)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.username_pw_set(BAMBU_MQTT_USER, access_code)
+        # A impressora usa um certificado autoassinado
+        self.client.tls_set(tls_version=ssl.PROTOCOL_TLS_CLIENT, cert_reqs=ssl.CERT_NONE)
+        self.client.tls_insecure_set(True)
+        # Reconexão com backoff exponencial e jitter, disparada pelo on_disconnect
+        self.supervisor = ReconnectSupervisor('bambu', self.client)
+
+    def add_consumer(self, callback, name=None):
+        """
+        Registra um consumidor dos relatórios da impressora
+
+        Args:
+            callback (callable): Função que recebe o relatório decodificado (dict).
+                O dicionário é compartilhado entre os consumidores e não deve ser alterado.
+            name (str, optional): Nome usado nos logs de erro
+        """
+        self._consumers.append((name or getattr(callback, '__name__', repr(callback)), callback))
+
+    def add_connect_listener(self, callback):
+        """Registra uma função chamada (com esta conexão) a cada conexão bem-sucedida"""
+        self._connect_listeners.append(callback)
+
+    def add_disconnect_listener(self, callback):
+        """Registra uma função chamada (com o código de retorno) a cada desconexão"""
+        self._disconnect_listeners.append(callback)
+
+    def start(self):
+        """
+        Conecta em segundo plano (thread própria ou motor asyncio). A reconexão
+        é automática (com backoff), inclusive se a primeira tentativa falhar.
+
+        Returns:
+            bool: True se a conexão foi iniciada
+        """
+        self._engine = get_engine()
+        if self._engine is None and (not self._worker or not self._worker.is_alive()):
+            self._worker = threading.Thread(target=self._ingest_loop, name="bambu-ingest")
+            self._worker.daemon = True
+            self._worker.start()
+
+        logger.info(f"Conectando ao broker MQTT da Bambu em {self.printer_ip}:{self.port}")
+        self.supervisor.start(self.printer_ip, self.port, 60)
+        return True
+
+    def stop(self):
+        """Encerra a conexão"""
+        self.supervisor.stop()
+        self.connected = False
+
+    def publish(self, payload, qos=0):
+        """
+        Publica uma mensagem no tópico de requisições da impressora
+
+        Args:
+            payload (dict | str | bytes): Mensagem (dicts são codificados em JSON)
+            qos (int, optional): Nível de QoS
+
+        Returns:
+            MQTTMessageInfo: Resultado do publish (desempacotável em (rc, mid))
+        """
+        if isinstance(payload, dict):
+            payload = json_codec.dumps(payload)
+        return self.client.publish(self.topic_request, payload, qos=qos)
+
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
+        """Callback quando conectado ao broker da impressora"""
+        if rc != 0:
+            self.connected = False
+            logger.error(f"Falha ao conectar ao broker MQTT da Bambu, código {rc}")
+            return
+
+        self.connected = True
+        self.supervisor.connection_established()
+        logger.info("Conectado ao broker MQTT da Bambu")
+        client.subscribe(self.topic_report)
+        for listener in self._connect_listeners:
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"Erro no listener de conexão: {str(e)}")
+
+    def _on_disconnect(self, client, userdata, rc, properties=None):
+        """Callback quando desconectado do broker da impressora"""
+        self.connected = False
+        self.supervisor.connection_lost(rc)
+        logger.warning(f"Desconectado do broker MQTT da Bambu, código {rc}")
+        for listener in self._disconnect_listeners:
+            try:
+                listener(rc)
+            except Exception as e:
+                logger.error(f"Erro no listener de desconexão: {str(e)}")
+
+    def _on_message(self, client, userdata, msg):
+        """Apenas enfileira o relatório bruto (executado na thread de rede do paho)"""
+        if msg.topic != self.topic_report:
+            return
+
+        with self._queue_ready:
+            self._received += 1
+            if len(self._queue) == self._queue.maxlen:
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % 100 == 0:
+                    logger.warning(f"Fila de relatórios cheia: {self._dropped} relatório(s) descartado(s) até agora")
+            self._queue.append(msg.payload)
+            self._queue_ready.notify()
+            schedule_drain = self._engine is not None and not self._drain_scheduled
+            if schedule_drain:
+                self._drain_scheduled = True
+        if schedule_drain:
+            self._engine.call_soon(self._drain)
+
+    def _ingest_loop(self):
+        """Thread que retira relatórios da fila e os entrega aos consumidores"""
+        while True:
+            with self._queue_ready:
+                while True:
+                    # O prazo da janela vale mesmo com a fila sempre cheia: é o limite de latência
+                    if self._pending is not None:
+                        remaining = self._pending_deadline - time.monotonic()
+                        if remaining <= 0:
+                            payload = None
+                            break
+                    if self._queue:
+                        payload = self._queue.popleft()
+                        break
+                    self._queue_ready.wait(None if self._pending is None else remaining)
+
+            if payload is None:
+                # Fim da janela
+                self._flush()
+            else:
+                self._ingest(payload)
+
+    def _drain(self):
+        """Processa um relatório da fila no event loop e cede a vez antes do próximo"""
+        with self._queue_ready:
+            payload = self._queue.popleft() if self._queue else None
+            more = bool(self._queue)
+            if not more:
+                self._drain_scheduled = False
+
+        if self._pending is not None and time.monotonic() >= self._pending_deadline:
+            self._flush()
+        if payload is not None:
+            self._ingest(payload)
+        if more:
+            # Leituras de rede e timers rodam entre um relatório e outro
+            self._engine.call_soon(self._drain)
+        self._arm_flush_timer()
+
+    def _arm_flush_timer(self):
+        """Agenda o fim da janela de mesclagem no event loop, se houver relatório pendente"""
+        if self._pending is not None and self._flush_timer is None:
+            self._flush_timer = self._engine.loop.call_at(self._pending_deadline, self._on_flush_timer)
+
+    def _on_flush_timer(self):
+        self._flush_timer = None
+        if self._pending is not None and time.monotonic() >= self._pending_deadline:
+            self._flush()
+        # A janela pode ter sido fechada e reaberta antes do timer
+        self._arm_flush_timer()
+
+    def feed(self, payload):
+        """
+        Processa um relatório bruto na thread atual, sem passar pela fila
+        (usado pelo replay de gravações e em medições de desempenho)
+
+        Args:
+            payload (bytes | str): Relatório como recebido em device/<id>/report
+        """
+        if self._pending is not None and time.monotonic() >= self._pending_deadline:
+            self._flush()
+        self._ingest(payload)
+
+    def flush(self):
+        """Entrega imediatamente o relatório mesclado pendente, se houver"""
+        self._flush()
+
+    def _ingest(self, payload):
+        """Decodifica um relatório e o mescla na janela atual ou o entrega imediatamente"""
+        try:
+            data = json_codec.loads(payload)
+        except ValueError:
+            self._decode_errors += 1
+            logger.warning(f"Recebida mensagem Bambu com JSON inválido: {payload[:200]}")
+            return
+        if not isinstance(data, dict):
+            return
+
+        print_data = data.get('print')
+        if self.coalesce_window <= 0 or not isinstance(print_data, dict) or print_data.get('command') != 'push_status':
+            # Respostas a comandos mantêm a ordem, mas não esperam a janela
+            self._flush()
+            self._dispatch(data)
+            return
+
+        if self._pending is None:
+            self._pending = data
+            self._pending_deadline = time.monotonic() + self.coalesce_window
+        else:
+            full = is_full_report(data)
+            merged = deep_merge(self._pending, data, set(), replace_lists=full)
+            if not full and is_full_report(self._pending):
+                # A janela começou com o relatório completo: o resultado continua completo
+                merged = dict(merged, print=dict(merged['print'], msg=0))
+            self._pending = merged
+            self._coalesced += 1
+
+        if self._is_urgent(print_data):
+            self._flush()
+
+    def _is_urgent(self, print_data):
+        """True se o relatório muda gcode_state ou a lista de erros HMS"""
+        urgent = False
+        if 'gcode_state' in print_data and print_data['gcode_state'] != self._last_gcode_state:
+            self._last_gcode_state = print_data['gcode_state']
+            urgent = True
+        if 'hms' in print_data and print_data['hms'] != self._last_hms:
+            self._last_hms = print_data['hms']
+            urgent = True
+        return urgent
+
+    def _flush(self):
+        """Entrega o relatório mesclado da janela atual, se houver"""
+        if self._pending is None:
+            return
+        data, self._pending, self._pending_deadline = self._pending, None, None
+        self._dispatch(data)
+
+    def _dispatch(self, data):
+        """Entrega um relatório decodificado a todos os consumidores"""
+        for name, consumer in self._consumers:
+            # Um consumidor com erro não impede os demais de receber o relatório
+            try:
+                consumer(data)
+            except Exception as e:
+                logger.error(f"Erro no consumidor '{name}': {str(e)}", exc_info=True)
+        self._processed += 1
+
+    def stats(self):
+        """
+        Métricas da fila de ingestão
+
+        Returns:
+            dict: Profundidade da fila, capacidade e contadores
+        """
+        with self._queue_ready:
+            return {
+                'connected': self.connected,
+                'queue_depth': len(self._queue),
+                'queue_size': self._queue.maxlen,
+                'received': self._received,
+                'dropped': self._dropped,
+                'processed': self._processed,
+                'decode_errors': self._decode_errors,
+                'coalesced': self._coalesced,
+                'coalesce_window': self.coalesce_window,
+            }
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark dos backends JSON para os relatórios MQTT da impressora.
+
+Uso:
+    python bench_codec.py [relatorios.jsonl] [-n REPETICOES]
+
+O arquivo deve conter um relatório bruto de device/<id>/report por linha
+(ex: capturado com mosquitto_sub -t 'device/+/report' > relatorios.jsonl).
+Sem arquivo, usa um relatório push_status de exemplo embutido.
+"""
+
+import argparse
+import json
+import timeit
+
+# Relatório push_status de exemplo (formato de uma A1 Mini com AMS Lite)
+SAMPLE_REPORT = {
+    "print": {
+        "command": "push_status", "msg": 0, "sequence_id": "2021",
+        "nozzle_temper": 219.8, "nozzle_target_temper": 220, "bed_temper": 59.9,
+        "bed_target_temper": 60, "chamber_temper": 28, "mc_print_stage": "2",
+        "mc_percent": 42, "mc_remaining_time": 73, "mc_print_line_number": "128734",
+        "gcode_state": "RUNNING", "gcode_file": "/data/Metadata/plate_1.gcode",
+        "subtask_name": "suporte_camera", "layer_num": 87, "total_layer_num": 210,
+        "spd_lvl": 2, "spd_mag": 100, "fan_gear": 12543, "cooling_fan_speed": "15",
+        "heatbreak_fan_speed": "15", "big_fan1_speed": "0", "big_fan2_speed": "0",
+        "wifi_signal": "-52dBm", "print_error": 0, "hms": [],
+        "lights_report": [{"node": "chamber_light", "mode": "on"}],
+        "upgrade_state": {"status": "IDLE", "progress": "", "message": "", "new_ver_list": []},
+        "ipcam": {"ipcam_dev": "1", "ipcam_record": "enable", "timelapse": "disable", "resolution": "1080p"},
+        "stg": [
+            {"id": str(i), "tray_type": "PLA", "tray_color": "FFFFFFFF", "tray_info_idx": "GFA00",
+             "nozzle_temp_min": "190", "nozzle_temp_max": "240", "remain": 80 - i * 10,
+             "k": 0.02, "n": 1, "cali_idx": -1, "tray_uuid": "0" * 32}
+            for i in range(4)
+        ],
+        "ams": {
+            "ams": [{"id": "0", "humidity": "4", "temp": "0.0", "tray": [
+                {"id": str(i), "tray_type": "PETG", "tray_color": "0A2989FF", "remain": 65,
+                 "tray_weight": "1000", "tray_diameter": "1.75", "bed_temp": "70",
+                 "nozzle_temp_min": "220", "nozzle_temp_max": "260", "tray_uuid": "0" * 32}
+                for i in range(4)]}],
+            "ams_exist_bits": "1", "tray_exist_bits": "f", "tray_now": "1", "tray_tar": "1", "version": 123
+        }
+    }
+}
+
+def load_reports(path):
+    """Lê relatórios brutos (bytes) de um arquivo JSONL"""
+    with open(path, 'rb') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def available_backends():
+    """Retorna {nome: (loads, dumps)} para os backends instalados"""
+    backends = {
+        'json (decode + loads)': (lambda b: json.loads(b.decode('utf-8')), lambda o: json.dumps(o).encode('utf-8')),
+        'json (loads bytes)': (json.loads, lambda o: json.dumps(o, separators=(',', ':')).encode('utf-8')),
+    }
+    try:
+        import orjson
+        backends['orjson'] = (orjson.loads, orjson.dumps)
+    except ImportError:
+        pass
+    try:
+        import msgspec
+        decoder, encoder = msgspec.json.Decoder(), msgspec.json.Encoder()
+        backends['msgspec'] = (decoder.decode, encoder.encode)
+    except ImportError:
+        pass
+    return backends
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos backends JSON com relatórios da impressora")
+    parser.add_argument('reports', nargs='?', help="Arquivo JSONL com relatórios brutos")
+    parser.add_argument('-n', '--number', type=int, default=2000, help="Repetições por relatório")
+    args = parser.parse_args()
+
+    reports = load_reports(args.reports) if args.reports else [json.dumps(SAMPLE_REPORT).encode('utf-8')]
+    decoded = [json.loads(r) for r in reports]
+    total_bytes = sum(len(r) for r in reports)
+    print(f"{len(reports)} relatório(s), {total_bytes / len(reports):.0f} bytes em média, {args.number} repetições")
+    print(f"{'backend':<24}{'decode (us/msg)':>18}{'encode (us/msg)':>18}")
+
+    for name, (loads, dumps) in available_backends().items():
+        decode_time = timeit.timeit(lambda: [loads(r) for r in reports], number=args.number)
+        encode_time = timeit.timeit(lambda: [dumps(d) for d in decoded], number=args.number)
+        per_message = args.number * len(reports) / 1e6
+        print(f"{name:<24}{decode_time / per_message:>18.2f}{encode_time / per_message:>18.2f}")
+
+if __name__ == '__main__':
+    main()
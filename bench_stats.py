@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark da extração de estatísticas da impressora (printer_stats) contra
+a cadeia de ifs que MQTTIntegration._process_bambu_data usava antes.
+
+Uso:
+    python bench_stats.py [relatorios.jsonl] [-n REPETICOES]
+
+O arquivo deve conter um relatório de device/<id>/report por linha (ex:
+mosquitto_sub -t 'device/+/report' > relatorios.jsonl). Sem arquivo, usa
+o push_status de bench_codec e uma resposta de cada variante de firmware.
+Antes de medir, confere que as duas implementações extraem os mesmos valores.
+"""
+
+import argparse
+import json
+import logging
+import timeit
+
+from bench_codec import SAMPLE_REPORT
+from printer_stats import extract_stats
+
+logger = logging.getLogger('bench_stats')
+
+# Uma resposta de cada variante de firmware que traz estatísticas
+STATS_REPORTS = [
+    {"print": {"command": "push_status", "sequence_id": "1", "statistics": {"total_time": 1296000, "total_prints": 412}}},
+    {"print": {"command": "get_print_stats", "sequence_id": "2", "stats": {"total_hours": 361.5, "total_jobs": 415}}},
+    {"info": {"command": "get_version", "sequence_id": "3", "module": [
+        {"name": "ota", "sw_ver": "01.02.00.00"},
+        {"name": "printer", "sw_ver": "01.02.00.00",
+         "statistics": {"print_time": 362.1, "print_count": 416, "power_on_time": 1210.4}},
+    ]}},
+    {"system": {"command": "get_printer_info", "sequence_id": "4", "printer": {
+        "total_usage": {"print_hours": 362.4, "job_count": 417, "power_on_hours": 1211.0}}}},
+    {"pushing": {"command": "pushall", "print_stats": {"accumulated_time": 1305000, "total_jobs": 418}}},
+]
+
+def legacy_extract(data):
+    """Cadeia de ifs anterior (mesmos logs de debug), devolvendo o que seria gravado"""
+    power_on_hours = None
+    total_prints = None
+    print_hours = None
+
+    if 'print' in data:
+        print_data = data['print']
+        logger.debug(f"Encontrado nó 'print' nos dados MQTT")
+        if 'mc_remaining_time' in print_data:
+            logger.debug(f"Impressão em andamento, tempo restante: {print_data['mc_remaining_time']}")
+        if 'total_layer_num' in print_data:
+            total_layers = print_data.get('total_layer_num', 0)
+            logger.debug(f"Total de camadas: {total_layers}")
+        if 'gcode_state' in print_data:
+            gcode_state = print_data.get('gcode_state')
+            logger.debug(f"Estado da impressora: {gcode_state}")
+        if 'print_job' in print_data:
+            job_data = print_data.get('print_job', {})
+            logger.debug(f"Encontrados dados do trabalho de impressão: {job_data}")
+            if 'printed_time' in job_data:
+                printed_time = job_data.get('printed_time', 0)
+                logger.debug(f"Tempo impresso neste trabalho: {printed_time} segundos")
+        if 'statistics' in print_data:
+            stats_data = print_data.get('statistics', {})
+            logger.debug(f"Encontradas estatísticas em 'print': {stats_data}")
+            if 'total_time' in stats_data:
+                print_hours = float(stats_data.get('total_time', 0)) / 3600.0
+                logger.debug(f"Total de horas de impressão (print/statistics): {print_hours:.1f} horas")
+            if 'total_prints' in stats_data:
+                total_prints = int(stats_data.get('total_prints', 0))
+                logger.debug(f"Total de impressões realizadas (print/statistics): {total_prints}")
+        if 'command' in print_data and print_data['command'] == 'get_print_stats':
+            if 'stats' in print_data:
+                stats = print_data.get('stats', {})
+                logger.debug(f"Estatísticas de print/get_print_stats: {stats}")
+                if 'total_hours' in stats:
+                    print_hours = float(stats.get('total_hours', 0))
+                    logger.debug(f"Total de horas de impressão (get_print_stats): {print_hours:.1f} horas")
+                if 'total_jobs' in stats:
+                    total_prints = int(stats.get('total_jobs', 0))
+                    logger.debug(f"Total de trabalhos (get_print_stats): {total_prints}")
+
+    if 'info' in data:
+        info_data = data['info']
+        logger.debug(f"Encontrado nó 'info' nos dados MQTT")
+        if 'command' in info_data and info_data['command'] == 'get_version':
+            if 'module' in info_data:
+                for module in info_data.get('module', []):
+                    if module.get('name') == 'printer':
+                        logger.debug(f"Encontrado módulo printer em info/get_version: {module}")
+                        if 'statistics' in module:
+                            stats = module.get('statistics', {})
+                            logger.debug(f"Estatísticas em info/module/printer: {stats}")
+                            if 'print_time' in stats:
+                                print_hours = float(stats.get('print_time', 0))
+                                logger.debug(f"Tempo total de impressão (info/module/printer): {print_hours:.1f} horas")
+                            if 'print_count' in stats:
+                                total_prints = int(stats.get('print_count', 0))
+                                logger.debug(f"Número total de impressões (info/module/printer): {total_prints}")
+                            if 'power_on_time' in stats:
+                                power_on_hours = float(stats.get('power_on_time', 0))
+                                logger.debug(f"Tempo total ligada (info/module/printer): {power_on_hours:.1f} horas")
+
+    if 'system' in data:
+        system_data = data['system']
+        logger.debug(f"Encontrado nó 'system' nos dados MQTT")
+        if 'command' in system_data and system_data['command'] == 'get_printer_info':
+            if 'printer' in system_data:
+                printer_info = system_data.get('printer', {})
+                logger.debug(f"Encontradas informações da impressora em system/get_printer_info: {printer_info}")
+                if 'total_usage' in printer_info:
+                    usage_data = printer_info.get('total_usage', {})
+                    logger.debug(f"Dados de uso total em system/printer: {usage_data}")
+                    if 'print_hours' in usage_data:
+                        print_hours = float(usage_data.get('print_hours', 0))
+                        logger.debug(f"Horas totais de impressão (system/printer/total_usage): {print_hours:.1f} horas")
+                    if 'job_count' in usage_data:
+                        total_prints = int(usage_data.get('job_count', 0))
+                        logger.debug(f"Total de trabalhos (system/printer/total_usage): {total_prints}")
+                    if 'power_on_hours' in usage_data:
+                        power_on_hours = float(usage_data.get('power_on_hours', 0))
+                        logger.debug(f"Horas totais ligada (system/printer/total_usage): {power_on_hours:.1f} horas")
+
+    if 'pushing' in data:
+        pushing_data = data['pushing']
+        logger.debug(f"Encontrado nó 'pushing' nos dados MQTT")
+        if 'print_stats' in pushing_data:
+            stats = pushing_data.get('print_stats', {})
+            logger.debug(f"Estatísticas em pushing/print_stats: {stats}")
+            if 'accumulated_time' in stats:
+                print_hours = float(stats.get('accumulated_time', 0)) / 3600.0
+                logger.debug(f"Tempo acumulado de impressão (pushing/print_stats): {print_hours:.1f} horas")
+            if 'total_jobs' in stats:
+                total_prints = int(stats.get('total_jobs', 0))
+                logger.debug(f"Total de trabalhos (pushing/print_stats): {total_prints}")
+
+    update_data = {}
+    if power_on_hours is not None:
+        update_data['power_on_hours'] = float(power_on_hours)
+    if total_prints is not None:
+        update_data['prints'] = int(total_prints)
+    if print_hours is not None:
+        update_data['hours'] = float(print_hours)
+    return update_data
+
+def load_reports(path):
+    """Lê relatórios decodificados de um arquivo JSONL"""
+    with open(path, 'rb') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da extração de estatísticas da impressora")
+    parser.add_argument('reports', nargs='?', help="Arquivo JSONL com relatórios")
+    parser.add_argument('-n', '--number', type=int, default=20000, help="Repetições por relatório")
+    args = parser.parse_args()
+
+    if args.reports:
+        cases = {'arquivo': load_reports(args.reports)}
+    else:
+        cases = {'push_status': [SAMPLE_REPORT], 'estatísticas': STATS_REPORTS}
+
+    for name, reports in cases.items():
+        for report in reports:
+            expected, actual = legacy_extract(report), extract_stats(report)
+            if expected != actual:
+                raise SystemExit(f"Resultados diferentes em {name}: {expected} != {actual}")
+
+    print(f"{args.number} repetições por relatório")
+    print(f"{'relatórios':<16}{'legado (us/msg)':>18}{'tabela (us/msg)':>18}")
+    for name, reports in cases.items():
+        per_message = args.number * len(reports) / 1e6
+        legacy_time = timeit.timeit(lambda: [legacy_extract(r) for r in reports], number=args.number)
+        table_time = timeit.timeit(lambda: [extract_stats(r) for r in reports], number=args.number)
+        print(f"{name:<16}{legacy_time / per_message:>18.2f}{table_time / per_message:>18.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+import paho.mqtt.client as mqtt
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('command_queue')
+
+# Prioridades (menor sai primeiro)
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+# Tempo máximo (segundos) que um comando espera na fila pela conexão
+DEFAULT_TTL = 60
+
+# Máximo de comandos aguardando publicação
+QUEUE_SIZE = 50
+
+# Espera (segundos) antes de tentar de novo um publish recusado pelo cliente MQTT
+RETRY_DELAY = 1.0
+
+class CommandExpired(Exception):
+    """O comando não pôde ser publicado dentro do seu TTL"""
+
+class CommandQueueFull(Exception):
+    """A fila de comandos está cheia"""
+
+class _QueuedCommand:
+    """Comando aguardando publicação"""
+
+    __slots__ = ('command', 'sequence_id', 'payload', 'priority', 'order', 'ready_at',
+                 'expires_at', 'dedup_key', 'debounce', 'attempts', 'futures')
+
+    def __init__(self, command, sequence_id, payload, priority, order, ready_at, expires_at, dedup_key, debounce):
+        self.command = command
+        self.sequence_id = sequence_id
+        self.payload = payload
+        self.priority = priority
+        self.order = order
+        self.ready_at = ready_at
+        self.expires_at = expires_at
+        self.dedup_key = dedup_key
+        self.debounce = debounce
+        self.attempts = 0  # Publishes recusados pelo cliente MQTT
+        self.futures = []
+
+def _with_sequence_id(payload, sequence_id):
+    """Cópia do payload com o sequence_id de cada seção trocado pelo informado"""
+    return {section: dict(body, sequence_id=sequence_id) if isinstance(body, dict) and 'sequence_id' in body else body
+            for section, body in payload.items()}
+
+def _chain(source, targets):
+    """Repassa o resultado (ou a exceção) de um Future para outros"""
+    def copy_outcome(future):
+        error = future.exception()
+        for target in targets:
+            if error is None:
+                target.set_result(future.result())
+            else:
+                target.set_exception(error)
+    source.add_done_callback(copy_outcome)
+
+class CommandQueue:
+    """
+    Fila de saída dos comandos para a impressora.
+
+    Os comandos são publicados por uma thread própria, por ordem de
+    prioridade e de chegada, somente enquanto a conexão está ativa; com a
+    impressora desconectada ficam na fila (em memória) até reconectar ou
+    até vencer o TTL. Comandos com a mesma dedup_key ainda não publicados
+    são substituídos pelo mais recente, e debounce limita a chave a uma
+    publicação por janela: o primeiro valor sai na hora e os que chegam
+    dentro da janela são publicados ao fim dela, só o último (ex: arrastar
+    o controle do ventilador gera um publish a cada 300 ms com o valor
+    mais recente, e o valor final sempre é enviado).
+
+    Cada submit() devolve o sequence_id que será publicado e um Future
+    resolvido com a resposta da impressora (via CommandTracker) ou com
+    CommandExpired / CommandTimeout. Um comando que substitui outro pendente
+    herda o sequence_id dele, então todos os chamadores recebem um id que
+    a impressora vai ecoar.
+    """
+
+    def __init__(self, connection, tracker, max_size=QUEUE_SIZE):
+        """
+        Args:
+            connection (BambuConnection): Conexão usada para publicar
+            tracker (CommandTracker): Acompanha as respostas dos comandos publicados
+            max_size (int, optional): Máximo de comandos aguardando publicação
+        """
+        self._connection = connection
+        self._tracker = tracker
+        self.max_size = max_size
+        self._entries = []
+        self._ready = threading.Condition()
+        self._order = itertools.count()
+        self._last_sent = {}  # {dedup_key: instante do último publish}, para o debounce
+        self._published = 0
+        self._expired = 0
+        self._deduplicated = 0
+        self._retries = 0
+
+        # A reconexão acorda a thread para drenar a fila
+        connection.add_connect_listener(lambda _: self._wake())
+        self._worker = threading.Thread(target=self._drain_loop, name="command-queue")
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, command, sequence_id, payload, priority=PRIORITY_NORMAL, ttl=DEFAULT_TTL,
+               dedup_key=None, debounce=0):
+        """
+        Enfileira um comando
+
+        Args:
+            command (str): Nome do comando (logs e métricas)
+            sequence_id (str): sequence_id contido no payload
+            payload (dict): Mensagem a publicar em device/<id>/request
+            priority (int, optional): PRIORITY_HIGH, PRIORITY_NORMAL ou PRIORITY_LOW
+            ttl (float, optional): Segundos que o comando pode esperar pela publicação
+            dedup_key (str, optional): Comandos pendentes com a mesma chave são substituídos por este
+            debounce (float, optional): Intervalo mínimo (segundos) entre publicações da
+                mesma dedup_key; o valor mais recente é publicado ao fim da janela
+
+        Returns:
+            tuple: (sequence_id que será publicado - o do comando pendente substituído,
+                se houver -, Future resolvido com a seção ecoada pela impressora)
+
+        Raises:
+            CommandQueueFull: Se a fila estiver cheia
+        """
+        future = Future()
+        now = time.monotonic()
+        with self._ready:
+            entry = None
+            if dedup_key is not None:
+                entry = next((e for e in self._entries if e.dedup_key == dedup_key), None)
+            if entry is not None:
+                # Mantém o lugar, o instante de liberação e o sequence_id do pendente
+                # (já entregue aos chamadores anteriores); só o valor muda
+                entry.command, entry.payload = command, _with_sequence_id(payload, entry.sequence_id)
+                entry.priority = min(entry.priority, priority)
+                entry.expires_at = now + ttl
+                self._deduplicated += 1
+            else:
+                if len(self._entries) >= self.max_size:
+                    raise CommandQueueFull(f"Fila de comandos cheia ({self.max_size})")
+                ready_at = now
+                if debounce and dedup_key in self._last_sent:
+                    ready_at = max(now, self._last_sent[dedup_key] + debounce)
+                entry = _QueuedCommand(command, sequence_id, payload, priority, next(self._order),
+                                       ready_at, now + ttl, dedup_key, debounce)
+                self._entries.append(entry)
+            entry.futures.append(future)
+            self._ready.notify()
+            return entry.sequence_id, future
+
+    def _wake(self):
+        with self._ready:
+            self._ready.notify()
+
+    def _drain_loop(self):
+        """Thread que publica os comandos quando a conexão está ativa"""
+        while True:
+            with self._ready:
+                entry = self._next_entry()
+            self._publish(entry)
+
+    def _next_entry(self):
+        """Espera e retira o próximo comando a publicar (requer o lock)"""
+        while True:
+            now = time.monotonic()
+            for expired in [e for e in self._entries if e.expires_at <= now]:
+                self._entries.remove(expired)
+                self._expired += 1
+                reason = self._expiry_reason(expired)
+                logger.warning(f"Comando '{expired.command}' (seq: {expired.sequence_id}) expirou na fila: {reason}")
+                error = CommandExpired(f"Comando '{expired.command}' não enviado: {reason}")
+                for future in expired.futures:
+                    future.set_exception(error)
+
+            if self._connection.connected:
+                ready = [e for e in self._entries if e.ready_at <= now]
+                if ready:
+                    entry = min(ready, key=lambda e: (e.priority, e.order))
+                    self._entries.remove(entry)
+                    if entry.debounce:
+                        self._last_sent[entry.dedup_key] = now
+                    return entry
+
+            # Próximo instante em que algo muda: liberação (se conectado) ou expiração
+            deadlines = [e.expires_at for e in self._entries]
+            if self._connection.connected:
+                deadlines += [e.ready_at for e in self._entries]
+            self._ready.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+
+    def _expiry_reason(self, entry):
+        """Motivo legível de um comando ter vencido o TTL na fila"""
+        if not self._connection.connected:
+            return "impressora desconectada"
+        if entry.attempts:
+            return f"publish recusado pelo cliente MQTT ({entry.attempts} tentativa(s))"
+        return "fila de comandos ocupada"
+
+    def _publish(self, entry):
+        """Publica um comando; se o cliente recusar, devolve à fila para nova tentativa"""
+        ack = self._tracker.track(entry.sequence_id, entry.command)
+        try:
+            result = self._connection.publish(entry.payload, qos=1).rc
+        except Exception as e:
+            logger.error(f"Erro ao publicar comando '{entry.command}': {str(e)}")
+            result = mqtt.MQTT_ERR_UNKNOWN
+
+        if result == mqtt.MQTT_ERR_SUCCESS:
+            logger.info(f"Comando '{entry.command}' (seq: {entry.sequence_id}) publicado")
+            _chain(ack, entry.futures)
+            with self._ready:
+                self._published += 1
+            return
+
+        self._tracker.cancel(entry.sequence_id)
+        logger.warning(f"Publish do comando '{entry.command}' recusado (erro {result}), tentando novamente")
+        with self._ready:
+            self._retries += 1
+            entry.attempts += 1
+            entry.ready_at = time.monotonic() + RETRY_DELAY
+            # Um comando mais novo com a mesma chave pode ter chegado enquanto isso; ele segue
+            # com o próprio sequence_id e a resposta (com o id publicado) resolve os dois
+            newer = next((e for e in self._entries if entry.dedup_key is not None and e.dedup_key == entry.dedup_key), None)
+            if newer is not None:
+                newer.futures.extend(entry.futures)
+            else:
+                self._entries.append(entry)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Comandos na fila e contadores de publicados, expirados, substituídos e novas tentativas
+        """
+        with self._ready:
+            return {
+                'depth': len(self._entries),
+                'published': self._published,
+                'expired': self._expired,
+                'deduplicated': self._deduplicated,
+                'retries': self._retries,
+            }
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('command_tracker')
+
+# Tempo máximo (segundos) esperando a impressora ecoar o sequence_id
+COMMAND_TIMEOUT = 30
+
+# Limites superiores (ms) das faixas do histograma de latência
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Último sequence_id emitido; compartilhado por todos os pedidos à impressora
+# (comandos, pushall, consultas de estatísticas) para que as respostas não se confundam
+_sequence_id = int(time.time())
+_sequence_lock = threading.Lock()
+
+def next_sequence_id():
+    """
+    Gera o próximo sequence_id dos pedidos enviados à impressora (thread-safe)
+
+    Returns:
+        str: sequence_id (o MQTT da impressora espera string)
+    """
+    global _sequence_id
+    with _sequence_lock:
+        _sequence_id += 1
+        return str(_sequence_id)
+
+class CommandTimeout(Exception):
+    """A impressora não respondeu ao comando dentro do prazo"""
+
+def is_success(result):
+    """
+    True se o "result" ecoado pela impressora indica sucesso. Ausente conta
+    como sucesso; os comandos gcode_line respondem "SUCCESS" em maiúsculas.
+
+    Args:
+        result: Valor do campo "result" da resposta
+    """
+    return result is None or (isinstance(result, str) and result.lower() == 'success')
+
+class _LatencyStats:
+    """Histograma de latência e contadores de um tipo de comando"""
+
+    __slots__ = ('buckets', 'count', 'total_ms', 'max_ms', 'failed', 'timeouts')
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.failed = 0
+        self.timeouts = 0
+
+    def add(self, latency_ms):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def as_dict(self):
+        labels = [str(limit) for limit in LATENCY_BUCKETS_MS] + ['+Inf']
+        return {
+            'acked': self.count,
+            'failed': self.failed,
+            'timeouts': self.timeouts,
+            'latency_ms': {
+                'avg': round(self.total_ms / self.count, 1) if self.count else None,
+                'max': round(self.max_ms, 1),
+                # Contagem por faixa (não cumulativa): "500" = entre 250 e 500 ms
+                'buckets': dict(zip(labels, self.buckets)),
+            },
+        }
+
+class CommandTracker:
+    """
+    Acompanha os comandos enviados à impressora até a resposta.
+
+    A impressora responde a cada comando ecoando o mesmo sequence_id em
+    device/<id>/report (ex: {"print": {"command": "pause", "sequence_id": "12",
+    "result": "success"}}). track() devolve um Future resolvido com essa seção
+    ou com CommandTimeout; resolve() é registrado como consumidor dos
+    relatórios. A latência de cada resposta entra no histograma do comando.
+    """
+
+    def __init__(self, timeout=COMMAND_TIMEOUT):
+        """
+        Args:
+            timeout (float, optional): Prazo padrão (segundos) para a resposta
+        """
+        self.timeout = timeout
+        self._lock = threading.Condition()
+        self._pending = {}  # {sequence_id: (comando, Future, enviado_em, prazo)}
+        self._stats = {}
+        self._sweeper = None
+
+    def track(self, sequence_id, command, timeout=None):
+        """
+        Registra um comando. Deve ser chamado antes do publish: a resposta
+        pode chegar antes de o publish retornar.
+
+        Args:
+            sequence_id (str | int): sequence_id enviado no comando
+            command (str): Nome do comando (usado nas métricas)
+            timeout (float, optional): Prazo para a resposta (padrão: self.timeout)
+
+        Returns:
+            Future: Resolvido com a seção ecoada pela impressora; CommandTimeout se expirar
+        """
+        future = Future()
+        now = time.monotonic()
+        deadline = now + (timeout if timeout is not None else self.timeout)
+        with self._lock:
+            self._pending[str(sequence_id)] = (command, future, now, deadline)
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._expire_loop, name="command-tracker")
+                self._sweeper.daemon = True
+                self._sweeper.start()
+            self._lock.notify()
+        return future
+
+    def cancel(self, sequence_id):
+        """Descarta um comando que não chegou a ser publicado"""
+        with self._lock:
+            entry = self._pending.pop(str(sequence_id), None)
+        if entry:
+            entry[1].cancel()
+
+    def resolve(self, payload):
+        """
+        Resolve os comandos cujo sequence_id foi ecoado em um relatório
+
+        Args:
+            payload (dict): Relatório decodificado de device/<id>/report
+        """
+        resolved = []
+        with self._lock:
+            if not self._pending:
+                return
+            now = time.monotonic()
+            for section in payload.values():
+                # Os relatórios periódicos (push_status) têm sequence_id próprio e não são respostas
+                if not isinstance(section, dict) or section.get('command') in (None, 'push_status'):
+                    continue
+                entry = self._pending.pop(str(section.get('sequence_id')), None)
+                if entry is None:
+                    continue
+                command, future, sent_at, _ = entry
+                stats = self._stats_for(command)
+                stats.add((now - sent_at) * 1000)
+                if not is_success(section.get('result')):
+                    stats.failed += 1
+                resolved.append((future, section))
+
+        for future, section in resolved:
+            future.set_result(section)
+
+    def _stats_for(self, command):
+        stats = self._stats.get(command)
+        if stats is None:
+            stats = self._stats[command] = _LatencyStats()
+        return stats
+
+    def _expire_loop(self):
+        """Thread que expira os comandos sem resposta no prazo"""
+        while True:
+            with self._lock:
+                while True:
+                    now = time.monotonic()
+                    expired = [(sequence_id, entry) for sequence_id, entry in self._pending.items() if entry[3] <= now]
+                    if expired:
+                        break
+                    next_deadline = min((entry[3] for entry in self._pending.values()), default=None)
+                    # track() acorda esta espera quando um novo comando é registrado
+                    self._lock.wait(None if next_deadline is None else next_deadline - now)
+                for sequence_id, (command, _, _, _) in expired:
+                    del self._pending[sequence_id]
+                    self._stats_for(command).timeouts += 1
+
+            for sequence_id, (command, future, _, _) in expired:
+                logger.warning(f"Comando '{command}' (seq: {sequence_id}) sem resposta da impressora")
+                future.set_exception(CommandTimeout(f"Sem resposta para o comando '{command}' (seq: {sequence_id})"))
+
+    def stats(self):
+        """
+        Returns:
+            dict: Comandos pendentes e, por comando, respostas, falhas, timeouts e latência
+        """
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'commands': {command: stats.as_dict() for command, stats in self._stats.items()},
+            }
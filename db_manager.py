@@ -462,6 +462,32 @@ class SensorManager:
         finally:
             session.close()
     
+    @staticmethod
+    def record_sensor_batch(rows):
+        """
+        Registra várias leituras de sensores em uma única transação (executemany)
+        
+        Args:
+            rows (list): Dicionários com as colunas de SensorData (source, timestamp,
+                temperature, humidity, ams_slot, ams_filament_type, ams_filament_remaining)
+            
+        Returns:
+            int: Número de leituras gravadas (0 se falhou)
+        """
+        if not rows:
+            return 0
+        session = get_session()
+        try:
+            session.execute(SensorData.__table__.insert(), rows)
+            session.commit()
+            return len(rows)
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Erro ao registrar lote de dados de sensores: {str(e)}")
+            return 0
+        finally:
+            session.close()
+    
     @staticmethod
     def get_recent_sensor_data(source=None, limit=100):
         """
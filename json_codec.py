@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Codificação/decodificação JSON usada nos caminhos mais frequentes
+(relatórios MQTT da impressora, /status e respostas do Flask).
+
+Usa orjson ou msgspec quando instalados e recorre ao módulo json da
+biblioteca padrão caso contrário. A API é sempre a mesma:
+
+    loads(bytes ou str) -> objeto   (json.JSONDecodeError se o JSON for inválido)
+    dumps(objeto) -> bytes          (UTF-8, sem espaços)
+"""
+
+import json
+import logging
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('json_codec')
+
+try:
+    import orjson
+    BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    try:
+        import msgspec
+        BACKEND = 'msgspec'
+    except ImportError:
+        msgspec = None
+        BACKEND = 'json'
+
+if BACKEND == 'orjson':
+    # Datas passam pela função default, como no json da biblioteca padrão
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+    def loads(data):
+        """Decodifica JSON a partir de bytes (sem str intermediária) ou str"""
+        return orjson.loads(data)
+
+    def dumps(obj, default=None):
+        """Codifica um objeto em JSON (bytes UTF-8)"""
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+elif BACKEND == 'msgspec':
+    _decoder = msgspec.json.Decoder()
+    _encoders = {None: msgspec.json.Encoder()}
+
+    def loads(data):
+        """Decodifica JSON a partir de bytes (sem str intermediária) ou str"""
+        try:
+            return _decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Mantém o mesmo tipo de exceção dos outros backends
+            raise json.JSONDecodeError(str(e), '', 0) from e
+
+    def dumps(obj, default=None):
+        """Codifica um objeto em JSON (bytes UTF-8)"""
+        encoder = _encoders.get(default)
+        if encoder is None:
+            encoder = _encoders[default] = msgspec.json.Encoder(enc_hook=default)
+        return encoder.encode(obj)
+
+else:
+    def loads(data):
+        """Decodifica JSON a partir de bytes ou str"""
+        # json.loads detecta a codificação de bytes (UTF-8/16/32) sozinho
+        return json.loads(data)
+
+    def dumps(obj, default=None):
+        """Codifica um objeto em JSON (bytes UTF-8)"""
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+logger.info(f"Codec JSON: {BACKEND}")
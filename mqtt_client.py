@@ -8,7 +8,9 @@ from datetime import datetime
 import threading
 import paho.mqtt.client as mqtt
 
-from db_manager import SensorManager
+from reconnect_supervisor import ReconnectSupervisor
+from sensor_cache import sensor_cache
+from sensor_writer import sensor_writer
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO, 
@@ -73,25 +75,30 @@ class MQTTClient:
         self.last_data = {}
         self.last_data_time = {}
         
-        # Thread para o loop MQTT
-        self.thread = None
+        # Loop MQTT e reconexão com backoff (disparada pelo on_disconnect)
+        self.supervisor = ReconnectSupervisor('esp32', self.client)
+        
+        # Estado consolidado de cada caixa ({box_number: {temperature, humidity, remaining_g, weight}}),
+        # base de cada nova linha de SensorData; semeado do sensor_cache, sem consultar o banco por mensagem
+        self.box_state = {}
+        
+        # Callback chamado após registrar novas leituras de uma caixa
+        self.update_callback = None
     
     def start(self):
         """
         Inicia o cliente MQTT e a thread do loop
         
         Returns:
-            bool: True se iniciado com sucesso
+            bool: True se conectado em até 10 segundos (senão segue tentando em segundo plano)
         """
         try:
             self.running = True
+            # Semente do estado das caixas: uma única leitura do banco (o app normalmente já carregou)
+            if not sensor_cache.loaded:
+                sensor_cache.load_from_db()
             logger.info(f"Conectando ao servidor MQTT em {self.host}:{self.port}")
-            self.client.connect_async(self.host, self.port, 60)
-            
-            # Iniciar o loop em uma thread separada
-            self.thread = threading.Thread(target=self._run_loop)
-            self.thread.daemon = True
-            self.thread.start()
+            self.supervisor.start(self.host, self.port, 60)
             
             # Esperar pela conexão (com timeout)
             timeout = 10  # segundos
@@ -100,7 +107,7 @@ class MQTTClient:
                 time.sleep(0.1)
             
             if not self.connected:
-                logger.warning("Timeout ao conectar ao servidor MQTT")
+                logger.warning("Timeout ao conectar ao servidor MQTT, tentando novamente em segundo plano")
                 return False
                 
             return True
@@ -114,32 +121,7 @@ class MQTTClient:
         Interrompe o cliente MQTT e a thread do loop
         """
         self.running = False
-        if self.client.is_connected():
-            self.client.disconnect()
-        
-        if self.thread and self.thread.is_alive():
-            self.thread.join(timeout=2.0)
-    
-    def _run_loop(self):
-        """
-        Executa o loop MQTT em uma thread separada
-        """
-        # Usar loop_start em vez de loop_forever para melhor controle
-        self.client.loop_start()
-        
-        while self.running:
-            # Verificar se a conexão está ativa
-            if not self.client.is_connected():
-                logger.warning("Conexão MQTT perdida, tentando reconectar...")
-                try:
-                    self.client.reconnect()
-                except Exception as e:
-                    logger.error(f"Falha ao reconectar: {str(e)}")
-                    time.sleep(5)  # Esperar antes de tentar novamente
-            
-            time.sleep(1)  # Evitar uso excessivo da CPU
-        
-        self.client.loop_stop()
+        self.supervisor.stop()
     
     def on_connect(self, client, userdata, flags, rc):
         """
@@ -153,6 +135,7 @@ class MQTTClient:
         """
         if rc == 0:
             self.connected = True
+            self.supervisor.connection_established()
             logger.info("Conectado ao servidor MQTT")
             
             # Subscrever aos tópicos relevantes
@@ -173,6 +156,7 @@ class MQTTClient:
             rc: Código de retorno da desconexão
         """
         self.connected = False
+        self.supervisor.connection_lost(rc)
         if rc != 0:
             logger.warning(f"Desconexão inesperada do MQTT, código {rc}")
     
@@ -228,19 +212,11 @@ class MQTTClient:
                 source = f"ESP32_Box{box_number}"
                 ams_slot = box_number - 1  # Converte para base 0
                 
-                # Obter dados recentes para esta fonte/slot para manter outros valores
-                recent_data = SensorManager.get_recent_sensor_data(source=source, limit=1)
-                
-                # Valores padrão
-                temperature = None
-                humidity = None
-                ams_filament_remaining = None
-                
-                # Se houver dados recentes, usar como base
-                if recent_data and len(recent_data) > 0:
-                    temperature = recent_data[0].temperature
-                    humidity = recent_data[0].humidity
-                    ams_filament_remaining = recent_data[0].ams_filament_remaining
+                # Valores atuais da caixa, mantidos em memória
+                state = self._box_state(box_number)
+                temperature = state.get('temperature')
+                humidity = state.get('humidity')
+                ams_filament_remaining = state.get('remaining_g')
                 
                 # Atualizar o valor específico
                 if metric == 'temperature':
@@ -259,7 +235,7 @@ class MQTTClient:
                         ams_filament_remaining = value
                     elif metric == 'remaining_percent' and ams_filament_remaining is None:
                         # Tentativa de calcular gramas baseado na porcentagem e no peso padrão
-                        last_weight = self.last_data.get(f"filament/box/{box_number}/total_weight")
+                        last_weight = state.get('weight')
                         if last_weight:
                             try:
                                 filament_total = float(last_weight)
@@ -277,14 +253,27 @@ class MQTTClient:
                             ams_filament_remaining = (float(value) / 100.0) * filament_max
                             print(f">>> Filament Box {box_number}: Estimando restante com peso padrão: {value}% de 1000g = {ams_filament_remaining}g", flush=True)
                 
-                # Registrar dados consolidados
-                SensorManager.record_sensor_data(
+                # Atualizar o estado da caixa
+                if metric == 'total_weight':
+                    state['weight'] = value
+                state.update(temperature=temperature, humidity=humidity, remaining_g=ams_filament_remaining)
+                
+                # Registrar dados consolidados (gravados em lote pelo sensor_writer)
+                sensor_writer.add(
                     source=source,
                     temperature=temperature,
                     humidity=humidity,
                     ams_slot=ams_slot,
                     ams_filament_remaining=ams_filament_remaining
                 )
+                # Atualiza o cache lido pelo /status e avisa apenas se algo mudou
+                if sensor_cache.update(
+                    box_number,
+                    temperature=temperature,
+                    humidity=humidity,
+                    remaining_g=ams_filament_remaining
+                ):
+                    self._notify_update(source)
                 
             # Processar no formato do ESP32 (filament_monitor/medida/N)
             elif len(parts) >= 3 and parts[0] == 'filament_monitor':
@@ -298,19 +287,11 @@ class MQTTClient:
                 source = f"ESP32_Box{box_number}"
                 ams_slot = box_number - 1  # Converte para base 0
                 
-                # Obter dados recentes para esta fonte/slot para manter outros valores
-                recent_data = SensorManager.get_recent_sensor_data(source=source, limit=1)
-                
-                # Valores padrão
-                temperature = None
-                humidity = None
-                ams_filament_remaining = None
-                
-                # Se houver dados recentes, usar como base
-                if recent_data and len(recent_data) > 0:
-                    temperature = recent_data[0].temperature
-                    humidity = recent_data[0].humidity
-                    ams_filament_remaining = recent_data[0].ams_filament_remaining
+                # Valores atuais da caixa, mantidos em memória
+                state = self._box_state(box_number)
+                temperature = state.get('temperature')
+                humidity = state.get('humidity')
+                ams_filament_remaining = state.get('remaining_g')
                 
                 # Atualizar o valor específico
                 if metric == 'temperature':
@@ -330,7 +311,7 @@ class MQTTClient:
                         ams_filament_remaining = value
                     elif metric == 'remaining_percentage' and ams_filament_remaining is None:
                         # Tentativa de calcular gramas baseado na porcentagem e no peso padrão
-                        last_weight = self.last_data.get(f"filament_monitor/weight/{box_number}")
+                        last_weight = state.get('weight')
                         if last_weight:
                             try:
                                 filament_total = float(last_weight)
@@ -348,14 +329,27 @@ class MQTTClient:
                             ams_filament_remaining = (float(value) / 100.0) * filament_max
                             print(f">>> ESP32 Box {box_number}: Estimando restante com peso padrão: {value}% de 1000g = {ams_filament_remaining}g", flush=True)
                 
-                # Registrar dados consolidados
-                SensorManager.record_sensor_data(
+                # Atualizar o estado da caixa
+                if metric == 'weight':
+                    state['weight'] = value
+                state.update(temperature=temperature, humidity=humidity, remaining_g=ams_filament_remaining)
+                
+                # Registrar dados consolidados (gravados em lote pelo sensor_writer)
+                sensor_writer.add(
                     source=source,
                     temperature=temperature,
                     humidity=humidity,
                     ams_slot=ams_slot,
                     ams_filament_remaining=ams_filament_remaining
                 )
+                # Atualiza o cache lido pelo /status e avisa apenas se algo mudou
+                if sensor_cache.update(
+                    box_number,
+                    temperature=temperature,
+                    humidity=humidity,
+                    remaining_g=ams_filament_remaining
+                ):
+                    self._notify_update(source)
                 
             # Processar mensagens de status do ESP32
             elif topic == 'filament_monitor/status':
@@ -371,6 +365,44 @@ class MQTTClient:
         except Exception as e:
             logger.error(f"Erro ao processar tópico {topic}: {str(e)}")
     
+    def _box_state(self, box_number):
+        """
+        Estado consolidado de uma caixa, semeado do sensor_cache na primeira mensagem
+        
+        Args:
+            box_number (int): Número da caixa (base 1)
+            
+        Returns:
+            dict: Estado mutável da caixa (temperature, humidity, remaining_g, weight)
+        """
+        state = self.box_state.get(box_number)
+        if state is None:
+            state = self.box_state[box_number] = sensor_cache.get(box_number)
+        return state
+    
+    def _notify_update(self, source):
+        """
+        Notifica o callback de atualização, se definido
+        
+        Args:
+            source (str): Fonte cujas leituras mudaram (ex: "ESP32_Box1")
+        """
+        if self.update_callback:
+            try:
+                self.update_callback(source)
+            except Exception as e:
+                logger.error(f"Erro no callback de atualização: {str(e)}")
+    
+    def set_update_callback(self, callback):
+        """
+        Define o callback chamado após registrar novas leituras dos sensores
+        
+        Args:
+            callback: Função que recebe a fonte (ex: "ESP32_Box1") que foi atualizada
+        """
+        self.update_callback = callback
+        logger.info("Callback de atualização definido")
+    
     def publish(self, topic, message):
         """
         Publica uma mensagem em um tópico
@@ -476,11 +508,10 @@ def init_mqtt_client(config=None):
         
         if mqtt_client.start():
             logger.info("Cliente MQTT iniciado com sucesso")
-            return mqtt_client
         else:
-            logger.error("Falha ao iniciar cliente MQTT")
-            mqtt_client = None
-            return None
+            # O supervisor continua tentando; as leituras chegam quando o broker voltar
+            logger.warning("Cliente MQTT ainda não conectado, reconexão em segundo plano")
+        return mqtt_client
             
     except Exception as e:
         logger.error(f"Erro ao inicializar cliente MQTT: {str(e)}")
@@ -508,6 +539,8 @@ def shutdown_mqtt_client():
         mqtt_client.stop()
         mqtt_client = None
         logger.info("Cliente MQTT desligado")
+    # Grava as leituras que ainda estão no buffer
+    sensor_writer.flush()
 
 if __name__ == "__main__":
     # Teste simples
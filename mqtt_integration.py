@@ -1,50 +1,113 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import heapq
 import json
 import logging
 import threading
 import time
-import ssl
-from datetime import datetime, timedelta
 
 from mqtt_client import init_mqtt_client, get_mqtt_client
 from db_manager import SensorManager
+from background_tasks import db_executor
+from async_engine import get_engine
+from printer_stats import extract_stats
+from printer_events import event_bus, JOB_STARTED, JOB_RESUMED, JOB_END_EVENTS
+from command_tracker import next_sequence_id
 
 # Configuração do logger
 logging.basicConfig(level=logging.INFO, 
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('mqtt_integration')
 
+# Espera (segundos) da primeira consulta de estatísticas depois de conectar
+STATS_POLL_ON_CONNECT = 10
+
+# Espera depois do fim de um trabalho (a impressora atualiza os totais ao terminar)
+STATS_POLL_AFTER_JOB = 60
+
+# Intervalo entre consultas logo depois de uma mudança; dobra enquanto nada muda
+STATS_POLL_MIN_INTERVAL = 300
+
+# Limite do intervalo durante uma impressão e com a impressora ociosa
+STATS_POLL_PRINTING_MAX = 1800
+STATS_POLL_MAX_INTERVAL = 6 * 3600
+
+# Solicitações que trazem estatísticas: (seção, comando)
+STATS_REQUESTS = (
+    ('pushing', 'pushall'),
+    ('info', 'get_version'),
+    ('system', 'get_printer_info'),
+    ('print', 'get_print_stats'),
+)
+
+# Intervalo (segundos) da verificação do ESP32
+ESP32_CHECK_INTERVAL = 300
+
 class MQTTIntegration:
     """
     Classe para integrar o cliente MQTT com a aplicação Flask
     """
     
-    def __init__(self, config=None):
+    def __init__(self, config=None, connection=None):
         """
         Inicializa a integração MQTT
         
         Args:
             config (dict, optional): Configuração MQTT ou None para usar config.json
+            connection (BambuConnection, optional): Conexão compartilhada com a impressora.
+                Se None, uma conexão própria é criada a partir da configuração.
         """
         self.client = None
         self.config = config
         self.thread = None
         self.running = False
-        self.last_data_check = datetime.now()
-        self.bambu_client = None
-        self.bambu_connected = False
-        self.update_callback = None  # Callback para atualizar printer_status
+        self.connection = connection
+        self.update_callback = None  # Callback opcional chamado com cada relatório da impressora
+        
+        # Tarefas de _monitoring_loop: heap de (prazo, nome) e prazo vigente de cada uma
+        self._tasks = []
+        self._task_deadlines = {}
+        self._schedule = threading.Condition()
+        # Com o motor asyncio, as tarefas são timers do event loop em vez da thread
+        self._engine = get_engine()
+        self._timers = {}
+        
+        # Estado da consulta adaptativa de estatísticas
+        self._stats_lock = threading.Lock()
+        self._stats_interval = STATS_POLL_MIN_INTERVAL
+        self._stats_changed = False
+        self._last_stats = {}
+        self._stats_fields_pushed = set()  # Totais recebidos sem solicitação desde a última rodada
+        self._answered_at = {command: None for _, command in STATS_REQUESTS}
+        self._own_requests = frozenset()
+        self._last_poll_at = None
+        self._printing = False
+        self._polls = 0
+        self._requests_sent = 0
+        self._requests_skipped = 0
         
         # Tenta inicializar cliente MQTT
         self.init_client()
-        # Tenta inicializar cliente MQTT da Bambu Lab
+        # Passa a receber os relatórios da impressora Bambu Lab
         self.init_bambu_client()
+        # Início e fim dos trabalhos antecipam a consulta de estatísticas
+        event_bus.subscribe((JOB_STARTED, JOB_RESUMED) + tuple(JOB_END_EVENTS), self._on_job_event,
+                            name='consulta_estatisticas')
         
         # Inicia o monitoramento
         self.start_monitoring()
     
+    @property
+    def bambu_client(self):
+        """Cliente MQTT da conexão com a impressora (ou None)"""
+        return self.connection.client if self.connection else None
+    
+    @property
+    def bambu_connected(self):
+        """True se a conexão com a impressora está ativa"""
+        return self.connection is not None and self.connection.connected
+    
     def init_client(self):
         """
         Inicializa o cliente MQTT
@@ -61,122 +124,53 @@ class MQTTIntegration:
     
     def init_bambu_client(self):
         """
-        Inicializa o cliente MQTT para a impressora Bambu Lab
+        Registra o processamento de estatísticas como consumidor da conexão com a
+        impressora Bambu Lab, criando a conexão se nenhuma foi fornecida
         
         Returns:
             bool: True se inicializado com sucesso
         """
         try:
-            # Carregar configuração
-            if self.config is None:
-                try:
-                    with open('config.json', 'r') as f:
-                        self.config = json.load(f)
-                except Exception as e:
-                    logger.error(f"Erro ao carregar configuração para Bambu MQTT: {str(e)}")
+            if self.connection is None:
+                # Carregar configuração
+                if self.config is None:
+                    try:
+                        with open('config.json', 'r') as f:
+                            self.config = json.load(f)
+                    except Exception as e:
+                        logger.error(f"Erro ao carregar configuração para Bambu MQTT: {str(e)}")
+                        return False
+                
+                # Obter configurações da impressora Bambu
+                printer_ip = self.config.get('PRINTER_IP')
+                access_code = self.config.get('ACCESS_CODE')
+                device_id = self.config.get('DEVICE_ID')
+                
+                if not printer_ip or not access_code or not device_id:
+                    logger.error("Configuração incompleta para Bambu MQTT")
                     return False
+                
+                from bambu_connection import BambuConnection
+                self.connection = BambuConnection(printer_ip, access_code, device_id)
+                self.connection.add_consumer(self._process_bambu_data, name='estatisticas')
+                # Cada (re)conexão agenda uma consulta de estatísticas
+                self.connection.add_connect_listener(self._on_bambu_connect)
+                self.connection.start()
+                logger.info(f"Conexão MQTT Bambu própria inicializada para {printer_ip}")
+            else:
+                self.connection.add_consumer(self._process_bambu_data, name='estatisticas')
+                self.connection.add_connect_listener(self._on_bambu_connect)
+                logger.info("Integração registrada na conexão MQTT Bambu compartilhada")
             
-            import paho.mqtt.client as mqtt
-            
-            # Obter configurações da impressora Bambu
-            printer_ip = self.config.get('PRINTER_IP')
-            access_code = self.config.get('ACCESS_CODE')
-            device_id = self.config.get('DEVICE_ID')
-            
-            if not printer_ip or not access_code or not device_id:
-                logger.error("Configuração incompleta para Bambu MQTT")
-                return False
-            
-            # Criar cliente MQTT para Bambu
-            self.bambu_client = mqtt.Client()
-            self.bambu_client.on_connect = self._on_bambu_connect
-            self.bambu_client.on_message = self._on_bambu_message
-            self.bambu_client.on_disconnect = self._on_bambu_disconnect
-            
-            # Configurar autenticação e TLS
-            self.bambu_client.username_pw_set("bblp", access_code)
-            self.bambu_client.tls_set(tls_version=ssl.PROTOCOL_TLS_CLIENT, cert_reqs=ssl.CERT_NONE)
-            self.bambu_client.tls_insecure_set(True)
-            
-            # Tópicos e informações da Bambu
-            self.bambu_topic_report = f"device/{device_id}/report"
-            self.bambu_topic_request = f"device/{device_id}/request"
-            
-            # Conectar ao broker Bambu em uma thread separada
-            import threading
-            bambu_thread = threading.Thread(target=self._bambu_connect_thread, args=(printer_ip,))
-            bambu_thread.daemon = True
-            bambu_thread.start()
-            
-            logger.info(f"Cliente MQTT Bambu inicializado para {printer_ip}")
+            # Tópicos da Bambu
+            self.bambu_topic_report = self.connection.topic_report
+            self.bambu_topic_request = self.connection.topic_request
             return True
             
         except Exception as e:
             logger.error(f"Erro ao inicializar cliente MQTT Bambu: {str(e)}")
             return False
     
-    def _bambu_connect_thread(self, printer_ip):
-        """Thread para conectar ao broker MQTT da Bambu"""
-        try:
-            # Porta MQTT padrão da Bambu
-            mqtt_port = 8883
-            
-            # Configuração do cliente MQTT
-            logger.info(f"Conectando ao broker MQTT da Bambu em {printer_ip}:{mqtt_port}")
-            
-            # Conectar ao broker
-            self.bambu_client.connect(printer_ip, mqtt_port, 60)
-            
-            # Iniciar loop em segundo plano
-            self.bambu_client.loop_forever()
-        except Exception as e:
-            logger.error(f"Erro na thread de conexão Bambu: {e}")
-            print(f"<<< ERRO Thread Bambu: {str(e)}", flush=True)
-            self.bambu_connected = False
-    
-    def _on_bambu_connect(self, client, userdata, flags, rc):
-        """Callback quando conectado ao broker Bambu"""
-        if rc == 0:
-            logger.info("Conectado ao broker MQTT da Bambu")
-            self.bambu_connected = True
-            # Inscrever-se no tópico de relatórios
-            client.subscribe(self.bambu_topic_report)
-        else:
-            logger.error(f"Falha ao conectar ao broker MQTT da Bambu, código {rc}")
-            self.bambu_connected = False
-    
-    def _on_bambu_disconnect(self, client, userdata, rc):
-        """Callback quando desconectado do broker Bambu"""
-        self.bambu_connected = False
-        logger.warning(f"Desconectado do broker MQTT da Bambu, código {rc}")
-    
-    def _on_bambu_message(self, client, userdata, msg):
-        """
-        Callback quando uma mensagem é recebida do broker Bambu
-        
-        Args:
-            client: Cliente MQTT
-            userdata: Dados do usuário
-            msg: Mensagem MQTT recebida
-        """
-        try:
-            # Log detalhado para debug
-            print(f"<<< Recebida mensagem no tópico Bambu: {msg.topic}", flush=True)
-            print(f"<<< Tamanho do payload Bambu: {len(msg.payload)} bytes", flush=True)
-            
-            # Se for o tópico de report, processa os dados
-            if msg.topic == self.bambu_topic_report:
-                data = json.loads(msg.payload)
-                # Processa apenas os dados JSON válidos
-                logger.info(f"Recebida mensagem Bambu em: {msg.topic} ({len(msg.payload)} bytes)")
-                self._process_bambu_data(data)
-        except json.JSONDecodeError:
-            logger.warning(f"Recebida mensagem Bambu com JSON inválido: {msg.payload}")
-            print(f"<<< ERRO: JSON inválido no payload Bambu", flush=True)
-        except Exception as e:
-            logger.error(f"Erro ao processar mensagem Bambu: {str(e)}")
-            print(f"<<< ERRO ao processar mensagem Bambu: {str(e)}", flush=True)
-    
     def _process_bambu_data(self, data):
         """
         Processa dados recebidos da impressora Bambu e atualiza o banco de dados
@@ -185,189 +179,99 @@ class MQTTIntegration:
             data (dict): Dados recebidos via MQTT
         """
         try:
-            # Log do payload completo para debug
-            logger.debug(f"Dados recebidos da Bambu: {json.dumps(data, indent=2)}")
+            # Log do payload completo para debug (só formata se o nível DEBUG estiver ativo)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Dados recebidos da Bambu: {json.dumps(data, indent=2)}")
             
-            # Atualizar o objeto printer_status global via callback
+            # Callback opcional (o status da aplicação é um consumidor próprio da conexão)
             if self.update_callback:
                 try:
                     self.update_callback(data)
-                    logger.info(f"Atualizado printer_status via callback com dados da Bambu: {list(data.keys())}")
-                    print(f"<<< Atualizado printer_status via callback com: {list(data.keys())}", flush=True)
                 except Exception as e:
                     logger.error(f"Erro ao chamar callback de atualização: {str(e)}")
-                    print(f"<<< ERRO no callback de atualização: {str(e)}", flush=True)
-            else:
-                logger.warning("Nenhum callback de atualização definido")
-                print("<<< AVISO: Nenhum callback de atualização definido", flush=True)
-            
-            # Inicializar valores de estatísticas
-            power_on_hours = None
-            total_prints = None
-            print_hours = None
             
-            # Verificar se há dados de print na mensagem
-            if 'print' in data:
-                print_data = data['print']
-                logger.debug(f"Encontrado nó 'print' nos dados MQTT")
-                
-                # Extrair informações relevantes
-                if 'mc_remaining_time' in print_data:
-                    logger.debug(f"Impressão em andamento, tempo restante: {print_data['mc_remaining_time']}")
-                
-                # Verificar dados de impressão total
-                if 'total_layer_num' in print_data:
-                    total_layers = print_data.get('total_layer_num', 0)
-                    logger.debug(f"Total de camadas: {total_layers}")
-                
-                # Verificar se há informações de estatísticas da impressora
-                if 'gcode_state' in print_data:
-                    gcode_state = print_data.get('gcode_state')
-                    logger.debug(f"Estado da impressora: {gcode_state}")
-                    
-                # Extrair estatísticas se disponíveis
-                if 'print_job' in print_data:
-                    job_data = print_data.get('print_job', {})
-                    logger.debug(f"Encontrados dados do trabalho de impressão: {job_data}")
-                    if 'printed_time' in job_data:
-                        # Tempo já impresso no trabalho atual (em segundos)
-                        printed_time = job_data.get('printed_time', 0)
-                        logger.debug(f"Tempo impresso neste trabalho: {printed_time} segundos")
-                        
-                # Verificar estatísticas históricas
-                if 'statistics' in print_data:
-                    stats_data = print_data.get('statistics', {})
-                    logger.debug(f"Encontradas estatísticas em 'print': {stats_data}")
-                    if 'total_time' in stats_data:
-                        # Total de tempo de impressão (em horas)
-                        print_hours = float(stats_data.get('total_time', 0)) / 3600.0
-                        logger.info(f"Total de horas de impressão (print/statistics): {print_hours:.1f} horas")
-                    if 'total_prints' in stats_data:
-                        # Total de impressões realizadas
-                        total_prints = int(stats_data.get('total_prints', 0))
-                        logger.info(f"Total de impressões realizadas (print/statistics): {total_prints}")
-                
-                # Verificar comando específico get_print_stats
-                if 'command' in print_data and print_data['command'] == 'get_print_stats':
-                    if 'stats' in print_data:
-                        stats = print_data.get('stats', {})
-                        logger.debug(f"Estatísticas de print/get_print_stats: {stats}")
-                        if 'total_hours' in stats:
-                            print_hours = float(stats.get('total_hours', 0))
-                            logger.info(f"Total de horas de impressão (get_print_stats): {print_hours:.1f} horas")
-                        if 'total_jobs' in stats:
-                            total_prints = int(stats.get('total_jobs', 0))
-                            logger.info(f"Total de trabalhos (get_print_stats): {total_prints}")
-            
-            # Verificar se há dados de info na mensagem
-            if 'info' in data:
-                info_data = data['info']
-                logger.debug(f"Encontrado nó 'info' nos dados MQTT")
-                
-                # Extrair informações de versão e outros dados da impressora
-                if 'command' in info_data and info_data['command'] == 'get_version':
-                    if 'module' in info_data:
-                        modules = info_data.get('module', [])
-                        for module in modules:
-                            if module.get('name') == 'printer':
-                                logger.debug(f"Encontrado módulo printer em info/get_version: {module}")
-                                # Extrair estatísticas do módulo printer se disponíveis
-                                if 'statistics' in module:
-                                    stats = module.get('statistics', {})
-                                    logger.debug(f"Estatísticas em info/module/printer: {stats}")
-                                    if 'print_time' in stats:
-                                        # Tempo total de impressão (em horas)
-                                        print_hours = float(stats.get('print_time', 0))
-                                        logger.info(f"Tempo total de impressão (info/module/printer): {print_hours:.1f} horas")
-                                    if 'print_count' in stats:
-                                        # Número total de impressões concluídas
-                                        total_prints = int(stats.get('print_count', 0))
-                                        logger.info(f"Número total de impressões (info/module/printer): {total_prints}")
-                                    if 'power_on_time' in stats:
-                                        # Tempo total ligada (em horas)
-                                        power_on_hours = float(stats.get('power_on_time', 0))
-                                        logger.info(f"Tempo total ligada (info/module/printer): {power_on_hours:.1f} horas")
-            
-            # Verificar se há dados de system na mensagem
-            if 'system' in data:
-                system_data = data['system']
-                logger.debug(f"Encontrado nó 'system' nos dados MQTT")
-                
-                # Extrair informações do sistema
-                if 'command' in system_data and system_data['command'] == 'get_printer_info':
-                    if 'printer' in system_data:
-                        printer_info = system_data.get('printer', {})
-                        logger.debug(f"Encontradas informações da impressora em system/get_printer_info: {printer_info}")
-                        if 'total_usage' in printer_info:
-                            usage_data = printer_info.get('total_usage', {})
-                            logger.debug(f"Dados de uso total em system/printer: {usage_data}")
-                            if 'print_hours' in usage_data:
-                                # Horas totais de impressão
-                                print_hours = float(usage_data.get('print_hours', 0))
-                                logger.info(f"Horas totais de impressão (system/printer/total_usage): {print_hours:.1f} horas")
-                            if 'job_count' in usage_data:
-                                # Contagem total de trabalhos de impressão
-                                total_prints = int(usage_data.get('job_count', 0))
-                                logger.info(f"Total de trabalhos (system/printer/total_usage): {total_prints}")
-                            if 'power_on_hours' in usage_data:
-                                # Horas totais ligada
-                                power_on_hours = float(usage_data.get('power_on_hours', 0))
-                                logger.info(f"Horas totais ligada (system/printer/total_usage): {power_on_hours:.1f} horas")
-            
-            # Verificar nó pushing
-            if 'pushing' in data:
-                pushing_data = data['pushing']
-                logger.debug(f"Encontrado nó 'pushing' nos dados MQTT")
-                # Verificar se há dados de tempo na mensagem pushing
-                if 'print_stats' in pushing_data:
-                    stats = pushing_data.get('print_stats', {})
-                    logger.debug(f"Estatísticas em pushing/print_stats: {stats}")
-                    if 'accumulated_time' in stats:
-                        print_hours = float(stats.get('accumulated_time', 0)) / 3600.0
-                        logger.info(f"Tempo acumulado de impressão (pushing/print_stats): {print_hours:.1f} horas")
-                    if 'total_jobs' in stats:
-                        total_prints = int(stats.get('total_jobs', 0))
-                        logger.info(f"Total de trabalhos (pushing/print_stats): {total_prints}")
-            
-            # Verificar se há dados para atualizar no banco de dados
-            if power_on_hours is not None or total_prints is not None or print_hours is not None:
-                logger.info(f"Atualizando estatísticas da impressora: Horas ligada={power_on_hours}, Horas de impressão={print_hours}, Total de impressões={total_prints}")
+            # Estatísticas acumuladas (tabela declarativa em printer_stats)
+            update_data = extract_stats(data)
+            self._note_stats_report(data, update_data)
+            if update_data:
+                logger.info(f"Atualizando estatísticas da impressora: Horas ligada={update_data.get('power_on_hours')}, Horas de impressão={update_data.get('hours')}, Total de impressões={update_data.get('prints')}")
                 
                 # Atualizar estatísticas no banco de dados
                 from db_manager import StatsManager
                 
-                # Usamos valores condicionais para atualizar apenas o que foi recebido
-                update_data = {}
-                if power_on_hours is not None:
-                    update_data['power_on_hours'] = float(power_on_hours)
-                if total_prints is not None:
-                    update_data['prints'] = int(total_prints)
-                if print_hours is not None:
-                    update_data['hours'] = float(print_hours)
-                    
-                if update_data:
-                    StatsManager.update_printer_stats(**update_data)
-                    logger.info(f"Estatísticas atualizadas no banco de dados: {update_data}")
+                # A escrita no banco roda no db_executor, fora da thread de ingestão
+                db_executor.submit(StatsManager.update_printer_stats, **update_data)
+                logger.debug(f"Estatísticas enviadas para gravação no banco de dados: {update_data}")
         
         except Exception as e:
             logger.error(f"Erro ao processar dados da Bambu: {str(e)}", exc_info=True)
     
-    def _monitoring_loop(self):
+    def _schedule_task(self, name, delay, earlier_only=False):
         """
-        Loop de monitoramento para processar dados da ESP32 e outros eventos
+        Agenda (ou reagenda) uma tarefa de _monitoring_loop
+        
+        Args:
+            name (str): 'esp32' ou 'stats'
+            delay (float): Segundos a partir de agora
+            earlier_only (bool, optional): Só antecipa; não adia um prazo já agendado
         """
+        deadline = time.monotonic() + delay
+        with self._schedule:
+            current = self._task_deadlines.get(name)
+            if earlier_only and current is not None and current <= deadline:
+                return
+            self._task_deadlines[name] = deadline
+            if self._engine is not None:
+                timer = self._timers.pop(name, None)
+                if timer is not None:
+                    timer.cancel()
+                self._timers[name] = self._engine.call_at(deadline, self._run_task, name, deadline)
+                return
+            heapq.heappush(self._tasks, (deadline, name))
+            self._schedule.notify()
+    
+    def _run_task(self, name, deadline=None):
+        """
+        Executa uma tarefa agendada
+        
+        Args:
+            name (str): 'esp32' ou 'stats'
+            deadline (float, optional): Prazo do timer; ignorado se a tarefa foi reagendada
+        """
+        if deadline is not None:
+            with self._schedule:
+                if self._task_deadlines.get(name) != deadline:
+                    return
+                del self._task_deadlines[name]
+                self._timers.pop(name, None)
+        handler = self._check_esp32_data if name == 'esp32' else self._check_bambu_data
         try:
-            while self.running:
-                # Verificar dados do ESP32
-                self._check_esp32_data()
-                
-                # Verificar dados da impressora Bambu Lab
-                self._check_bambu_data()
-                
-                # Dormir um pouco para não sobrecarregar o sistema
-                time.sleep(5)
+            handler()
         except Exception as e:
-            logger.error(f"Erro no loop de monitoramento: {str(e)}")
+            logger.error(f"Erro no loop de monitoramento ({name}): {str(e)}")
+    
+    def _monitoring_loop(self):
+        """
+        Executa as tarefas periódicas (ESP32 e estatísticas da impressora) no
+        prazo de cada uma. A thread dorme até o prazo mais próximo do heap ou até
+        um reagendamento; cada tarefa agenda a sua próxima execução.
+        """
+        while self.running:
+            with self._schedule:
+                name = None
+                while self.running:
+                    now = time.monotonic()
+                    # Entradas substituídas por um reagendamento ficam no heap até chegarem ao topo
+                    while self._tasks and self._task_deadlines.get(self._tasks[0][1]) != self._tasks[0][0]:
+                        heapq.heappop(self._tasks)
+                    if self._tasks and self._tasks[0][0] <= now:
+                        _, name = heapq.heappop(self._tasks)
+                        del self._task_deadlines[name]
+                        break
+                    self._schedule.wait(self._tasks[0][0] - now if self._tasks else None)
+            if name is None:
+                break
+            self._run_task(name)
     
     def _check_esp32_data(self):
         """
@@ -376,118 +280,172 @@ class MQTTIntegration:
         try:
             # Obter o cliente MQTT
             client = get_mqtt_client()
-            if not client or not client.is_connected():
-                return
-                
-            # Processar mensagens recebidas no último intervalo
-            # Nada a fazer aqui, pois os callbacks do MQTT já lidam com isso
-            # Esta função pode ser expandida conforme necessário
-            
-            # Verificar se precisa solicitar dados novamente
-            # Se não recebemos atualizações recentes, podemos solicitar explicitamente
-            now = datetime.now()
-            if (now - self.last_data_check).total_seconds() > 300:  # A cada 5 minutos
+            if client and client.is_connected():
+                # Os callbacks do MQTT já processam as mensagens recebidas;
+                # esta tarefa pode ser expandida conforme necessário
                 logger.info("Solicitando dados do ESP32 (intervalo de 5 minutos)")
-                self.last_data_check = now
-                
         except Exception as e:
             logger.error(f"Erro ao verificar dados do ESP32: {str(e)}")
+        finally:
+            self._schedule_task('esp32', ESP32_CHECK_INTERVAL)
     
     def _check_bambu_data(self):
         """
-        Verifica e processa dados da impressora Bambu Lab
+        Rodada de consulta das estatísticas da impressora Bambu Lab.
+        
+        Só solicita o que não chegou pelos relatórios desde a rodada anterior e
+        agenda a próxima: o intervalo volta ao mínimo quando as estatísticas
+        mudaram e dobra enquanto ficam iguais, até STATS_POLL_PRINTING_MAX
+        (imprimindo) ou STATS_POLL_MAX_INTERVAL (ociosa).
         """
-        # Implementação da obtenção dos dados da impressora Bambu Lab via MQTT
-        try:
-            if self.bambu_client and self.bambu_connected:
-                # Verificar se é hora de solicitar estatísticas da impressora (a cada 30 minutos)
-                now = datetime.now()
-                if not hasattr(self, 'last_stats_check') or (now - self.last_stats_check).total_seconds() > 1800:
-                    logger.info("Solicitando estatísticas da impressora Bambu Lab (intervalo de 30 minutos)")
-                    self.last_stats_check = now
-                    
-                    # Solicitar informações da impressora
-                    self._request_printer_stats()
-                    
-        except Exception as e:
-            logger.error(f"Erro ao verificar dados da Bambu Lab: {str(e)}")
+        if not self.bambu_connected:
+            # A próxima rodada é agendada pelo listener de conexão
+            return
+        
+        now = time.monotonic()
+        with self._stats_lock:
+            since = self._last_poll_at
+            self._last_poll_at = now
+            if since is None or self._stats_changed:
+                interval = STATS_POLL_MIN_INTERVAL
+            else:
+                limit = STATS_POLL_PRINTING_MAX if self._printing else STATS_POLL_MAX_INTERVAL
+                interval = min(self._stats_interval * 2, limit)
+            self._stats_interval = interval
+            self._stats_changed = False
+            
+            pushed = self._stats_fields_pushed
+            self._stats_fields_pushed = set()
+            if since is not None and self._last_stats and pushed >= set(self._last_stats):
+                # Todos os totais conhecidos já chegaram pelos relatórios periódicos
+                requests = ()
+            else:
+                requests = tuple((section, command) for section, command in STATS_REQUESTS
+                                 if since is None or (self._answered_at[command] or 0) < since)
+            self._polls += 1
+            self._requests_skipped += len(STATS_REQUESTS) - len(requests)
+        
+        if requests:
+            logger.info(f"Solicitando estatísticas da impressora Bambu Lab "
+                        f"(próxima consulta em {interval / 60:.0f} min)")
+            self._request_printer_stats(requests)
+        else:
+            logger.debug(f"Estatísticas já recebidas pelos relatórios; próxima consulta em {interval / 60:.0f} min")
+        self._schedule_task('stats', interval)
+    
+    def _note_stats_report(self, data, update_data):
+        """
+        Registra, para o agendamento das consultas, o que chegou em um relatório
+        
+        Args:
+            data (dict): Relatório decodificado
+            update_data (dict): Estatísticas extraídas do relatório
+        """
+        answered = []
+        solicited = False
+        for body in data.values():
+            if not isinstance(body, dict):
+                continue
+            command = body.get('command')
+            if command is None:
+                continue
+            if str(body.get('sequence_id')) in self._own_requests:
+                solicited = True
+            elif command == 'push_status':
+                # Um push_status com os totais dispensa o pushall
+                if update_data:
+                    answered.append('pushall')
+            elif command in self._answered_at:
+                answered.append(command)
+        
+        if not update_data and not answered:
+            return
+        now = time.monotonic()
+        with self._stats_lock:
+            # Respostas às nossas próprias solicitações não contam como recebidas pelos relatórios
+            if not solicited:
+                for command in answered:
+                    self._answered_at[command] = now
+                self._stats_fields_pushed.update(update_data)
+            for field, value in update_data.items():
+                if self._last_stats.get(field) != value:
+                    self._last_stats[field] = value
+                    self._stats_changed = True
+    
+    def _on_job_event(self, event):
+        """Antecipa a consulta de estatísticas no início e no fim dos trabalhos"""
+        finished = event.type in JOB_END_EVENTS
+        with self._stats_lock:
+            self._printing = not finished
+            if finished:
+                # Os totais vão mudar: mantém o intervalo mínimo até as respostas chegarem
+                self._stats_changed = True
+        if finished:
+            # A impressora atualiza os totais logo depois de terminar
+            self._schedule_task('stats', STATS_POLL_AFTER_JOB)
+        else:
+            self._schedule_task('stats', STATS_POLL_PRINTING_MAX, earlier_only=True)
     
-    def _request_printer_stats(self):
+    def _on_bambu_connect(self, connection):
+        """Agenda uma rodada de consulta ao (re)conectar, sem repetir uma rodada recente"""
+        with self._stats_lock:
+            elapsed = None if self._last_poll_at is None else time.monotonic() - self._last_poll_at
+        delay = STATS_POLL_ON_CONNECT if elapsed is None else max(STATS_POLL_ON_CONNECT, STATS_POLL_MIN_INTERVAL - elapsed)
+        self._schedule_task('stats', delay, earlier_only=True)
+    
+    def _request_printer_stats(self, requests=STATS_REQUESTS):
         """
         Solicita estatísticas da impressora via MQTT
+        
+        Args:
+            requests (tuple, optional): Pares (seção, comando) a solicitar (padrão: todos)
         """
         try:
             if not self.bambu_client or not self.bambu_connected:
                 logger.warning("Cliente MQTT Bambu não está conectado, não é possível solicitar estatísticas")
                 return
             
-            # Gerar um ID de sequência único
-            sequence_id = str(int(time.time()))
-            
-            # Solicitar push de todos os dados (contém estatísticas completas)
-            request_payload = {
-                "pushing": {
-                    "sequence_id": sequence_id,
-                    "command": "pushall"
-                }
-            }
-            payload_json = json.dumps(request_payload)
-            logger.info(f"Enviando solicitação 'pushall' (seq: {sequence_id}) para {self.bambu_topic_request}")
-            self.bambu_client.publish(self.bambu_topic_request, payload_json)
-            
-            # Incrementar sequence_id
-            sequence_id = str(int(time.time()) + 1)
-            
-            # Solicitar informações da versão (que contém estatísticas)
-            request_payload = {
-                "info": {
-                    "sequence_id": sequence_id,
-                    "command": "get_version"
+            sent = set()
+            for section, command in requests:
+                # Mesma sequência dos comandos do usuário: as respostas nunca se confundem
+                sequence_id = next_sequence_id()
+                request_payload = {
+                    section: {
+                        "sequence_id": sequence_id,
+                        "command": command
+                    }
                 }
-            }
-            payload_json = json.dumps(request_payload)
-            logger.info(f"Enviando solicitação 'get_version' (seq: {sequence_id}) para {self.bambu_topic_request}")
-            self.bambu_client.publish(self.bambu_topic_request, payload_json)
+                payload_json = json.dumps(request_payload)
+                logger.info(f"Enviando solicitação '{command}' (seq: {sequence_id}) para {self.bambu_topic_request}")
+                self.bambu_client.publish(self.bambu_topic_request, payload_json)
+                sent.add(sequence_id)
             
-            # Também solicitar informações detalhadas da impressora
-            sequence_id = str(int(time.time()) + 2)
-            request_payload = {
-                "system": {
-                    "sequence_id": sequence_id,
-                    "command": "get_printer_info"
-                }
-            }
-            payload_json = json.dumps(request_payload)
-            logger.info(f"Enviando solicitação 'get_printer_info' (seq: {sequence_id}) para {self.bambu_topic_request}")
-            self.bambu_client.publish(self.bambu_topic_request, payload_json)
-            
-            # Solicitação adicional mais específica para obter informações de horas de impressão
-            sequence_id = str(int(time.time()) + 3)
-            request_payload = {
-                "print": {
-                    "sequence_id": sequence_id,
-                    "command": "get_print_stats"
-                }
-            }
-            payload_json = json.dumps(request_payload)
-            logger.info(f"Enviando solicitação 'get_print_stats' (seq: {sequence_id}) para {self.bambu_topic_request}")
-            self.bambu_client.publish(self.bambu_topic_request, payload_json)
+            with self._stats_lock:
+                self._own_requests = frozenset(sent)
+                self._requests_sent += len(sent)
             
         except Exception as e:
             logger.error(f"Erro ao solicitar estatísticas da impressora: {str(e)}")
     
     def start_monitoring(self):
         """
-        Inicia o monitoramento MQTT em uma thread separada
+        Inicia o monitoramento MQTT em uma thread separada (ou no motor asyncio)
         
         Returns:
             bool: True se iniciado com sucesso
         """
-        if self.thread and self.thread.is_alive():
+        if (self.thread and self.thread.is_alive()) or (self.running and self._engine is not None):
             logger.warning("Thread de monitoramento já está em execução")
             return True
         
         self.running = True
+        self._schedule_task('esp32', ESP32_CHECK_INTERVAL)
+        # Conexão já ativa: consulta agora; senão, o listener de conexão agenda
+        if self.bambu_connected:
+            self._schedule_task('stats', 0, earlier_only=True)
+        if self._engine is not None:
+            logger.info("Monitoramento MQTT agendado no motor asyncio")
+            return True
         self.thread = threading.Thread(target=self._monitoring_loop)
         self.thread.daemon = True
         self.thread.start()
@@ -507,18 +465,37 @@ class MQTTIntegration:
             if not self.bambu_client or not self.bambu_connected:
                 logger.warning("Cliente MQTT Bambu não está conectado, não é possível solicitar estatísticas")
                 return False
-                
-            # Resetar o timer para permitir uma nova solicitação imediata
-            self.last_stats_check = datetime.now() - timedelta(hours=1)
             
-            # Solicitar estatísticas
+            # Solicitar todas as estatísticas e voltar ao intervalo mínimo
             self._request_printer_stats()
+            with self._stats_lock:
+                self._last_poll_at = time.monotonic()
+                self._stats_interval = STATS_POLL_MIN_INTERVAL
+            self._schedule_task('stats', STATS_POLL_MIN_INTERVAL)
             return True
             
         except Exception as e:
             logger.error(f"Erro ao forçar atualização de estatísticas: {str(e)}")
             return False
 
+    def polling_stats(self):
+        """
+        Returns:
+            dict: Intervalo atual e próxima consulta de estatísticas, rodadas e solicitações enviadas/dispensadas
+        """
+        now = time.monotonic()
+        with self._schedule:
+            next_poll = self._task_deadlines.get('stats')
+        with self._stats_lock:
+            return {
+                'interval_seconds': self._stats_interval,
+                'next_poll_in': round(max(0.0, next_poll - now), 1) if next_poll is not None else None,
+                'printing': self._printing,
+                'polls': self._polls,
+                'requests_sent': self._requests_sent,
+                'requests_skipped': self._requests_skipped,
+            }
+
     def set_update_callback(self, callback):
         """
         Define o callback a ser usado para atualizar o printer_status
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Gravação e reprodução do tráfego MQTT (impressora e ESP32).
+
+Grava os relatórios de device/<id>/report e as leituras do ESP32
+(filament_monitor/# e filament/box/#) com o instante de chegada em um
+arquivo JSONL comprimido com gzip, e os reproduz nos mesmos pontos de
+entrada usados pela aplicação: BambuConnection.feed (decodificação,
+mesclagem, status e detecção de eventos) e MQTTClient.on_message (ESP32).
+
+Uso:
+    python mqtt_replay.py record gravacao.jsonl.gz [--duration S]
+    python mqtt_replay.py replay gravacao.jsonl.gz [--speed N | --max] [--coalesce-ms MS] [--esp32]
+
+--speed 1 reproduz no ritmo original, --speed 10 dez vezes mais rápido e
+--max sem pausas, para medir quantas mensagens por segundo o pipeline
+processa (ex: no Raspberry Pi). Com --max a janela de mesclagem agrupa
+quase todos os relatórios; use --coalesce-ms 0 para medir o custo por
+mensagem.
+
+As mensagens do ESP32 só são reproduzidas com --esp32: o MQTTClient grava
+cada leitura, com o horário atual, no banco da aplicação (squidbu.db do
+diretório atual). Use uma cópia da aplicação para não misturar o histórico
+real dos sensores com o da gravação.
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import ssl
+import threading
+import time
+from datetime import datetime
+
+import paho.mqtt.client as mqtt
+
+import json_codec
+from bambu_connection import BambuConnection, BAMBU_MQTT_PORT, BAMBU_MQTT_USER
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
+
+# Tópicos do ESP32 gravados
+ESP32_TOPICS = ('filament_monitor/#', 'filament/box/#')
+
+# Identificação do formato (primeira linha do arquivo)
+FORMAT_NAME = 'squidbu-mqtt'
+FORMAT_VERSION = 1
+
+class MqttRecorder:
+    """Grava mensagens MQTT em JSONL comprimido; pode ser chamado de várias threads"""
+
+    def __init__(self, path, **header):
+        """
+        Args:
+            path (str): Arquivo de saída (.jsonl.gz)
+            **header: Informações extras gravadas no cabeçalho (ex: device_id)
+        """
+        self._file = gzip.open(path, 'wb')
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self.count = 0
+        self._write_line({'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+                          'started': datetime.now().isoformat(), **header})
+
+    def _write_line(self, record):
+        self._file.write(json_codec.dumps(record) + b'\n')
+
+    def record(self, topic, payload):
+        """
+        Grava uma mensagem
+
+        Args:
+            topic (str): Tópico MQTT
+            payload (bytes): Conteúdo bruto da mensagem
+        """
+        record = {'t': round(time.monotonic() - self._start, 4), 'topic': topic}
+        try:
+            record['payload'] = payload.decode('utf-8')
+        except UnicodeDecodeError:
+            record['payload_b64'] = base64.b64encode(payload).decode('ascii')
+        with self._lock:
+            self._write_line(record)
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def read_recording(path):
+    """
+    Lê uma gravação
+
+    Args:
+        path (str): Arquivo gerado por MqttRecorder
+
+    Yields:
+        tuple: (instante em segundos desde o início, tópico, payload em bytes)
+
+    Raises:
+        ValueError: Se o arquivo não for uma gravação reconhecida
+    """
+    with gzip.open(path, 'rb') as f:
+        header = json_codec.loads(f.readline() or b'{}')
+        if header.get('format') != FORMAT_NAME:
+            raise ValueError(f"{path} não é uma gravação MQTT do SquidBu")
+        for line in f:
+            if not line.strip():
+                continue
+            record = json_codec.loads(line)
+            if 'payload_b64' in record:
+                payload = base64.b64decode(record['payload_b64'])
+            else:
+                payload = record['payload'].encode('utf-8')
+            yield record['t'], record['topic'], payload
+
+def replay(messages, handler, speed=1.0):
+    """
+    Reproduz mensagens gravadas
+
+    Args:
+        messages (iterable): Tuplas (instante, tópico, payload) de read_recording
+        handler (callable): Função chamada com (tópico, payload) para cada mensagem
+        speed (float, optional): Multiplicador do ritmo original; 0 reproduz sem pausas
+
+    Returns:
+        dict: Quantidade de mensagens e tempo gasto pelo handler e no total
+    """
+    count = 0
+    busy = 0.0
+    start = time.monotonic()
+    for t, topic, payload in messages:
+        if speed > 0:
+            delay = start + t / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        handler_start = time.perf_counter()
+        handler(topic, payload)
+        busy += time.perf_counter() - handler_start
+        count += 1
+    return {'messages': count, 'busy_seconds': busy, 'elapsed_seconds': time.monotonic() - start}
+
+def load_config():
+    with open(CONFIG_FILE, 'r') as f:
+        return json.load(f)
+
+def record_traffic(args):
+    """Conecta à impressora e ao broker local e grava até Ctrl+C ou --duration"""
+    config = load_config()
+    device_id = config['DEVICE_ID']
+    report_topic = f"device/{device_id}/report"
+    recorder = MqttRecorder(args.output, device_id=device_id)
+
+    def on_message(client, userdata, msg):
+        recorder.record(msg.topic, msg.payload)
+
+    def subscriber(topics):
+        def on_connect(client, userdata, flags, rc):
+            if rc == 0:
+                for topic in topics:
+                    client.subscribe(topic)
+                print(f"Conectado, gravando: {', '.join(topics)}", flush=True)
+            else:
+                print(f"Falha ao conectar, código {rc}", flush=True)
+        return on_connect
+
+    clients = []
+    if not args.no_printer:
+        printer = mqtt.Client(protocol=mqtt.MQTTv311)
+        printer.username_pw_set(BAMBU_MQTT_USER, config['ACCESS_CODE'])
+        printer.tls_set(tls_version=ssl.PROTOCOL_TLS_CLIENT, cert_reqs=ssl.CERT_NONE)
+        printer.tls_insecure_set(True)
+        printer.on_connect = subscriber([report_topic])
+        printer.on_message = on_message
+        printer.connect_async(config['PRINTER_IP'], BAMBU_MQTT_PORT, 60)
+        clients.append(printer)
+    if not args.no_esp32:
+        broker = mqtt.Client()
+        if config.get('MQTT_USERNAME') and config.get('MQTT_PASSWORD'):
+            broker.username_pw_set(config['MQTT_USERNAME'], config['MQTT_PASSWORD'])
+        broker.on_connect = subscriber(list(ESP32_TOPICS))
+        broker.on_message = on_message
+        broker.connect_async(config.get('MQTT_HOST', 'localhost'), config.get('MQTT_PORT', 1883), 60)
+        clients.append(broker)
+
+    for client in clients:
+        client.loop_start()
+    start = time.time()
+    try:
+        while not args.duration or time.time() - start < args.duration:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nGravação interrompida pelo usuário.", flush=True)
+    finally:
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+        recorder.close()
+    print(f"{recorder.count} mensagens gravadas em {args.output}", flush=True)
+
+def replay_traffic(args):
+    """Reproduz uma gravação no pipeline de ingestão e mostra a vazão"""
+    from status_store import StatusStore, is_full_report
+    from printer_events import EventBus, detect_events
+
+    # Pipeline equivalente ao da aplicação, sem conexão real com a impressora
+    store = StatusStore()
+    bus = EventBus()
+    connection = BambuConnection('127.0.0.1', '', 'replay', coalesce_window=args.coalesce_ms / 1000.0)
+
+    def update_status(payload):
+        previous = store.snapshot().status
+        changed = store.apply(payload, include_scalars=True, full=is_full_report(payload))
+        if changed:
+            for event in detect_events(previous, store.snapshot().status, changed):
+                bus.publish(event)
+    connection.add_consumer(update_status, name='status')
+
+    esp32 = None
+    if args.esp32:
+        # Grava as leituras (com o horário atual) no banco real da aplicação
+        print("Aviso: --esp32 grava as leituras reproduzidas no squidbu.db do diretório atual.", flush=True)
+        from mqtt_client import MQTTClient
+        esp32 = MQTTClient()
+
+    counts = {'printer': 0, 'esp32': 0, 'ignored': 0}
+
+    def handler(topic, payload):
+        if topic.startswith('device/') and topic.endswith('/report'):
+            counts['printer'] += 1
+            connection.feed(payload)
+        elif esp32 and topic.startswith(('filament_monitor/', 'filament/box/')):
+            counts['esp32'] += 1
+            message = mqtt.MQTTMessage(topic=topic.encode('utf-8'))
+            message.payload = payload
+            esp32.on_message(None, None, message)
+        else:
+            counts['ignored'] += 1
+
+    speed = 0 if args.max else args.speed
+    result = replay(read_recording(args.recording), handler, speed=speed)
+    connection.flush()
+
+    busy = result['busy_seconds']
+    print(f"Mensagens: {result['messages']} (impressora: {counts['printer']}, "
+          f"ESP32: {counts['esp32']}, ignoradas: {counts['ignored']})")
+    print(f"Tempo total: {result['elapsed_seconds']:.2f} s, processando: {busy:.2f} s")
+    if busy > 0:
+        print(f"Capacidade: {result['messages'] / busy:.0f} mensagens/s "
+              f"({busy / result['messages'] * 1e6:.0f} us/mensagem)")
+    ingest = connection.stats()
+    print(f"Relatórios entregues aos consumidores: {ingest['processed']} "
+          f"(mesclados: {ingest['coalesced']}, JSON inválido: {ingest['decode_errors']})")
+    print(f"Eventos: {bus.stats()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Grava e reproduz o tráfego MQTT da impressora e do ESP32")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help="Grava o tráfego em um arquivo .jsonl.gz")
+    record_parser.add_argument('output', help="Arquivo de saída")
+    record_parser.add_argument('--duration', type=float, default=0, help="Segundos de gravação (padrão: até Ctrl+C)")
+    record_parser.add_argument('--no-printer', action='store_true', help="Não grava os relatórios da impressora")
+    record_parser.add_argument('--no-esp32', action='store_true', help="Não grava as leituras do ESP32")
+    record_parser.set_defaults(func=record_traffic)
+
+    replay_parser = commands.add_parser('replay', help="Reproduz uma gravação no pipeline de ingestão")
+    replay_parser.add_argument('recording', help="Arquivo gravado com 'record'")
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="Multiplicador do ritmo original (padrão: 1)")
+    replay_parser.add_argument('--max', action='store_true', help="Reproduz sem pausas")
+    replay_parser.add_argument('--coalesce-ms', type=float, default=500, help="Janela de mesclagem (0 desativa)")
+    replay_parser.add_argument('--esp32', action='store_true',
+                               help="Também reproduz as mensagens do ESP32 (grava as leituras no squidbu.db)")
+    replay_parser.set_defaults(func=replay_traffic)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Barramento de eventos da impressora.
+
+Os eventos (início/fim de impressão, troca de camada, temperatura atingida,
+troca de bandeja do AMS, erros HMS...) são derivados das transições de
+estado: a cada relatório, o StatusStore informa quais caminhos mudaram e
+detect_events() só examina as regras cujos campos foram tocados, comparando
+o snapshot anterior com o novo (ambos imutáveis, sem cópias).
+
+Quem precisa reagir (push, registro de trabalhos no banco, automação GPIO)
+assina os tipos de evento em event_bus.
+"""
+
+import logging
+import os
+import threading
+import time
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('printer_events')
+
+# Tipos de evento
+JOB_STARTED = 'job_started'
+JOB_PAUSED = 'job_paused'
+JOB_RESUMED = 'job_resumed'
+JOB_FINISHED = 'job_finished'
+JOB_STOPPED = 'job_stopped'
+JOB_FAILED = 'job_failed'
+LAYER_CHANGED = 'layer_changed'
+TEMPERATURE_REACHED = 'temperature_reached'
+AMS_TRAY_CHANGED = 'ams_tray_changed'
+HMS_ERROR = 'hms_error'
+
+EVENT_TYPES = frozenset((
+    JOB_STARTED, JOB_PAUSED, JOB_RESUMED, JOB_FINISHED, JOB_STOPPED, JOB_FAILED,
+    LAYER_CHANGED, TEMPERATURE_REACHED, AMS_TRAY_CHANGED, HMS_ERROR,
+))
+
+# Eventos que encerram um trabalho de impressão
+JOB_END_EVENTS = (JOB_FINISHED, JOB_STOPPED, JOB_FAILED)
+
+# Diferença máxima (°C) para considerar que a temperatura alvo foi atingida
+TEMPERATURE_TOLERANCE = 2
+
+# Aquecedores monitorados: nome -> (campo da temperatura atual, campo do alvo)
+HEATERS = {
+    'nozzle': ('nozzle_temper', 'nozzle_target_temper'),
+    'bed': ('bed_temper', 'bed_target_temper'),
+}
+
+# gcode_state -> fase do trabalho
+_JOB_PHASES = {
+    'PREPARE': 'printing',
+    'SLICING': 'printing',
+    'RUNNING': 'printing',
+    'PAUSE': 'paused',
+    'FINISH': 'finished',
+    'FAILED': 'failed',
+    'IDLE': 'idle',
+}
+
+# Código de mc_print_result para impressão parada pelo usuário
+_RESULT_STOPPED = 4
+
+class PrinterEvent:
+    """Evento imutável: tipo, dados específicos do tipo e instante de detecção"""
+
+    __slots__ = ('type', 'data', 'timestamp')
+
+    def __init__(self, event_type, **data):
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Tipo de evento desconhecido: {event_type}")
+        self.type = event_type
+        self.data = data
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return f"PrinterEvent({self.type}, {self.data})"
+
+class EventBus:
+    """
+    Entrega cada evento aos assinantes do seu tipo, na ordem de assinatura.
+
+    Os assinantes rodam na thread de ingestão: trabalho lento (push, banco,
+    GPIO) deve ser repassado a um executor. O erro de um assinante não
+    impede os demais de receber o evento.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Tuplas substituídas a cada assinatura: publish() lê sem lock
+        self._subscribers = {}
+        self._published = {}
+
+    def subscribe(self, event_types, callback, name=None):
+        """
+        Assina um ou mais tipos de evento
+
+        Args:
+            event_types (str | iterable): Tipo(s) de evento (constantes deste módulo)
+            callback (callable): Função que recebe o PrinterEvent
+            name (str, optional): Nome usado nos logs de erro
+
+        Raises:
+            ValueError: Se algum tipo de evento for desconhecido
+        """
+        if isinstance(event_types, str):
+            event_types = (event_types,)
+        event_types = tuple(event_types)
+        unknown = [t for t in event_types if t not in EVENT_TYPES]
+        if unknown:
+            raise ValueError(f"Tipo(s) de evento desconhecido(s): {', '.join(map(str, unknown))}")
+
+        entry = (name or getattr(callback, '__name__', repr(callback)), callback)
+        with self._lock:
+            for event_type in event_types:
+                self._subscribers[event_type] = self._subscribers.get(event_type, ()) + (entry,)
+
+    def publish(self, event):
+        """Entrega um evento aos seus assinantes"""
+        logger.info(f"Evento da impressora: {event.type} {event.data}")
+        with self._lock:
+            self._published[event.type] = self._published.get(event.type, 0) + 1
+        for name, callback in self._subscribers.get(event.type, ()):
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Erro no assinante '{name}' do evento {event.type}: {str(e)}", exc_info=True)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Quantidade de eventos publicados por tipo
+        """
+        with self._lock:
+            return dict(self._published)
+
+def _touched(changed, *prefix):
+    """True se algum caminho alterado está dentro de prefix (ou o contém)"""
+    size = len(prefix)
+    for path in changed:
+        if path[:size] == prefix or prefix[:len(path)] == path:
+            return True
+    return False
+
+def _job_phase(print_status):
+    """Fase do trabalho: printing, paused, finished, failed ou idle"""
+    # Formato antigo de alguns firmwares
+    if print_status.get('mc_print_stage') == 'PRINTING':
+        return 'printing'
+    return _JOB_PHASES.get(print_status.get('gcode_state'), 'idle')
+
+def _filename(print_status):
+    gcode_file = print_status.get('gcode_file')
+    return os.path.basename(gcode_file) if gcode_file else None
+
+def _job_events(previous, current):
+    before, after = _job_phase(previous), _job_phase(current)
+    if before == after:
+        return []
+
+    active = ('printing', 'paused')
+    if after == 'printing' and before == 'paused':
+        return [PrinterEvent(JOB_RESUMED, filename=_filename(current))]
+    if after == 'printing':
+        return [PrinterEvent(JOB_STARTED, filename=_filename(current))]
+    if after == 'paused' and before == 'printing':
+        return [PrinterEvent(JOB_PAUSED, filename=_filename(current))]
+    if before not in active or after in active:
+        return []
+
+    # O trabalho terminou; o arquivo é o do relatório anterior (pode já ter sido limpo)
+    filename = _filename(previous)
+    result = current.get('mc_print_result')
+    if after == 'finished':
+        return [PrinterEvent(JOB_FINISHED, filename=filename)]
+    if result == _RESULT_STOPPED:
+        return [PrinterEvent(JOB_STOPPED, filename=filename)]
+    if after == 'failed' or result != 0:
+        return [PrinterEvent(JOB_FAILED, filename=filename, result=result,
+                             print_error=current.get('print_error'))]
+    return [PrinterEvent(JOB_FINISHED, filename=filename)]
+
+def _at_target(print_status, temper_key, target_key):
+    try:
+        target = float(print_status.get(target_key) or 0)
+        temperature = float(print_status.get(temper_key))
+    except (TypeError, ValueError):
+        return False
+    return target > 0 and abs(temperature - target) <= TEMPERATURE_TOLERANCE
+
+def _temperature_events(previous, current, changed):
+    events = []
+    for heater, (temper_key, target_key) in HEATERS.items():
+        if not (_touched(changed, 'print', temper_key) or _touched(changed, 'print', target_key)):
+            continue
+        if _at_target(current, temper_key, target_key) and not _at_target(previous, temper_key, target_key):
+            events.append(PrinterEvent(TEMPERATURE_REACHED, heater=heater,
+                                       temperature=current.get(temper_key),
+                                       target=current.get(target_key)))
+    return events
+
+def _hms_events(previous, current):
+    previous_hms = previous.get('hms') or []
+    return [PrinterEvent(HMS_ERROR, attr=entry.get('attr'), code=entry.get('code'))
+            for entry in current.get('hms') or []
+            if isinstance(entry, dict) and entry not in previous_hms]
+
+def detect_events(previous, current, changed):
+    """
+    Calcula os eventos de uma atualização do status
+
+    Args:
+        previous (dict): Status (bruto) antes da atualização
+        current (dict): Status (bruto) depois da atualização
+        changed (frozenset): Caminhos alterados, como retornados por StatusStore.apply
+
+    Returns:
+        list: PrinterEvent na ordem em que devem ser publicados
+    """
+    if not changed or not _touched(changed, 'print'):
+        return []
+
+    before = previous.get('print') or {}
+    after = current.get('print') or {}
+    events = []
+
+    if _touched(changed, 'print', 'gcode_state') or _touched(changed, 'print', 'mc_print_stage'):
+        events.extend(_job_events(before, after))
+
+    if _touched(changed, 'print', 'layer_num') and after.get('layer_num') != before.get('layer_num'):
+        events.append(PrinterEvent(LAYER_CHANGED, layer=after.get('layer_num'),
+                                   total_layers=after.get('total_layer_num')))
+
+    events.extend(_temperature_events(before, after, changed))
+
+    if _touched(changed, 'print', 'ams', 'tray_now'):
+        previous_tray = (before.get('ams') or {}).get('tray_now')
+        tray = (after.get('ams') or {}).get('tray_now')
+        # Sem valor anterior é o primeiro relatório, não uma troca
+        if previous_tray is not None and tray != previous_tray:
+            events.append(PrinterEvent(AMS_TRAY_CHANGED, previous=previous_tray, tray=tray))
+
+    if _touched(changed, 'print', 'hms'):
+        events.extend(_hms_events(before, after))
+
+    return events
+
+# Barramento único da aplicação
+event_bus = EventBus()
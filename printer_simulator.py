@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Simulador de impressoras Bambu Lab e caixas ESP32 para testes de carga.
+
+Fala o protocolo MQTT do modo LAN contra um broker local: publica
+relatórios push_status em device/<serial>/report durante impressões
+simuladas (com AMS), responde às requisições de device/<serial>/request
+(pushall, get_version, get_printer_info, get_print_stats, comandos de
+impressão e ledctrl) e publica leituras das caixas ESP32 em filament_monitor/...
+
+Uso:
+    python printer_simulator.py --printers 1 --serial 0123456789ABCDEF --esp32-boxes 4
+    python printer_simulator.py --printers 20 --rate 2 --esp32-boxes 40 --esp32-rate 1
+
+Para apontar o app.py para o simulador, o broker precisa aceitar TLS na
+porta 8883 com o usuário "bblp" (ex: mosquitto com um certificado
+autoassinado e um password_file); use PRINTER_IP = endereço do broker,
+ACCESS_CODE = senha do bblp e DEVICE_ID = --serial.
+"""
+
+import argparse
+import copy
+import heapq
+import json
+import random
+import ssl
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from bench_codec import SAMPLE_REPORT
+
+# Probabilidade de uma impressão simulada falhar
+DEFAULT_FAILURE_RATE = 0.1
+
+# Segundos ociosa entre uma impressão e a próxima
+IDLE_SECONDS = 20
+
+class VirtualPrinter:
+    """Estado e protocolo de uma impressora simulada"""
+
+    def __init__(self, serial, publish, print_seconds, failure_rate=DEFAULT_FAILURE_RATE):
+        """
+        Args:
+            serial (str): Número de série (DEVICE_ID)
+            publish (callable): Função (tópico, payload em bytes) usada para publicar
+            print_seconds (float): Duração de cada impressão simulada
+            failure_rate (float, optional): Probabilidade de uma impressão falhar
+        """
+        self.serial = serial
+        self.topic_report = f"device/{serial}/report"
+        self.topic_request = f"device/{serial}/request"
+        self._publish = publish
+        self.print_seconds = print_seconds
+        self.failure_rate = failure_rate
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+        self.status = copy.deepcopy(SAMPLE_REPORT['print'])
+        self.status.update(gcode_state='IDLE', mc_percent=0, mc_remaining_time=0, layer_num=0,
+                           nozzle_temper=25.0, nozzle_target_temper=0, bed_temper=25.0, bed_target_temper=0,
+                           mc_print_result=0, print_error=0)
+        self._state_since = time.monotonic()
+        self._paused_at = None
+        self._fail_at = None
+        self._statistics = {'print_count': random.randint(10, 500), 'print_time': random.uniform(50, 2000)}
+        self._statistics['power_on_time'] = self._statistics['print_time'] * 1.5
+
+    def _send(self, report):
+        self._publish(self.topic_report, json.dumps(report).encode('utf-8'))
+
+    def _next_sequence_id(self):
+        self._sequence += 1
+        return str(self._sequence)
+
+    def _report(self, fields, full=False):
+        report = dict(fields)
+        # msg 0: status completo (resposta ao pushall); 1: apenas os campos alterados
+        report.update(command='push_status', msg=0 if full else 1, sequence_id=self._next_sequence_id())
+        return {'print': report}
+
+    def tick(self):
+        """Avança a simulação e publica um relatório push_status parcial"""
+        with self._lock:
+            changes = self._advance(time.monotonic())
+            # O AMS já foi atualizado no lugar; o relatório leva só a parte alterada
+            self.status.update((key, value) for key, value in changes.items() if key != 'ams')
+            report = self._report(changes)
+        self._send(report)
+
+    def _advance(self, now):
+        """Calcula os campos que mudaram desde o último relatório"""
+        state = self.status['gcode_state']
+        elapsed = now - self._state_since
+        changes = {}
+
+        if state in ('IDLE', 'FINISH', 'FAILED') and elapsed >= IDLE_SECONDS:
+            self._state_since = now
+            # Sorteia no início se (e em que ponto) a impressão vai falhar
+            self._fail_at = random.uniform(0.1, 0.9) if random.random() < self.failure_rate else None
+            changes.update(gcode_state='PREPARE', gcode_file=f"/data/Metadata/sim_{random.randint(1, 999)}.gcode",
+                           mc_percent=0, layer_num=0, total_layer_num=random.randint(50, 400),
+                           nozzle_target_temper=220, bed_target_temper=60, mc_print_result=0, print_error=0)
+        elif state == 'PREPARE':
+            changes.update(self._heat())
+            if abs(self.status['nozzle_temper'] - 220) <= 1 and abs(self.status['bed_temper'] - 60) <= 1:
+                self._state_since = now
+                changes['gcode_state'] = 'RUNNING'
+        elif state == 'RUNNING':
+            changes.update(self._heat())
+            progress = min(1.0, elapsed / self.print_seconds)
+            total_layers = self.status['total_layer_num']
+            changes.update(mc_percent=int(progress * 100),
+                           mc_remaining_time=int((1 - progress) * self.print_seconds / 60),
+                           layer_num=max(1, int(progress * total_layers)))
+            if self._fail_at is not None and progress >= self._fail_at:
+                self._state_since = now
+                changes.update(gcode_state='FAILED', mc_print_result=1, print_error=0x0300400C,
+                               nozzle_target_temper=0, bed_target_temper=0,
+                               hms=[{'attr': 0x03000200, 'code': 0x0001000C}])
+            elif progress >= 1.0:
+                self._state_since = now
+                self._statistics['print_count'] += 1
+                self._statistics['print_time'] += self.print_seconds / 3600
+                changes.update(gcode_state='FINISH', nozzle_target_temper=0, bed_target_temper=0)
+            elif random.random() < 0.05:
+                changes['ams'] = self._ams_update()
+        elif state in ('IDLE', 'FINISH', 'FAILED', 'PAUSE'):
+            changes.update(self._heat())
+            if state == 'FAILED' and self.status.get('hms'):
+                changes['hms'] = []
+        return changes
+
+    def _heat(self):
+        """Aproxima as temperaturas dos alvos, com um pouco de ruído"""
+        changes = {}
+        for current_key, target_key in (('nozzle_temper', 'nozzle_target_temper'), ('bed_temper', 'bed_target_temper')):
+            target = self.status[target_key] or 25.0
+            current = self.status[current_key]
+            step = (target - current) * 0.3 + random.uniform(-0.2, 0.2)
+            changes[current_key] = round(current + step, 1)
+        return changes
+
+    def _ams_update(self):
+        """Consome filamento da bandeja em uso (atualização parcial, por id)"""
+        ams = self.status['ams']
+        tray_now = ams.get('tray_now', '0')
+        unit = ams['ams'][0]
+        trays = unit['tray']
+        tray = next((t for t in trays if t['id'] == tray_now), trays[0])
+        tray['remain'] = max(0, tray['remain'] - 1)
+        # Como a impressora real, envia a unidade inteira: campos ausentes num item por id são apagados
+        return {'ams': [copy.deepcopy(unit)], 'tray_now': tray_now}
+
+    def handle_request(self, payload):
+        """Responde a uma mensagem publicada em device/<serial>/request"""
+        try:
+            request = json.loads(payload)
+        except ValueError:
+            return
+        for section, body in request.items():
+            if isinstance(body, dict):
+                self._answer(section, body.get('command'), body.get('sequence_id'), body)
+
+    def _answer(self, section, command, sequence_id, body):
+        changes = None
+        with self._lock:
+            if section == 'pushing' and command == 'pushall':
+                report = self._report(copy.deepcopy(self.status), full=True)
+            elif section == 'info' and command == 'get_version':
+                report = {'info': {'command': 'get_version', 'sequence_id': sequence_id, 'module': [
+                    {'name': 'ota', 'sw_ver': '01.04.00.00', 'sn': self.serial},
+                    {'name': 'printer', 'sn': self.serial, 'statistics': {
+                        'print_time': round(self._statistics['print_time'], 1),
+                        'print_count': self._statistics['print_count'],
+                        'power_on_time': round(self._statistics['power_on_time'], 1)}},
+                ]}}
+            elif section == 'system' and command == 'get_printer_info':
+                report = {'system': {'command': 'get_printer_info', 'sequence_id': sequence_id, 'printer': {
+                    'total_usage': {'print_hours': round(self._statistics['print_time'], 1),
+                                    'job_count': self._statistics['print_count'],
+                                    'power_on_hours': round(self._statistics['power_on_time'], 1)}}}}
+            elif section == 'print' and command == 'get_print_stats':
+                report = {'print': {'command': 'get_print_stats', 'sequence_id': sequence_id, 'stats': {
+                    'total_hours': round(self._statistics['print_time'], 1),
+                    'total_jobs': self._statistics['print_count']}}}
+            elif section == 'print':
+                # gcode_line responde em maiúsculas, como a impressora real
+                result = 'SUCCESS' if command == 'gcode_line' else 'success'
+                report = {'print': {'command': command, 'sequence_id': sequence_id,
+                                    'param': body.get('param', ''), 'result': result, 'reason': ''}}
+                changes = self._apply_command(command)
+            elif section == 'system' and command == 'ledctrl':
+                report = {'system': dict(body, result='success', reason='')}
+                changes = self._apply_light(body.get('led_node'), body.get('led_mode'))
+            else:
+                return
+            if changes:
+                self.status.update(changes)
+                changes = self._report(changes)
+        self._send(report)
+        if changes:
+            # O efeito do comando chega no push_status seguinte, como na impressora real
+            self._send(changes)
+
+    def _apply_command(self, command):
+        """
+        Efeito dos comandos de controle na impressão simulada
+
+        Returns:
+            dict: Campos do status alterados pelo comando
+        """
+        state = self.status['gcode_state']
+        now = time.monotonic()
+        if command == 'pause' and state == 'RUNNING':
+            self._paused_at = now
+            return {'gcode_state': 'PAUSE'}
+        if command == 'resume' and state == 'PAUSE':
+            # A pausa não conta no progresso
+            self._state_since += now - (self._paused_at or now)
+            return {'gcode_state': 'RUNNING'}
+        if command == 'stop' and state in ('RUNNING', 'PAUSE', 'PREPARE'):
+            self._state_since = now
+            return {'gcode_state': 'FAILED', 'mc_print_result': 4,
+                    'nozzle_target_temper': 0, 'bed_target_temper': 0}
+        return {}
+
+    def _apply_light(self, node, mode):
+        """
+        Efeito do ledctrl no lights_report
+
+        Returns:
+            dict: Campos do status alterados pelo comando
+        """
+        if not node or mode not in ('on', 'off', 'flashing'):
+            return {}
+        lights = [light for light in self.status.get('lights_report', []) if light.get('node') != node]
+        lights.append({'node': node, 'mode': mode})
+        return {'lights_report': lights}
+
+class VirtualEsp32Box:
+    """Caixa de filamento ESP32 simulada (formato filament_monitor/<medida>/<caixa>)"""
+
+    def __init__(self, box_number, publish):
+        self.box_number = box_number
+        self._publish = publish
+        self.temperature = random.uniform(22, 30)
+        self.humidity = random.uniform(10, 40)
+        self.weight = random.uniform(200, 1000)
+
+    def tick(self):
+        """Publica uma rodada de leituras"""
+        self.temperature += random.uniform(-0.3, 0.3)
+        self.humidity = min(90, max(5, self.humidity + random.uniform(-0.5, 0.5)))
+        self.weight = max(0, self.weight - random.uniform(0, 0.5))
+        for metric, value in (('temperature', self.temperature), ('humidity', self.humidity),
+                              ('remaining_weight', self.weight),
+                              ('remaining_percentage', self.weight / 10)):
+            self._publish(f"filament_monitor/{metric}/{self.box_number}", f"{value:.2f}".encode('utf-8'))
+
+def run(args):
+    """Conecta ao broker e executa os dispositivos simulados até Ctrl+C ou --duration"""
+    client = mqtt.Client(client_id=f"printer_simulator_{int(time.time())}")
+    if args.username:
+        client.username_pw_set(args.username, args.password)
+    if args.tls:
+        client.tls_set(tls_version=ssl.PROTOCOL_TLS_CLIENT, cert_reqs=ssl.CERT_NONE)
+        client.tls_insecure_set(True)
+
+    published = [0]
+
+    def publish(topic, payload):
+        client.publish(topic, payload)
+        published[0] += 1
+
+    serials = [args.serial] if args.serial else []
+    serials += [f"{args.serial_prefix}{i:04d}" for i in range(len(serials), args.printers)]
+    printers = {serial: VirtualPrinter(serial, publish, args.print_minutes * 60, args.failure_rate)
+                for serial in serials[:args.printers]}
+    boxes = [VirtualEsp32Box(i + 1, publish) for i in range(args.esp32_boxes)]
+
+    def on_connect(client, userdata, flags, rc):
+        if rc != 0:
+            print(f"Falha ao conectar ao broker, código {rc}", flush=True)
+            return
+        client.subscribe("device/+/request")
+        print(f"Conectado a {args.broker}:{args.port}: {len(printers)} impressora(s), "
+              f"{len(boxes)} caixa(s) ESP32", flush=True)
+
+    def on_message(client, userdata, msg):
+        serial = msg.topic.split('/')[1]
+        printer = printers.get(serial)
+        if printer:
+            printer.handle_request(msg.payload)
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(args.broker, args.port, 60)
+    client.loop_start()
+
+    # Agenda (próximo instante, índice, intervalo, dispositivo); os inícios são espalhados
+    now = time.monotonic()
+    schedule = []
+    devices = [(1.0 / args.rate, p) for p in printers.values()]
+    devices += [(1.0 / args.esp32_rate, b) for b in boxes]
+    for index, (interval, device) in enumerate(devices):
+        heapq.heappush(schedule, (now + random.uniform(0, interval), index, interval, device))
+
+    start = now
+    last_report = now
+    try:
+        while schedule and (not args.duration or time.monotonic() - start < args.duration):
+            due, index, interval, device = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            device.tick()
+            heapq.heappush(schedule, (due + interval, index, interval, device))
+
+            if time.monotonic() - last_report >= 10:
+                last_report = time.monotonic()
+                elapsed = last_report - start
+                print(f"{published[0]} mensagens publicadas ({published[0] / elapsed:.1f}/s)", flush=True)
+    except KeyboardInterrupt:
+        print("\nSimulação interrompida pelo usuário.", flush=True)
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula impressoras Bambu Lab e caixas ESP32 em um broker MQTT local")
+    parser.add_argument('--broker', default='localhost', help="Endereço do broker (padrão: localhost)")
+    parser.add_argument('--port', type=int, default=1883, help="Porta do broker (padrão: 1883)")
+    parser.add_argument('--tls', action='store_true', help="Conecta ao broker com TLS (sem validar o certificado)")
+    parser.add_argument('--username', help="Usuário do broker")
+    parser.add_argument('--password', help="Senha do broker")
+    parser.add_argument('--printers', type=int, default=1, help="Quantidade de impressoras simuladas")
+    parser.add_argument('--serial', help="Número de série da primeira impressora (o DEVICE_ID do config.json)")
+    parser.add_argument('--serial-prefix', default='SIM', help="Prefixo do número de série das demais impressoras")
+    parser.add_argument('--rate', type=float, default=1.0, help="Relatórios push_status por segundo, por impressora")
+    parser.add_argument('--print-minutes', type=float, default=10, help="Duração de cada impressão simulada")
+    parser.add_argument('--failure-rate', type=float, default=DEFAULT_FAILURE_RATE,
+                        help="Probabilidade de uma impressão falhar")
+    parser.add_argument('--esp32-boxes', type=int, default=0, help="Quantidade de caixas ESP32 simuladas")
+    parser.add_argument('--esp32-rate', type=float, default=0.2, help="Rodadas de leituras por segundo, por caixa")
+    parser.add_argument('--duration', type=float, default=0, help="Segundos de simulação (padrão: até Ctrl+C)")
+    run(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
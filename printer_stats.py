@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Extração das estatísticas acumuladas da impressora (horas de impressão,
+total de impressões, horas ligada) dos relatórios MQTT.
+
+Cada firmware publica esses valores em um lugar diferente; todos estão
+descritos em STATS_TABLE como (caminho, conversão, campo). A tabela é
+compilada uma vez em uma árvore indexada pelas chaves, e extract_stats()
+percorre apenas os ramos cujas chaves estão presentes no relatório.
+
+Passos do caminho:
+    'chave'            desce para data['chave']
+    {'campo': valor}   em um dict, exige campo == valor (sem descer);
+                       em uma lista, seleciona o primeiro item que atende.
+                       Uma condição por passo: é compilada em uma busca
+                       em dict, sem percorrer as demais entradas
+
+Quando o mesmo campo aparece em mais de um caminho do relatório, vale a
+entrada que vem por último na tabela.
+"""
+
+import logging
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('printer_stats')
+
+def seconds_to_hours(value):
+    return float(value) / 3600.0
+
+# Campos de destino (argumentos de StatsManager.update_printer_stats)
+HOURS = 'hours'
+PRINTS = 'prints'
+POWER_ON_HOURS = 'power_on_hours'
+
+_GET_PRINT_STATS = {'command': 'get_print_stats'}
+_GET_VERSION = {'command': 'get_version'}
+_PRINTER_MODULE = {'name': 'printer'}
+_GET_PRINTER_INFO = {'command': 'get_printer_info'}
+
+STATS_TABLE = (
+    (('print', 'statistics', 'total_time'), seconds_to_hours, HOURS),
+    (('print', 'statistics', 'total_prints'), int, PRINTS),
+    (('print', _GET_PRINT_STATS, 'stats', 'total_hours'), float, HOURS),
+    (('print', _GET_PRINT_STATS, 'stats', 'total_jobs'), int, PRINTS),
+    (('info', _GET_VERSION, 'module', _PRINTER_MODULE, 'statistics', 'print_time'), float, HOURS),
+    (('info', _GET_VERSION, 'module', _PRINTER_MODULE, 'statistics', 'print_count'), int, PRINTS),
+    (('info', _GET_VERSION, 'module', _PRINTER_MODULE, 'statistics', 'power_on_time'), float, POWER_ON_HOURS),
+    (('system', _GET_PRINTER_INFO, 'printer', 'total_usage', 'print_hours'), float, HOURS),
+    (('system', _GET_PRINTER_INFO, 'printer', 'total_usage', 'job_count'), int, PRINTS),
+    (('system', _GET_PRINTER_INFO, 'printer', 'total_usage', 'power_on_hours'), float, POWER_ON_HOURS),
+    (('pushing', 'print_stats', 'accumulated_time'), seconds_to_hours, HOURS),
+    (('pushing', 'print_stats', 'total_jobs'), int, PRINTS),
+)
+
+class _Node:
+    """Nó da tabela compilada"""
+
+    __slots__ = ('children', 'filters', 'targets')
+
+    def __init__(self):
+        self.children = {}  # {chave: _Node}
+        self.filters = {}   # {campo: {valor: _Node}}
+        self.targets = []   # [(ordem, conversão, campo)]
+
+def compile_table(table):
+    """
+    Compila uma tabela de extração
+
+    Args:
+        table (iterable): Entradas (caminho, conversão, campo)
+
+    Returns:
+        _Node: Raiz da árvore usada por extract_stats
+
+    Raises:
+        ValueError: Se um caminho for vazio ou tiver um passo inválido
+    """
+    root = _Node()
+    for order, (path, convert, field) in enumerate(table):
+        if not path:
+            raise ValueError(f"Caminho vazio para o campo {field}")
+        node = root
+        for step in path:
+            if isinstance(step, str):
+                node = node.children.setdefault(step, _Node())
+            elif isinstance(step, dict) and len(step) == 1:
+                (key, expected), = step.items()
+                node = node.filters.setdefault(key, {}).setdefault(expected, _Node())
+            else:
+                raise ValueError(f"Passo inválido no caminho {path}: {step!r}")
+        node.targets.append((order, convert, field))
+    return root
+
+def _walk(node, value, found):
+    for order, convert, field in node.targets:
+        previous = found.get(field)
+        if previous is not None and previous[0] > order:
+            continue
+        try:
+            found[field] = (order, convert(value))
+        except (TypeError, ValueError):
+            logger.warning(f"Valor inválido para {field}: {value!r}")
+
+    if node.filters:
+        for key, branches in node.filters.items():
+            if isinstance(value, dict):
+                try:
+                    child = branches.get(value.get(key))
+                except TypeError:  # valor não hashable (lista, dict)
+                    continue
+                if child is not None:
+                    _walk(child, value, found)
+            elif isinstance(value, list):
+                matched = set()
+                for item in value:
+                    if not isinstance(item, dict):
+                        continue
+                    selector = item.get(key)
+                    try:
+                        child = branches.get(selector)
+                    except TypeError:
+                        continue
+                    if child is not None and selector not in matched:
+                        matched.add(selector)
+                        _walk(child, item, found)
+
+    if node.children and isinstance(value, dict):
+        # Percorre o lado menor: as chaves da tabela ou as do relatório
+        if len(node.children) <= len(value):
+            for key, child in node.children.items():
+                if key in value:
+                    _walk(child, value[key], found)
+        else:
+            for key, item in value.items():
+                child = node.children.get(key)
+                if child is not None:
+                    _walk(child, item, found)
+
+_COMPILED_TABLE = compile_table(STATS_TABLE)
+
+def extract_stats(data, table=None):
+    """
+    Extrai as estatísticas presentes em um relatório
+
+    Args:
+        data (dict): Relatório decodificado
+        table (_Node, optional): Tabela compilada (padrão: STATS_TABLE)
+
+    Returns:
+        dict: {campo: valor} apenas com os campos encontrados (vazio na maioria dos relatórios)
+    """
+    found = {}
+    _walk(table or _COMPILED_TABLE, data, found)
+    if not found:
+        return found
+    return {field: value for field, (_, value) in found.items()}
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from async_engine import get_engine
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('reconnect_supervisor')
+
+# Espera (segundos) antes da primeira nova tentativa e limite do backoff
+MIN_RECONNECT_DELAY = 1.0
+MAX_RECONNECT_DELAY = 60.0
+
+# Fração aleatória descontada de cada espera (evita reconexões sincronizadas)
+RECONNECT_JITTER = 0.5
+
+# Conexões que duram menos que isso não zeram o backoff (link instável)
+STABLE_CONNECTION_SECONDS = 30.0
+
+class ReconnectSupervisor:
+    """
+    Mantém um cliente paho conectado.
+
+    Uma thread própria executa o loop de rede do cliente; quando a conexão
+    cai (ou uma tentativa falha), a próxima tentativa espera um intervalo que
+    dobra a cada falha consecutiva até MAX_RECONNECT_DELAY, com jitter. O
+    backoff só volta ao mínimo depois de uma conexão estável, para que um
+    Wi-Fi instável não vire um loop de reconexões.
+
+    O dono do cliente informa as mudanças de estado chamando
+    connection_established() no on_connect (rc == 0) e connection_lost() no
+    on_disconnect.
+
+    Com o motor asyncio ativo (async_engine), a conexão é mantida por uma
+    corrotina no event loop compartilhado em vez da thread própria; o backoff
+    e as métricas são os mesmos.
+    """
+
+    def __init__(self, name, client, min_delay=MIN_RECONNECT_DELAY, max_delay=MAX_RECONNECT_DELAY,
+                 jitter=RECONNECT_JITTER):
+        """
+        Args:
+            name (str): Nome usado nos logs, na thread e nas métricas
+            client (mqtt.Client): Cliente já configurado (callbacks, TLS, autenticação)
+            min_delay (float, optional): Espera mínima entre tentativas (segundos)
+            max_delay (float, optional): Espera máxima entre tentativas (segundos)
+            jitter (float, optional): Fração máxima descontada aleatoriamente de cada espera
+        """
+        self.name = name
+        self.client = client
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.thread = None
+        self._engine = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+        self._failures = 0
+        self._connected_since = None
+        self._disconnected_at = None
+        self._next_attempt_at = None
+        self._attempts = 0
+        self._connects = 0
+        self._disconnects = 0
+        self._last_rc = None
+        self._uptime_total = 0.0
+        self._reconnect_count = 0
+        self._reconnect_total = 0.0
+        self._reconnect_last = None
+        self._reconnect_max = 0.0
+
+    def start(self, host, port, keepalive=60):
+        """
+        Inicia a thread de conexão (retorna imediatamente)
+
+        Args:
+            host (str): Endereço do broker
+            port (int): Porta do broker
+            keepalive (int, optional): Keepalive MQTT em segundos
+        """
+        if self.thread and self.thread.is_alive():
+            return
+        self._stop.clear()
+        self._engine = get_engine()
+        if self._engine is not None:
+            self._engine.supervise(self, host, port, keepalive)
+            return
+        # Só guarda os parâmetros; as tentativas usam reconnect()
+        self.client.connect_async(host, port, keepalive)
+        self.connection_pending()
+        self.thread = threading.Thread(target=self._run, name=f"{self.name}-mqtt")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        """Desconecta e encerra a thread"""
+        self._stop.set()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        if self._engine is not None:
+            self._engine.unsupervise(self)
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    @property
+    def stopped(self):
+        """True depois de stop()"""
+        return self._stop.is_set()
+
+    @property
+    def last_rc(self):
+        """Código de retorno da última desconexão"""
+        return self._last_rc
+
+    def connection_pending(self):
+        """Marca o início da espera pela primeira conexão"""
+        with self._lock:
+            self._disconnected_at = time.monotonic()
+
+    def attempt_started(self):
+        """Conta uma tentativa de conexão"""
+        with self._lock:
+            self._attempts += 1
+
+    def backoff(self):
+        """
+        Calcula a espera até a próxima tentativa e a registra nas métricas
+
+        Returns:
+            float: Segundos até a próxima tentativa
+        """
+        with self._lock:
+            delay = self._next_delay()
+            self._next_attempt_at = time.monotonic() + delay
+        logger.info(f"[{self.name}] Nova tentativa de conexão em {delay:.1f} s")
+        return delay
+
+    def connection_established(self):
+        """Deve ser chamado pelo on_connect do cliente quando rc == 0"""
+        now = time.monotonic()
+        with self._lock:
+            self._connects += 1
+            self._connected_since = now
+            self._next_attempt_at = None
+            if self._disconnected_at is not None and self._connects > 1:
+                elapsed = now - self._disconnected_at
+                self._reconnect_count += 1
+                self._reconnect_total += elapsed
+                self._reconnect_last = elapsed
+                self._reconnect_max = max(self._reconnect_max, elapsed)
+                logger.info(f"[{self.name}] Reconectado após {elapsed:.1f} s")
+            self._disconnected_at = None
+
+    def connection_lost(self, rc=None):
+        """Deve ser chamado pelo on_disconnect do cliente"""
+        now = time.monotonic()
+        with self._lock:
+            self._last_rc = rc
+            if self._connected_since is None:
+                return
+            uptime = now - self._connected_since
+            self._uptime_total += uptime
+            self._connected_since = None
+            self._disconnected_at = now
+            self._disconnects += 1
+            if uptime >= STABLE_CONNECTION_SECONDS:
+                self._failures = 0
+
+    def _next_delay(self):
+        """Espera até a próxima tentativa: exponencial, limitada e com jitter (requer o lock)"""
+        base = min(self.max_delay, self.min_delay * (2 ** min(self._failures, 16)))
+        self._failures += 1
+        return base * (1 - self.jitter * random.random())
+
+    def _run(self):
+        """Thread: conecta, processa a rede até a conexão cair e espera o backoff"""
+        while not self._stop.is_set():
+            self.attempt_started()
+            try:
+                self.client.reconnect()
+            except Exception as e:
+                # Impressora desligada, Wi-Fi fora, DNS/TLS...
+                logger.warning(f"[{self.name}] Falha ao conectar: {str(e)}")
+            else:
+                while not self._stop.is_set():
+                    if self.client.loop(timeout=1.0) != mqtt.MQTT_ERR_SUCCESS:
+                        break
+                if self._stop.is_set():
+                    break
+                # Socket fechado sem passar pelo on_disconnect (ex: CONNACK recusado)
+                self.connection_lost(self._last_rc)
+
+            self._stop.wait(self.backoff())
+
+    def stats(self):
+        """
+        Returns:
+            dict: Estado, uptime, contadores de tentativas/reconexões e tempo até reconectar
+        """
+        now = time.monotonic()
+        with self._lock:
+            uptime = now - self._connected_since if self._connected_since is not None else None
+            return {
+                'connected': self._connected_since is not None,
+                'uptime_seconds': round(uptime, 1) if uptime is not None else None,
+                'downtime_seconds': round(now - self._disconnected_at, 1) if self._disconnected_at is not None else None,
+                'total_uptime_seconds': round(self._uptime_total + (uptime or 0), 1),
+                'connect_attempts': self._attempts,
+                'connects': self._connects,
+                'disconnects': self._disconnects,
+                'last_disconnect_rc': self._last_rc,
+                'consecutive_failures': self._failures,
+                'next_attempt_in': round(max(0.0, self._next_attempt_at - now), 1) if self._next_attempt_at else None,
+                'time_to_reconnect': {
+                    'count': self._reconnect_count,
+                    'last': round(self._reconnect_last, 1) if self._reconnect_last is not None else None,
+                    'avg': round(self._reconnect_total / self._reconnect_count, 1) if self._reconnect_count else None,
+                    'max': round(self._reconnect_max, 1),
+                },
+            }
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from datetime import datetime
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('sensor_cache')
+
+# Número de caixas de filamento monitoradas pelo ESP32 (ESP32_Box1 a ESP32_Box4)
+BOX_COUNT = 4
+
+# Métricas mantidas para cada caixa
+METRICS = ('temperature', 'humidity', 'remaining_g')
+
+class SensorCache:
+    """
+    Cache em memória da leitura mais recente de cada métrica de cada caixa do ESP32.
+
+    Atualizado pelo MQTTClient a cada mensagem e lido pelo /status, evitando
+    consultas ao banco de dados a cada requisição.
+    """
+
+    def __init__(self):
+        """Inicializa o cache vazio"""
+        self._lock = threading.Lock()
+        self._readings = {}  # {box_number: {metric: valor}}
+        self._updated_at = {}  # {box_number: datetime}
+        self.loaded = False
+
+    def update(self, box_number, **metrics):
+        """
+        Atualiza as métricas de uma caixa; valores None são ignorados
+
+        Args:
+            box_number (int): Número da caixa (base 1)
+            **metrics: Métricas a atualizar (temperature, humidity, remaining_g)
+
+        Returns:
+            bool: True se algum valor mudou
+        """
+        changed = False
+        with self._lock:
+            readings = self._readings.setdefault(box_number, {})
+            for metric, value in metrics.items():
+                if value is None:
+                    continue
+                if readings.get(metric) != value:
+                    readings[metric] = value
+                    changed = True
+            self._updated_at[box_number] = datetime.now()
+        return changed
+
+    def get(self, box_number):
+        """
+        Retorna as leituras mais recentes de uma caixa
+
+        Args:
+            box_number (int): Número da caixa (base 1)
+
+        Returns:
+            dict: Cópia das métricas conhecidas (pode estar vazio)
+        """
+        with self._lock:
+            return dict(self._readings.get(box_number, {}))
+
+    def get_all(self):
+        """
+        Retorna as leituras mais recentes de todas as caixas
+
+        Returns:
+            dict: {box_number: {metric: valor}}
+        """
+        with self._lock:
+            return {box: dict(readings) for box, readings in self._readings.items() if readings}
+
+    def load_from_db(self):
+        """
+        Reconstrói o cache a partir do banco de dados. Chamado uma vez na inicialização.
+
+        Returns:
+            bool: True se carregado com sucesso
+        """
+        from db_manager import SensorManager
+
+        try:
+            for box_number in range(1, BOX_COUNT + 1):
+                source = f"ESP32_Box{box_number}"
+                latest = {}
+                # Percorre as leituras mais recentes até encontrar um valor para cada métrica
+                for data in SensorManager.get_recent_sensor_data(source=source, limit=5):
+                    if data.temperature is not None:
+                        latest.setdefault('temperature', data.temperature)
+                    if data.humidity is not None:
+                        latest.setdefault('humidity', data.humidity)
+                    if data.ams_filament_remaining is not None:
+                        latest.setdefault('remaining_g', data.ams_filament_remaining)
+                    if len(latest) == len(METRICS):
+                        break
+                if latest:
+                    self.update(box_number, **latest)
+
+            self.loaded = True
+            logger.info(f"Cache de sensores carregado do banco de dados: {len(self.get_all())} caixas")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao carregar cache de sensores: {str(e)}")
+            return False
+
+# Cache global compartilhado
+sensor_cache = SensorCache()
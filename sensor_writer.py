@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import atexit
+import collections
+import logging
+import threading
+import time
+from datetime import datetime
+
+from background_tasks import db_executor
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('sensor_writer')
+
+# Leituras acumuladas que disparam a gravação imediata de um lote
+BATCH_SIZE = 50
+
+# Tempo máximo (segundos) que uma leitura espera no buffer
+FLUSH_INTERVAL = 30
+
+# Máximo de leituras no buffer; quando cheio, a mais antiga é descartada
+QUEUE_SIZE = 1000
+
+class SensorDataWriter:
+    """
+    Buffer de escrita (write-behind) das leituras dos sensores do ESP32.
+
+    Cada métrica recebida vira uma linha de SensorData, mas gravar cada uma
+    em uma transação própria significa dezenas de commits (e fsyncs no cartão
+    SD) a cada ciclo do ESP32. As linhas são acumuladas aqui e gravadas em
+    lote, em uma única transação, quando chegam a batch_size ou quando a mais
+    antiga espera flush_interval. A gravação roda no db_executor, junto com as
+    demais escritas no banco; flush() grava o que restou no encerramento.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL, max_size=QUEUE_SIZE):
+        """
+        Args:
+            batch_size (int, optional): Leituras que disparam a gravação
+            flush_interval (float, optional): Espera máxima (segundos) de uma leitura no buffer
+            max_size (int, optional): Capacidade do buffer
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._rows = collections.deque(maxlen=max_size)
+        self._ready = threading.Condition()
+        self._first_at = None  # Quando entrou a leitura mais antiga do buffer
+        self._worker = None
+        self._written = 0
+        self._batches = 0
+        self._dropped = 0
+        self._errors = 0
+
+    def add(self, source, temperature=None, humidity=None, ams_slot=None,
+            ams_filament_type=None, ams_filament_remaining=None):
+        """
+        Acumula uma leitura para gravação (mesmos argumentos de SensorManager.record_sensor_data)
+        """
+        row = {
+            'source': source,
+            'timestamp': datetime.utcnow(),
+            'temperature': temperature,
+            'humidity': humidity,
+            'ams_slot': ams_slot,
+            'ams_filament_type': ams_filament_type,
+            'ams_filament_remaining': ams_filament_remaining,
+        }
+        with self._ready:
+            if len(self._rows) == self._rows.maxlen:
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % 100 == 0:
+                    logger.warning(f"Buffer de leituras cheio: {self._dropped} leitura(s) descartada(s) até agora")
+            self._rows.append(row)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._flush_loop, name="sensor-writer")
+                self._worker.daemon = True
+                self._worker.start()
+            if len(self._rows) == 1 or len(self._rows) >= self.batch_size:
+                self._ready.notify()
+
+    def _take(self):
+        """Retira todas as leituras do buffer (requer o lock)"""
+        rows = list(self._rows)
+        self._rows.clear()
+        self._first_at = None
+        return rows
+
+    def _flush_loop(self):
+        """Thread que entrega os lotes ao db_executor quando um dos limites é atingido"""
+        while True:
+            with self._ready:
+                while True:
+                    if len(self._rows) >= self.batch_size:
+                        break
+                    if self._first_at is None:
+                        self._ready.wait()
+                        continue
+                    remaining = self._first_at + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._ready.wait(remaining)
+                rows = self._take()
+            if db_executor.submit(self._write, rows) is None:
+                # Executor já encerrado (fim do processo): grava aqui para não perder o lote
+                self._write(rows)
+
+    def _write(self, rows):
+        from db_manager import SensorManager
+
+        try:
+            written = SensorManager.record_sensor_batch(rows)
+        except Exception as e:
+            logger.error(f"Erro ao gravar lote de leituras de sensores: {str(e)}")
+            written = 0
+        with self._ready:
+            if written:
+                self._written += written
+                self._batches += 1
+            else:
+                # Lote perdido: conta o erro e as leituras descartadas
+                self._errors += 1
+                self._dropped += len(rows)
+        logger.debug(f"{written} leitura(s) de sensores gravada(s) em lote")
+        return written
+
+    def flush(self):
+        """
+        Grava imediatamente, na thread atual, as leituras pendentes
+
+        Returns:
+            int: Número de leituras gravadas
+        """
+        with self._ready:
+            rows = self._take()
+        if not rows:
+            return 0
+        return self._write(rows)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Leituras no buffer e contadores de gravadas, lotes, descartes e erros
+        """
+        with self._ready:
+            return {
+                'buffered': len(self._rows),
+                'written': self._written,
+                'batches': self._batches,
+                'dropped': self._dropped,
+                'errors': self._errors,
+            }
+
+# Buffer global compartilhado
+sensor_writer = SensorDataWriter()
+
+# Grava o que restou no buffer ao encerrar o processo
+atexit.register(sensor_writer.flush)
@@ -198,14 +198,47 @@ function updateSubscriptionOnServer(subscription) {
     });
 }
 
+// Versões anteriores registravam o service worker com escopo /static/js/.
+// Transfere a assinatura de push para o registro atual e remove o antigo.
+function migrateLegacyRegistration(currentReg) {
+    return navigator.serviceWorker.getRegistrations()
+    .then(registrations => {
+        const legacy = registrations.find(reg => reg !== currentReg && reg.scope.endsWith('/static/js/'));
+        if (!legacy) {
+            return;
+        }
+        return legacy.pushManager.getSubscription()
+        .then(subscription => {
+            if (!subscription || Notification.permission !== 'granted' || !applicationServerPublicKey) {
+                return;
+            }
+            return subscription.unsubscribe()
+            .then(() => currentReg.pushManager.subscribe({
+                userVisibleOnly: true,
+                applicationServerKey: urlB64ToUint8Array(applicationServerPublicKey)
+            }))
+            .then(newSubscription => updateSubscriptionOnServer(newSubscription));
+        })
+        .then(() => legacy.unregister())
+        .then(() => console.log('Registro antigo do Service Worker migrado.'));
+    })
+    .catch(error => {
+        console.error('Erro ao migrar registro antigo do Service Worker: ', error);
+    });
+}
+
 // Verifica suporte e registra o Service Worker
 if ('serviceWorker' in navigator && 'PushManager' in window) {
     console.log('Service Worker e Push são suportados');
 
-    navigator.serviceWorker.register('/static/js/service-worker.js')
+    // Escopo '/' para que o service worker também sirva os arquivos estáticos pré-carregados
+    navigator.serviceWorker.register('/static/js/service-worker.js', { scope: '/' })
     .then(swReg => {
         console.log('Service Worker registrado: ', swReg);
         swRegistration = swReg;
+        return migrateLegacyRegistration(swReg);
+    })
+    .then(() => {
         initializeUI(); // Inicializa a UI após registro do SW
     })
     .catch(error => {
@@ -484,19 +484,56 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         }
     }
+    // Último status recebido e sua versão, para pedir apenas as diferenças ao backend
+    let currentStatus = {};
+    let currentStatusVersion = null;
+
+    // Aplica operações no formato JSON Patch (add/remove) recebidas do backend
+    function applyStatusPatch(state, patch) {
+        patch.forEach(op => {
+            const keys = op.path.split('/').slice(1).map(k => k.replace(/~1/g, '/').replace(/~0/g, '~'));
+            let target = state;
+            for (let i = 0; i < keys.length - 1; i++) {
+                if (typeof target[keys[i]] !== 'object' || target[keys[i]] === null) {
+                    target[keys[i]] = {};
+                }
+                target = target[keys[i]];
+            }
+            const lastKey = keys[keys.length - 1];
+            if (op.op === 'remove') {
+                delete target[lastKey];
+            } else {
+                target[lastKey] = op.value;
+            }
+        });
+        return state;
+    }
+
     function fetchData() {
         // console.log("[DEBUG] fetchData chamada");
-        fetch("/status")
+        const url = currentStatusVersion === null ? "/status" : `/status?since=${currentStatusVersion}`;
+        fetch(url)
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
-                return response.json();
+                const version = response.headers.get('X-Status-Version');
+                return response.json().then(data => ({ data, version }));
             })
-            .then(data => {
+            .then(({ data, version }) => {
                  // console.log("[DEBUG] Dados recebidos de /status:", data);
-                if (Object.keys(data).length > 0) {
-                    updateUI(data);
+                if (currentStatusVersion !== null && data.patch) {
+                    applyStatusPatch(currentStatus, data.patch);
+                    currentStatusVersion = data.version;
+                } else if (currentStatusVersion !== null && data.status) {
+                    currentStatus = data.status;
+                    currentStatusVersion = data.version;
+                } else {
+                    currentStatus = data;
+                    currentStatusVersion = version !== null ? parseInt(version, 10) : null;
+                }
+                if (Object.keys(currentStatus).length > 0) {
+                    updateUI(currentStatus);
                 } else {
                      // console.log("[DEBUG] fetchData: Dados vazios recebidos, talvez inicializando...");
                     // Poderia mostrar um estado de "Aguardando dados" se necessário
@@ -514,6 +551,144 @@ document.addEventListener('DOMContentLoaded', () => {
                 // updateUI({}); // Chama com objeto vazio para limpar os campos
             });
     }
+    // Recebe o status via Server-Sent Events; volta ao polling se o navegador não suportar
+    // ou se o stream não puder ser estabelecido
+    let pollingInterval = null;
+    function startPolling() {
+        if (pollingInterval) return;
+        console.warn("Stream de status indisponível, usando polling a cada 3s.");
+        pollingInterval = setInterval(fetchData, 3000);
+    }
+    function applyFullStatus(status, version) {
+        currentStatus = status;
+        currentStatusVersion = version;
+        if (Object.keys(currentStatus).length > 0) {
+            updateUI(currentStatus);
+        }
+    }
+    function applyStatusDelta(delta) {
+        applyStatusPatch(currentStatus, delta.patch);
+        currentStatusVersion = delta.version;
+        if (Object.keys(currentStatus).length > 0) {
+            updateUI(currentStatus);
+        }
+    }
+    function startStatusStream() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+        // Com patch=1 o backend envia o status completo uma vez e depois só as diferenças
+        const source = new EventSource("/status/stream?patch=1");
+        source.addEventListener('status', event => {
+            try {
+                applyFullStatus(JSON.parse(event.data), parseInt(event.lastEventId, 10));
+            } catch (e) {
+                console.error('Erro ao processar evento de status:', e);
+            }
+        });
+        source.addEventListener('patch', event => {
+            try {
+                applyStatusDelta(JSON.parse(event.data));
+            } catch (e) {
+                console.error('Erro ao processar diferenças de status:', e);
+            }
+        });
+        source.onerror = () => {
+            // O EventSource reconecta sozinho; só desistimos se ele fechar de vez
+            if (source.readyState === EventSource.CLOSED) {
+                source.close();
+                startPolling();
+            }
+        };
+    }
+    // WebSocket único para status e comandos; sem ele, usa SSE + POST /command
+    let statusSocket = null;
+    let nextCommandId = 1;
+    const pendingCommands = {}; // {id: nome do comando}
+    function startStatusSocket() {
+        if (!window.WebSocket) {
+            startStatusStream();
+            return;
+        }
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws`);
+        let opened = false;
+        socket.onopen = () => {
+            opened = true;
+            statusSocket = socket;
+        };
+        socket.onmessage = event => {
+            let message;
+            try {
+                message = JSON.parse(event.data);
+            } catch (e) {
+                console.error('Erro ao processar mensagem do WebSocket:', e);
+                return;
+            }
+            const command = pendingCommands[message.id];
+            switch (message.type) {
+                case 'status':
+                    applyFullStatus(message.status, message.version);
+                    break;
+                case 'patch':
+                    applyStatusDelta(message);
+                    break;
+                case 'sent':
+                    if (message.queued) {
+                        showCommandStatus(command, `Impressora desconectada: comando ${command} na fila.`, 'var(--label-color)', false);
+                    } else {
+                        showCommandStatus(command, `Comando ${command} enviado, aguardando a impressora...`, 'var(--label-color)', false);
+                    }
+                    break;
+                case 'ack':
+                    delete pendingCommands[message.id];
+                    if (commandSucceeded(message)) {
+                        showCommandStatus(command, `Comando ${command} confirmado pela impressora.`, 'var(--success-color)', true);
+                    } else {
+                        showCommandStatus(command, `Falha ao enviar ${command}: ${message.reason || message.result}`, 'var(--error-text)', true);
+                    }
+                    break;
+                case 'timeout':
+                    delete pendingCommands[message.id];
+                    showCommandStatus(command, `Comando ${command} enviado, sem confirmação da impressora.`, 'var(--label-color)', true);
+                    break;
+                case 'error':
+                    delete pendingCommands[message.id];
+                    if (command) {
+                        showCommandStatus(command, `Falha ao enviar ${command}: ${message.error}`, 'var(--error-text)', true);
+                    } else {
+                        console.error('Erro no WebSocket:', message.error);
+                    }
+                    break;
+            }
+        };
+        socket.onclose = () => {
+            statusSocket = null;
+            // Servidor sem suporte a WebSocket ou conexão perdida: segue com SSE
+            console.warn(opened ? "WebSocket encerrado, usando stream SSE." : "WebSocket indisponível, usando stream SSE.");
+            startStatusStream();
+        };
+    }
+    // Mesma regra de command_tracker.is_success: "result" ausente ou "success" (gcode_line responde "SUCCESS")
+    function commandSucceeded(message) {
+        if (typeof message.success === 'boolean') return message.success;
+        return !message.result || String(message.result).toLowerCase() === 'success';
+    }
+    function showCommandStatus(command, text, color, clearLater) {
+        commandStatusDiv.textContent = text;
+        commandStatusDiv.style.color = color;
+        if (clearLater) {
+            // Limpa a mensagem após alguns segundos
+            setTimeout(() => {
+                if (commandStatusDiv.textContent === text) {
+                    commandStatusDiv.textContent = '';
+                }
+            }, 5000);
+        }
+    }
+    // Comandos em que o POST espera a confirmação da impressora (sem WebSocket)
+    const WAIT_FOR_ACK_COMMANDS = ['pause', 'resume', 'stop'];
     function sendCommand(payload) {
         // console.log("[DEBUG] sendCommand chamado com payload:", payload);
         if (!commandStatusDiv) { console.error("Div #command-status não encontrada!"); return; }
@@ -521,37 +696,54 @@ document.addEventListener('DOMContentLoaded', () => {
         commandStatusDiv.textContent = `Enviando comando ${payload.command}...`;
         commandStatusDiv.style.color = 'var(--label-color)'; // Reset color
 
+        if (statusSocket && statusSocket.readyState === WebSocket.OPEN) {
+            const id = nextCommandId++;
+            pendingCommands[id] = payload.command;
+            statusSocket.send(JSON.stringify(Object.assign({ type: 'command', id: id }, payload)));
+            return;
+        }
+
+        // wait: o servidor só responde depois que a impressora confirmar o comando. Só para
+        // pausar/retomar/parar; os demais (sliders, luzes, G-code) respondem ao entrar na fila
+        const wait = WAIT_FOR_ACK_COMMANDS.includes(payload.command);
+        if (wait) {
+            showCommandStatus(payload.command, `Comando ${payload.command} enviado, aguardando a impressora...`, 'var(--label-color)', false);
+        }
         fetch("/command", {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(payload)
+            body: JSON.stringify(Object.assign({ wait: wait }, payload))
         })
         .then(response => {
             if (!response.ok) {
-                // Tenta obter detalhes do erro do corpo da resposta JSON
-                 return response.json().then(errData => {
-                     throw new Error(errData.error || `Erro ${response.status}`);
-                 }).catch(() => {
-                      // Se o corpo não for JSON ou não tiver 'error', lança erro genérico
-                      throw new Error(`Erro HTTP ${response.status}`);
-                 });
+                // Usa o motivo enviado pelo servidor (ex: 504 com comando expirado ou sem resposta);
+                // a mensagem genérica fica só para um corpo que não é JSON
+                return response.json()
+                    .catch(() => ({}))
+                    .then(errData => {
+                        throw new Error(errData.error || `Erro HTTP ${response.status}`);
+                    });
             }
             return response.json();
         })
         .then(data => {
             // console.log("[DEBUG] Resposta do comando:", data);
-            if (data.success) {
-                commandStatusDiv.textContent = `Comando ${payload.command} enviado com sucesso.`;
+            if (data.success && !wait) {
+                commandStatusDiv.textContent = data.message || `Comando ${payload.command} enviado.`;
+                commandStatusDiv.style.color = 'var(--success-color)';
+            } else if (data.success) {
+                commandStatusDiv.textContent = `Comando ${payload.command} confirmado pela impressora.`;
                 commandStatusDiv.style.color = 'var(--success-color)';
             } else {
-                commandStatusDiv.textContent = `Falha ao enviar ${payload.command}: ${data.error || 'Erro desconhecido'}`;
+                commandStatusDiv.textContent = `Falha ao enviar ${payload.command}: ${data.error || data.reason || data.result || 'Erro desconhecido'}`;
                 commandStatusDiv.style.color = 'var(--error-text)';
             }
-            // Limpa a mensagem após alguns segundos
+            // Limpa a mensagem após alguns segundos, se nenhuma outra a substituiu
+            const shown = commandStatusDiv.textContent;
             setTimeout(() => {
-                if (commandStatusDiv.textContent.startsWith(`Comando ${payload.command}`) || commandStatusDiv.textContent.startsWith(`Falha ao enviar ${payload.command}`)) {
+                if (commandStatusDiv.textContent === shown) {
                     commandStatusDiv.textContent = '';
                 }
              }, 5000);
@@ -922,9 +1114,8 @@ document.addEventListener('DOMContentLoaded', () => {
     fetchMaintenanceData();
     // console.log("[DEBUG] fetchData inicial retornou (ou erro capturado).");
 
-    // console.log("[DEBUG] Configurando setInterval...");
-    setInterval(fetchData, 3000);
-    // console.log("[DEBUG] setInterval configurado.");
+    // console.log("[DEBUG] Iniciando stream de status...");
+    startStatusSocket();
 
-    // console.log("[DEBUG] Inicialização final concluída, fetchData agendado.");
+    // console.log("[DEBUG] Inicialização final concluída, stream de status iniciado.");
 });
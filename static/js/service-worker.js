@@ -1,5 +1,46 @@
 console.log('Service Worker Loaded');
 
+// Arquivos estáticos com hash no nome, injetados pelo backend (static_assets.py)
+const PRECACHE_URLS = self.PRECACHE_URLS || [];
+const CACHE_PREFIX = 'squidbu-static-';
+const CACHE_NAME = CACHE_PREFIX + (self.PRECACHE_VERSION || 'dev');
+
+self.addEventListener('install', event => {
+    // Pré-carrega os arquivos da versão atual
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    // Remove caches de versões anteriores
+    event.waitUntil(
+        caches.keys().then(keys => Promise.all(
+            keys.filter(key => key.startsWith(CACHE_PREFIX) && key !== CACHE_NAME)
+                .map(key => caches.delete(key))
+        )).then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    // Só os arquivos com hash: o conteúdo de uma URL nunca muda, então o cache é sempre válido
+    if (event.request.method !== 'GET' || url.origin !== self.location.origin || !url.pathname.startsWith('/static/dist/')) {
+        return;
+    }
+    event.respondWith(
+        caches.match(event.request).then(cached => cached || fetch(event.request).then(response => {
+            if (response.ok) {
+                const copy = response.clone();
+                caches.open(CACHE_NAME).then(cache => cache.put(event.request, copy));
+            }
+            return response;
+        }))
+    );
+});
+
 self.addEventListener('push', event => {
     console.log('[Service Worker] Push Received.');
     // Tenta obter os dados como JSON, caso contrário usa como texto
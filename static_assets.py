@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pipeline de arquivos estáticos: gera cópias com hash do conteúdo no nome
+(static/dist/), variantes pré-comprimidas (.gz e, se disponível, .br) e as
+serve com cache imutável de longa duração.
+
+Executado na inicialização do app (init_app) ou manualmente:
+    python static_assets.py
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+from flask import request, send_from_directory, abort
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('static_assets')
+
+# Arquivos (relativos a static/) processados pelo pipeline
+ASSETS = ('js/script.js', 'js/notifications.js', 'css/style.css')
+
+# Diretório (relativo a static/) com os arquivos gerados
+DIST_DIR = 'dist'
+
+# Script do service worker, servido pelo Flask com a lista de arquivos a pré-carregar
+SERVICE_WORKER = 'js/service-worker.js'
+
+# Um ano: os nomes mudam sempre que o conteúdo muda
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def _hashed_name(path, digest):
+    """js/script.js -> js/script.<hash>.js"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest[:12]}{ext}"
+
+def _write_if_missing(path, data):
+    """Escreve o arquivo apenas se ele ainda não existir (o nome já identifica o conteúdo)"""
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def build_assets(static_folder):
+    """
+    Gera as cópias com hash e as variantes comprimidas dos arquivos em ASSETS
+
+    Args:
+        static_folder (str): Caminho da pasta static/
+
+    Returns:
+        dict: Manifesto {arquivo original: arquivo gerado}, relativos a static/
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+    generated = set()
+
+    for asset in ASSETS:
+        source = os.path.join(static_folder, asset)
+        if not os.path.exists(source):
+            logger.warning(f"Arquivo estático não encontrado: {asset}")
+            continue
+
+        with open(source, 'rb') as f:
+            content = f.read()
+
+        hashed = _hashed_name(asset, hashlib.sha256(content).hexdigest())
+        target = os.path.join(dist_folder, hashed)
+        _write_if_missing(target, content)
+        # mtime=0 torna o .gz reproduzível
+        _write_if_missing(target + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        generated.update((target, target + '.gz'))
+        if BROTLI_AVAILABLE:
+            _write_if_missing(target + '.br', brotli.compress(content, quality=11))
+            generated.add(target + '.br')
+
+        manifest[asset] = f"{DIST_DIR}/{hashed}"
+
+    # Remove versões antigas que não são mais referenciadas
+    for root, _, files in os.walk(dist_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if path not in generated and name != 'manifest.json':
+                os.remove(path)
+
+    if manifest:
+        with open(os.path.join(dist_folder, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=4)
+    return manifest
+
+def init_app(app):
+    """
+    Gera os arquivos e integra o pipeline ao Flask:
+    - url_for('static', filename='js/script.js') passa a apontar para a cópia com hash
+    - /static/dist/... é servido pré-comprimido e com cache imutável
+    - o service worker recebe a lista de URLs a pré-carregar
+
+    Args:
+        app (Flask): Aplicação Flask
+
+    Returns:
+        dict: Manifesto gerado (vazio se a geração falhar)
+    """
+    try:
+        manifest = build_assets(app.static_folder)
+        logger.info(f"Arquivos estáticos gerados: {len(manifest)} (brotli: {BROTLI_AVAILABLE})")
+    except OSError as e:
+        # Sem permissão de escrita, por exemplo: segue servindo os arquivos originais
+        logger.error(f"Erro ao gerar arquivos estáticos: {str(e)}")
+        manifest = {}
+    app.extensions['static_assets'] = manifest
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    @app.route(f'/static/{DIST_DIR}/<path:filename>')
+    def static_dist(filename):
+        """Serve um arquivo gerado, usando a variante comprimida aceita pelo navegador"""
+        dist_folder = os.path.join(app.static_folder, DIST_DIR)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        encoding = None
+        if BROTLI_AVAILABLE and 'br' in request.accept_encodings:
+            encoding = 'br'
+        elif 'gzip' in request.accept_encodings:
+            encoding = 'gzip'
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+        if suffix and not os.path.exists(os.path.join(dist_folder, filename + suffix)):
+            encoding, suffix = None, ''
+
+        response = send_from_directory(dist_folder, filename + suffix, mimetype=mimetype, max_age=31536000)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    @app.route(f'/static/{SERVICE_WORKER}')
+    def service_worker():
+        """Serve o service worker com a lista de arquivos a pré-carregar"""
+        path = os.path.join(app.static_folder, SERVICE_WORKER)
+        if not os.path.exists(path):
+            abort(404)
+        with open(path, 'r', encoding='utf-8') as f:
+            script = f.read()
+
+        precache = sorted(f"/static/{hashed}" for hashed in manifest.values())
+        version = hashlib.sha256(''.join(precache).encode('utf-8')).hexdigest()[:12]
+        header = (f"self.PRECACHE_URLS = {json.dumps(precache)};\n"
+                  f"self.PRECACHE_VERSION = {json.dumps(version)};\n")
+        response = app.response_class(header + script, mimetype='application/javascript')
+        # O navegador deve sempre verificar se há uma nova versão do service worker
+        response.headers['Cache-Control'] = 'no-cache'
+        # Permite que o service worker controle todas as páginas (escopo '/')
+        response.headers['Service-Worker-Allowed'] = '/'
+        return response
+
+    return manifest
+
+if __name__ == '__main__':
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    for original, hashed in build_assets(static_folder).items():
+        print(f"{original} -> {hashed}")
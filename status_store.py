@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import functools
+import logging
+import threading
+import uuid
+
+import json_codec
+
+# Configuração do logger
+logging.basicConfig(level=logging.INFO,
+                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger('status_store')
+
+# Quantas versões de caminhos alterados são mantidas para responder a /status?since=N
+HISTORY_SIZE = 256
+
+# Quantos diffs serializados são mantidos por versão (clientes na mesma versão compartilham)
+DELTA_CACHE_SIZE = 16
+
+# Quantas projeções (?fields=) serializadas são mantidas por versão
+PROJECTION_CACHE_SIZE = 32
+
+# Limite de caminhos em um seletor de campos
+MAX_FIELDS = 64
+
+# Curinga aceito em um segmento do seletor de campos
+WILDCARD = '*'
+
+# Campos de controle de cada seção do relatório: o sequence_id muda a cada
+# push_status sem que nada visível mude, então não entram no status
+REPORT_BOOKKEEPING_KEYS = frozenset(('sequence_id', 'command', 'msg'))
+
+class FieldSelector:
+    """
+    Seletor de campos compilado a partir de "print.nozzle_temper,print.ams.ams.*.tray"
+    """
+
+    __slots__ = ('key', 'tree')
+
+    def __init__(self, key, tree):
+        """
+        Args:
+            key (str): Forma canônica do seletor (caminhos ordenados e sem repetição)
+            tree (dict): Árvore de segmentos; None em uma folha significa "valor inteiro"
+        """
+        self.key = key
+        self.tree = tree
+
+@functools.lru_cache(maxsize=128)
+def compile_fields(spec):
+    """
+    Compila um seletor de campos com caminhos separados por vírgula e segmentos
+    separados por ponto. '*' casa com qualquer chave de um objeto ou item de uma lista
+    e um número seleciona o item de uma lista pela posição.
+
+    Args:
+        spec (str): Seletor, ex: "print.mc_percent,print.ams.ams.*.tray.*.remain"
+
+    Returns:
+        FieldSelector: Seletor compilado (compartilhado, não deve ser alterado)
+
+    Raises:
+        ValueError: Se o seletor estiver vazio ou tiver caminhos inválidos
+    """
+    paths = set()
+    for field in spec.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        segments = tuple(field.split('.'))
+        if any(not segment for segment in segments):
+            raise ValueError(f"Caminho inválido: '{field}'")
+        paths.add(segments)
+
+    if not paths:
+        raise ValueError("Nenhum campo informado")
+    if len(paths) > MAX_FIELDS:
+        raise ValueError(f"Máximo de {MAX_FIELDS} campos por seletor")
+
+    tree = {}
+    # Caminhos mais curtos primeiro: um prefixo selecionado cobre os caminhos mais longos
+    for segments in sorted(paths, key=len):
+        node = tree
+        for segment in segments[:-1]:
+            node = node.setdefault(segment, {})
+            if node is None:
+                break
+        else:
+            node[segments[-1]] = None
+
+    key = ','.join(sorted('.'.join(segments) for segments in paths))
+    return FieldSelector(key, tree)
+
+class StatusSnapshot:
+    """
+    Fotografia imutável do status em uma versão, já serializada em JSON.
+
+    Nenhum campo é alterado depois de criado: uma nova versão sempre gera
+    uma nova fotografia, que substitui a anterior por troca de referência.
+    """
+
+    __slots__ = ('version', 'status', 'data', 'body', 'etag', 'history')
+
+    def __init__(self, version, status, data, body, etag, history):
+        """
+        Args:
+            version (int): Versão do status que originou a fotografia
+            status (dict): Status recebido da impressora (não deve ser alterado)
+            data (dict): Status enriquecido (não deve ser alterado)
+            body (bytes): Status enriquecido serializado em JSON
+            etag (str): ETag (sem aspas) que identifica esta versão
+            history (tuple): Últimos (versão, caminhos alterados) até esta versão
+        """
+        self.version = version
+        self.status = status
+        self.data = data
+        self.body = body
+        self.etag = etag
+        self.history = history
+
+class StatusStore:
+    """
+    Armazena o último status conhecido da impressora com versão monotônica.
+
+    O status é tratado como imutável (copy-on-write): cada mudança real monta
+    uma nova versão copiando apenas as seções alteradas, compartilhando o resto
+    com a versão anterior, e publica uma nova StatusSnapshot por troca atômica
+    de referência. Leitores nunca usam lock; apenas os escritores são
+    serializados entre si.
+
+    A serialização para JSON é feita uma vez por versão, no momento da
+    publicação, e reaproveitada por todos os leitores. Um histórico curto dos
+    caminhos alterados em cada versão permite enviar apenas as diferenças para
+    clientes que já conhecem uma versão anterior.
+    """
+
+    def __init__(self, enricher=None, history_size=HISTORY_SIZE):
+        """
+        Inicializa o armazenamento
+
+        Args:
+            enricher (callable, optional): Função que recebe o status (imutável)
+                e devolve o status enriquecido (ex: dados dos sensores ESP32),
+                sem alterar o dicionário recebido
+            history_size (int, optional): Número de versões mantidas no histórico
+        """
+        # Serializa apenas os escritores; leitores acessam self._current sem lock
+        self._write_lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._enricher = enricher
+        self._history_size = history_size
+        self._delta_cache = {}
+        self._projection_cache = {}
+        # Identifica esta execução para que ETags antigos não sejam aceitos após um reinício
+        self._boot_id = uuid.uuid4().hex[:8]
+        self._current = self._build(0, {}, ())
+
+    @property
+    def version(self):
+        """Versão atual do status"""
+        return self._current.version
+
+    def set_enricher(self, enricher):
+        """
+        Define a função usada para enriquecer o status antes de serializar
+
+        Args:
+            enricher (callable): Função que recebe o status e devolve um novo
+                dicionário enriquecido, sem alterar o recebido
+        """
+        self._enricher = enricher
+        self.invalidate(None)
+
+    def apply(self, data, include_scalars=False, full=False):
+        """
+        Mescla dados recebidos da impressora no status (ver deep_merge), sem
+        os campos de controle (REPORT_BOOKKEEPING_KEYS) de cada seção
+
+        Args:
+            data (dict): Dados recebidos da impressora
+            include_scalars (bool): Se True, também atualiza chaves de primeiro nível
+                que não são dicionários
+            full (bool): Se True, o relatório é completo (ver is_full_report) e
+                substitui as listas por id em vez de mesclá-las
+
+        Returns:
+            frozenset: Caminhos (tuplas de chaves/índices) realmente alterados;
+                vazio (falso) se nada mudou
+        """
+        data = {key: _strip_bookkeeping(value) for key, value in data.items()
+                if include_scalars or isinstance(value, dict)}
+
+        with self._write_lock:
+            changed_paths = set()
+            new_status = deep_merge(self._current.status, data, changed_paths, replace_lists=full)
+            if not changed_paths:
+                return frozenset()
+            changed_paths = frozenset(changed_paths)
+            self._publish(new_status, changed_paths)
+            return changed_paths
+
+    def invalidate(self, paths=None):
+        """
+        Gera uma nova versão sem alterar os dados da impressora.
+        Usado quando uma fonte externa do enriquecimento (ex: ESP32) mudou.
+
+        Args:
+            paths (iterable, optional): Caminhos (tuplas de chaves) afetados no status
+                enriquecido. None obriga os clientes a receber o status completo.
+        """
+        with self._write_lock:
+            self._publish(self._current.status, frozenset(paths) if paths is not None else None)
+
+    def _publish(self, status, paths):
+        """Monta e publica a próxima versão e acorda quem espera (requer o lock de escrita)"""
+        previous = self._current
+        version = previous.version + 1
+        history = (previous.history + ((version, paths),))[-self._history_size:]
+        # Troca atômica de referência: leitores veem a versão anterior ou a nova, nunca um estado parcial
+        self._current = self._build(version, status, history)
+        with self._changed:
+            self._changed.notify_all()
+
+    def _build(self, version, status, history):
+        """Enriquece e serializa o status de uma versão"""
+        data = status
+        if self._enricher:
+            try:
+                data = self._enricher(status)
+            except Exception as e:
+                logger.error(f"Erro ao enriquecer o status: {str(e)}")
+
+        body = json_codec.dumps(data)
+        return StatusSnapshot(version, status, data, body, f"{self._boot_id}-{version}", history)
+
+    def get(self, key, default=None):
+        """
+        Retorna uma seção do status
+
+        Args:
+            key (str): Seção do status (ex: 'print')
+            default: Valor retornado se a seção não existir
+
+        Returns:
+            A seção (compartilhada e imutável - não deve ser alterada) ou o valor padrão
+        """
+        return self._current.status.get(key, default)
+
+    def snapshot(self):
+        """
+        Retorna a fotografia serializada da versão atual
+
+        Returns:
+            StatusSnapshot: Fotografia da versão atual
+        """
+        return self._current
+
+    def project(self, selector):
+        """
+        Retorna apenas os campos escolhidos do status enriquecido, em JSON.
+        A projeção é calculada uma vez por versão e compartilhada entre os
+        clientes que pedem o mesmo seletor.
+
+        Args:
+            selector (FieldSelector): Seletor compilado por compile_fields()
+
+        Returns:
+            tuple: (fotografia de origem, projeção serializada em bytes)
+        """
+        snapshot = self._current
+        cached = self._projection_cache.get(selector.key)
+        if cached is not None and cached[0] == snapshot.version:
+            return snapshot, cached[1]
+
+        projected = _project(snapshot.data, selector.tree)
+        body = json_codec.dumps({} if projected is _MISSING else projected)
+
+        # Mesmo esquema do cache de diffs: apenas entradas da versão atual são mantidas
+        cache = {k: v for k, v in self._projection_cache.items() if v[0] == snapshot.version}
+        if len(cache) < PROJECTION_CACHE_SIZE:
+            cache[selector.key] = (snapshot.version, body)
+        self._projection_cache = cache
+        return snapshot, body
+
+    def delta(self, since):
+        """
+        Retorna as diferenças entre a versão informada e a atual, em JSON
+
+        O corpo tem o formato {"version": V, "since": N, "patch": [...]}, onde
+        "patch" segue o formato de operações do JSON Patch (add/remove).
+
+        Args:
+            since (int): Versão que o cliente já possui
+
+        Returns:
+            tuple: (versão, diff serializado em bytes), ou None se o histórico não
+                cobre a versão informada (o chamador deve enviar o status completo)
+        """
+        snapshot = self._current
+        key = (since, snapshot.version)
+        body = self._delta_cache.get(key)
+        if body is not None:
+            return snapshot.version, body
+
+        entries = [paths for version, paths in snapshot.history if version > since]
+
+        # O histórico precisa cobrir todas as versões de since+1 até a atual
+        if since > snapshot.version or len(entries) != snapshot.version - since:
+            return None
+        if any(paths is None for paths in entries):
+            return None
+
+        changed = set()
+        for paths in entries:
+            changed.update(paths)
+
+        patch = []
+        for path in _prune_paths(changed):
+            found, value = _lookup(snapshot.data, path)
+            if found:
+                patch.append({"op": "add", "path": _json_pointer(path), "value": value})
+            else:
+                patch.append({"op": "remove", "path": _json_pointer(path)})
+
+        body = json_codec.dumps({"version": snapshot.version, "since": since, "patch": patch})
+
+        # Mantém apenas diffs para a versão atual; versões antigas não serão mais pedidas
+        cache = {k: v for k, v in self._delta_cache.items() if k[1] == snapshot.version}
+        if len(cache) < DELTA_CACHE_SIZE:
+            cache[key] = body
+        self._delta_cache = cache
+        return snapshot.version, body
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Bloqueia até que a versão do status seja diferente da informada
+
+        Args:
+            version (int): Última versão conhecida pelo chamador
+            timeout (float, optional): Tempo máximo de espera em segundos
+
+        Returns:
+            int: Versão atual (igual à informada se o tempo esgotou)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._current.version != version, timeout)
+            return self._current.version
+
+def is_full_report(data):
+    """
+    True se o relatório traz o status completo da impressora: a resposta ao
+    pushall (msg == 0) em vez de um push_status incremental
+
+    Args:
+        data (dict): Relatório decodificado
+    """
+    print_data = data.get('print')
+    if not isinstance(print_data, dict):
+        return False
+    return print_data.get('command') == 'pushall' or print_data.get('msg') == 0
+
+def deep_merge(current, incoming, changed, path=(), replace_lists=False, prune=False):
+    """
+    Mescla recursivamente um relatório parcial da impressora sobre o valor atual.
+
+    - Dicionários são mesclados chave a chave, em qualquer profundidade.
+    - Listas de objetos com "id" (ex: print.ams.ams[*].tray[*]) são mescladas
+      item a item pelo id; itens ausentes no relatório são mantidos e ids
+      novos são acrescentados ao final. Um item recebido é a versão atual
+      daquele objeto: campos que ele não traz são removidos (ex: a bandeja
+      esvaziada chega apenas como {"id": "N"}).
+    - Com replace_lists (relatório completo), as listas por id são
+      substituídas: unidades AMS e bandejas que sumiram deixam o status.
+    - Qualquer outro valor (inclusive listas sem id) substitui o atual.
+
+    Nada é alterado no lugar (copy-on-write): o valor atual é devolvido
+    intacto se nada mudou, e apenas os containers no caminho de uma
+    alteração são copiados.
+
+    Args:
+        current: Valor atual (não é alterado)
+        incoming: Valor recebido
+        changed (set): Recebe os caminhos (tuplas de chaves/índices) alterados
+        path (tuple, optional): Caminho de current dentro do status
+        replace_lists (bool, optional): Substitui as listas por id em vez de mesclar
+        prune (bool, optional): Remove de current (dict) as chaves ausentes em incoming
+
+    Returns:
+        O valor mesclado
+    """
+    if isinstance(current, dict) and isinstance(incoming, dict):
+        result = None
+        for key, value in incoming.items():
+            if key in current:
+                merged = deep_merge(current[key], value, changed, path + (key,), replace_lists)
+                if merged is current[key]:
+                    continue
+            else:
+                merged = value
+                changed.add(path + (key,))
+            if result is None:
+                result = dict(current)
+            result[key] = merged
+        if prune:
+            for key in current:
+                if key not in incoming:
+                    if result is None:
+                        result = dict(current)
+                    del result[key]
+                    changed.add(path + (key,))
+        return current if result is None else result
+
+    if not replace_lists and isinstance(current, list) and _merges_by_id(current, incoming):
+        result = None
+        positions = {item['id']: index for index, item in enumerate(current)}
+        for item in incoming:
+            index = positions.get(item['id'])
+            if index is None:
+                if result is None:
+                    result = list(current)
+                positions[item['id']] = len(result)
+                changed.add(path + (len(result),))
+                result.append(item)
+                continue
+            base = current[index] if result is None else result[index]
+            merged = deep_merge(base, item, changed, path + (index,), prune=True)
+            if merged is not base:
+                if result is None:
+                    result = list(current)
+                result[index] = merged
+        return current if result is None else result
+
+    # 1 == 1.0 == True: compara também o tipo para não perder mudanças de representação
+    if type(current) is type(incoming) and current == incoming:
+        return current
+    changed.add(path)
+    return incoming
+
+def _strip_bookkeeping(section):
+    """Remove de uma seção do relatório os campos de REPORT_BOOKKEEPING_KEYS"""
+    if not isinstance(section, dict) or REPORT_BOOKKEEPING_KEYS.isdisjoint(section):
+        return section
+    return {key: value for key, value in section.items() if key not in REPORT_BOOKKEEPING_KEYS}
+
+def _merges_by_id(current, incoming):
+    """True se as duas listas podem ser mescladas item a item pelo campo "id" """
+    if not isinstance(incoming, list) or not incoming:
+        return False
+    return all(isinstance(item, dict) and 'id' in item for item in current) and \
+        all(isinstance(item, dict) and 'id' in item for item in incoming)
+
+# Marca um campo que não existe no status (diferente de um valor null)
+_MISSING = object()
+
+def _merge_trees(a, b):
+    """Combina duas árvores de seletor; uma folha (None) cobre qualquer subárvore"""
+    if a is None or b is None:
+        return None
+    merged = dict(a)
+    for key, subtree in b.items():
+        merged[key] = _merge_trees(merged[key], subtree) if key in merged else subtree
+    return merged
+
+def _project(value, tree):
+    """
+    Extrai de um valor os campos descritos pela árvore do seletor
+
+    Returns:
+        O valor projetado, ou _MISSING se nenhum campo selecionado existir
+    """
+    if tree is None:
+        return value
+
+    wildcard = tree.get(WILDCARD, _MISSING)
+
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            subtree = tree.get(key, _MISSING)
+            if wildcard is not _MISSING:
+                subtree = wildcard if subtree is _MISSING else _merge_trees(subtree, wildcard)
+            if subtree is _MISSING:
+                continue
+            projected = _project(item, subtree)
+            if projected is not _MISSING:
+                result[key] = projected
+        return result if result else _MISSING
+
+    if isinstance(value, list):
+        # Itens sem nenhum campo selecionado são omitidos da lista
+        result = []
+        for index, item in enumerate(value):
+            subtree = tree.get(str(index), _MISSING)
+            if wildcard is not _MISSING:
+                subtree = wildcard if subtree is _MISSING else _merge_trees(subtree, wildcard)
+            if subtree is _MISSING:
+                continue
+            projected = _project(item, subtree)
+            if projected is not _MISSING:
+                result.append(projected)
+        return result if result else _MISSING
+
+    return _MISSING
+
+def _prune_paths(paths):
+    """Remove caminhos cobertos por um prefixo também alterado"""
+    kept = []
+    for path in sorted(paths, key=len):
+        if not any(path[:len(prefix)] == prefix for prefix in kept):
+            kept.append(path)
+    return kept
+
+def _lookup(data, path):
+    """
+    Busca um valor no status a partir de um caminho de chaves/índices
+
+    Returns:
+        tuple: (encontrado, valor)
+    """
+    value = data
+    for key in path:
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and isinstance(key, int) and 0 <= key < len(value):
+            value = value[key]
+        else:
+            return False, None
+    return True, value
+
+def _json_pointer(path):
+    """Converte um caminho de chaves em um JSON Pointer (RFC 6901)"""
+    return ''.join('/' + str(key).replace('~', '~0').replace('/', '~1') for key in path)